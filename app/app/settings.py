@@ -42,10 +42,13 @@ INSTALLED_APPS = [
     'core',
     'user',
     'recipe',
+    'batch',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,6 +93,36 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASS'),
     }
 }
+
+REPLICA_HOSTS = [
+    host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host
+]
+# comma separated hosts of read replicas of the database
+DATABASE_REPLICAS = []
+for number, host in enumerate(REPLICA_HOSTS or [DATABASES['default']['HOST']]):
+    alias = 'replica' if number == 0 else f'replica{number + 1}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        TEST={'NAME': f"test_{DATABASES['default']['NAME']}_{alias}"},
+    )
+    if REPLICA_HOSTS:
+        DATABASE_REPLICAS.append(alias)
+# without replica hosts the replica alias points at the primary server
+# and isn't used for reads; the tests use it as a second database that
+# stands in for a replica which hasn't caught up yet
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+# reads of a user go to the primary for this long after they write
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+# seconds before a replica is checked again
+
+RECIPE_PARTITIONS = int(os.environ.get('RECIPE_PARTITIONS', 0))
+# when set, migrating hash partitions the recipe tables into this many
+# partitions, see core/partitioning.py
+RECIPE_PARTITION_BATCH_SIZE = 10000
+# rows copied per transaction while the tables are partitioned
+
 # the benefit of this is that we can easily change our configuration when we
 # run our app on different servers by simply changing them in the environment
 # variables and we don't have to make any changes to our source code in order to
@@ -152,5 +185,110 @@ STATIC_ROOT = '/vol/web/static'
 
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+# the local memory cache is per process, when running more than one
+# process set these to a shared cache such as memcached, otherwise the
+# replica pinning and the cached results are only seen by one process
+
 AUTH_USER_MODEL = 'core.User'
 # User is the name of the model
+
+SIGNED_TOKEN_ACCESS_LIFETIME = int(
+    os.environ.get('SIGNED_TOKEN_ACCESS_LIFETIME', 5 * 60)
+)
+SIGNED_TOKEN_REFRESH_LIFETIME = int(
+    os.environ.get('SIGNED_TOKEN_REFRESH_LIFETIME', 24 * 60 * 60)
+)
+# lifetimes in seconds of the signed access and refresh tokens
+SIGNED_TOKEN_DENY_LIST_SYNC_INTERVAL = 30
+# how often in seconds each process reloads the revoked tokens
+
+RECIPE_STREAM_CHUNK_SIZE = 500
+# number of recipes read from the database and serialized at a time
+# when the recipe list is streamed with ?stream=1
+
+RECIPE_EXPORT_CHUNK_SIZE = 2000
+# number of recipes read per chunk by the recipe export
+
+RECIPE_IMPORT_CHUNK_SIZE = 1000
+# number of rows validated and inserted per transaction by an import
+
+SIMILARITY_INDEX_CACHE_SIZE = 128
+# number of users whose similar recipe index each process keeps loaded
+
+RECIPE_BITMAP_INDEX = bool(int(os.environ.get('RECIPE_BITMAP_INDEX', 0)))
+# answer the ?tags= and ?ingredients= filters from in-process bitmaps
+RECIPE_BITMAP_INDEX_MEMORY = int(
+    os.environ.get('RECIPE_BITMAP_INDEX_MEMORY', 64 * 1024 * 1024)
+)
+# bytes of bitmaps each process keeps before dropping the least
+# recently used users
+
+MEAL_PLAN_TIME_BUDGET = 0.5
+# seconds the meal planner may search for before returning the best
+# plan it has found
+MEAL_PLAN_CANDIDATES = 300
+# number of the most promising recipes the planner chooses from
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+# seconds a computed shopping list is cached for, it's invalidated
+# sooner whenever the user changes a recipe
+
+RECIPE_PRICE_FACETS = (5, 10, 20, 50)
+RECIPE_TIME_FACETS = (15, 30, 60, 120)
+# boundaries of the price and time buckets the recipe list counts
+# with ?facets=1
+RECIPE_FACETS_CACHE_TIMEOUT = 60 * 60
+
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+# number of changes /api/recipe/changes/ returns per page, by default
+# and at most with ?limit=
+CHANGES_SETTLE_TIME = 2
+# seconds a change is held back before it's synced, so transactions
+# that were still committing can't slip in behind a client's cursor
+
+COMPRESSION_ENCODINGS = ('zstd', 'br', 'gzip')
+# the encodings responses are compressed with, most preferred first;
+# zstd and br are only used when the zstandard and brotli packages are
+# installed
+COMPRESSION_LEVELS = {
+    'zstd': int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3)),
+    'br': int(os.environ.get('COMPRESSION_BROTLI_LEVEL', 4)),
+    'gzip': int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+}
+COMPRESSION_MIN_SIZE = 1024
+# bytes, smaller bodies aren't worth the CPU or the extra header
+COMPRESSION_SKIP_TYPES = (
+    'image/', 'video/', 'audio/', 'application/gzip', 'application/zip',
+    'application/zstd',
+)
+# content types that are compressed already
+
+BATCH_MAX_REQUESTS = 20
+# number of requests a single /api/batch/ call may contain
+
+ADMIN_EXACT_COUNT_LIMIT = 10000
+# admin changelists estimated to have more rows than this show the
+# planner's estimate instead of counting them
+
+PURGE_BATCH_SIZE = 500
+# rows deleted per transaction when deleted recipes and accounts are
+# removed in the background
+
+JOB_POLL_INTERVAL = 1.0
+# seconds an idle worker waits before looking for jobs again
+JOB_RETRY_DELAY = 10
+JOB_RETRY_MAX_DELAY = 60 * 60
+# seconds before the first retry of a failed job, doubled for each
+# further attempt up to the maximum
+JOB_LOCK_TIMEOUT = 15 * 60
+# a job running for longer than this is assumed to have lost its worker
+# and is queued again
@@ -0,0 +1,36 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """One request of a batch"""
+    method = serializers.ChoiceField(
+        choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+    )
+    path = serializers.CharField(max_length=2000)
+    # the path and query string, e.g. /api/recipe/recipes/?tags=1
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        """Only allow the API, and no batches inside batches"""
+        if not value.startswith('/api/') or value.startswith('/api/batch/'):
+            raise serializers.ValidationError('Not an API path.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """A list of requests to run together"""
+    requests = serializers.ListField(
+        child=SubRequestSerializer(), min_length=1
+    )
+    atomic = serializers.BooleanField(default=False)
+    # run the requests in one transaction that is rolled back as soon
+    # as one of them fails
+
+    def validate_requests(self, value):
+        """Limit the size of a batch"""
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'At most {settings.BATCH_MAX_REQUESTS} requests.'
+            )
+        return value
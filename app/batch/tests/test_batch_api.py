@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.routers import pin_key
+from user import tokens
+
+
+BATCH_URL = reverse('batch:batch')
+
+
+class PublicBatchApiTests(TestCase):
+    """Test the batch API without a login"""
+
+    def test_login_required(self):
+        """Test the batch itself has to be authenticated"""
+        res = APIClient().post(BATCH_URL, {'requests': [
+            {'method': 'GET', 'path': '/api/recipe/tags/'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BatchApiTests(TestCase):
+    """Test running several requests in one batch"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass',
+            name='Test'
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Bearer ' + tokens.make_token(self.user.pk)
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def batch(self, *requests, **options):
+        return self.client.post(
+            BATCH_URL, {'requests': list(requests), **options},
+            format='json'
+        )
+
+    def test_home_screen(self):
+        """Test reads from several endpoints come back together"""
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/user/me/'},
+            {'method': 'GET', 'path': '/api/recipe/tags/'},
+            {'method': 'GET', 'path': '/api/recipe/recipes/?fields=id'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        me, tags, recipes = res.data['responses']
+        self.assertEqual(me['status'], 200)
+        self.assertEqual(me['body']['email'], 'test@londonappdev.com')
+        self.assertEqual(tags['body'][0]['name'], 'Vegan')
+        self.assertEqual(recipes['body'], [])
+
+    def test_user_loaded_once(self):
+        """Test the requests share the user of the batch"""
+        with self.assertNumQueries(1):
+            self.batch(
+                {'method': 'GET', 'path': '/api/user/me/'},
+                {'method': 'GET', 'path': '/api/user/me/'},
+            )
+
+    def test_errors_per_request(self):
+        """Test a failing request doesn't stop the others"""
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/recipe/recipes/999/'},
+            {'method': 'GET', 'path': '/api/nowhere/'},
+            {'method': 'POST', 'path': '/api/recipe/tags/',
+             'body': {'name': 'Quick'}},
+        )
+
+        statuses = [item['status'] for item in res.data['responses']]
+        self.assertEqual(statuses, [404, 404, 201])
+        self.assertTrue(Tag.objects.filter(name='Quick').exists())
+
+    def test_atomic_rolled_back(self):
+        """Test an atomic batch keeps nothing when one request fails"""
+        res = self.batch(
+            {'method': 'POST', 'path': '/api/recipe/tags/',
+             'body': {'name': 'Quick'}},
+            {'method': 'POST', 'path': '/api/recipe/recipes/',
+             'body': {'title': 'No price'}},
+            {'method': 'POST', 'path': '/api/recipe/tags/',
+             'body': {'name': 'Never'}},
+            atomic=True
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(res.data['committed'])
+        self.assertEqual(
+            [item['status'] for item in res.data['responses']], [201, 400]
+        )
+        self.assertFalse(Tag.objects.filter(name='Quick').exists())
+        self.assertEqual(Recipe.objects.count(), 0)
+
+    def test_atomic_committed(self):
+        """Test an atomic batch keeps everything when all succeed"""
+        res = self.batch(
+            {'method': 'POST', 'path': '/api/recipe/tags/',
+             'body': {'name': 'Quick'}},
+            {'method': 'POST', 'path': '/api/recipe/recipes/',
+             'body': {'title': 'Toast', 'time_minutes': 2,
+                      'price': '1.00', 'tags': [], 'ingredients': []}},
+            atomic=True
+        )
+
+        self.assertTrue(res.data['committed'])
+        self.assertEqual(Recipe.objects.get().title, 'Toast')
+
+    def test_reads_dont_pin_to_primary(self):
+        """Test only a batch that writes pins the user to the primary"""
+        cache.delete(pin_key(self.user.pk))
+        self.batch({'method': 'GET', 'path': '/api/recipe/tags/'})
+
+        self.assertIsNone(cache.get(pin_key(self.user.pk)))
+
+        self.batch({'method': 'POST', 'path': '/api/recipe/tags/',
+                    'body': {'name': 'Quick'}})
+
+        self.assertTrue(cache.get(pin_key(self.user.pk)))
+
+    def test_no_nested_batches(self):
+        """Test a batch can't contain a batch or leave the API"""
+        res = self.batch(
+            {'method': 'POST', 'path': '/api/batch/', 'body': {}},
+            {'method': 'GET', 'path': '/admin/'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_streams_rejected(self):
+        """Test streamed responses are refused instead of buffered"""
+        res = self.batch(
+            {'method': 'GET', 'path': '/api/recipe/recipes/?stream=1'},
+        )
+
+        self.assertEqual(res.data['responses'][0]['status'], 400)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'batch'
+
+urlpatterns = [
+    path('', views.BatchView.as_view(), name='batch'),
+]
@@ -0,0 +1,149 @@
+import io
+import json
+import logging
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import routers
+from user.authentication import SignedTokenAuthentication
+
+from .serializers import BatchSerializer
+
+# Runs several API requests in one round trip. The requests are
+# dispatched straight to their views in this process: the batch is
+# authenticated once and its user is handed to every request, and they
+# all share the thread's database connection.
+
+logger = logging.getLogger(__name__)
+
+SKIPPED_HEADERS = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'QUERY_STRING',
+                   'HTTP_AUTHORIZATION', 'wsgi.input')
+
+
+class RollBack(Exception):
+    """Raised to roll back an atomic batch"""
+
+
+def make_request(request, method, path, body):
+    """Build the Django request of one request of the batch"""
+    url = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if key not in SKIPPED_HEADERS
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+    })
+    return WSGIRequest(environ)
+
+
+def response_body(response):
+    """Return the content of a response as data"""
+    if hasattr(response, 'data'):
+        return response.data
+        # a DRF response, its data is rendered with the batch
+    if not response.content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset)
+
+
+class BatchView(APIView):
+    """Run a list of API requests and return all of their responses"""
+    authentication_classes = (SignedTokenAuthentication, TokenAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def get_user(self):
+        """Return the full user to run the requests as"""
+        if isinstance(self.request.successful_authenticator,
+                      SignedTokenAuthentication):
+            return get_user_model().objects.get(pk=self.request.user.pk)
+            # signed tokens only carry the user id, the views that need
+            # the whole user would each load it otherwise
+        return self.request.user
+
+    def dispatch_one(self, user, item, route):
+        """Run one request of the batch and return its result"""
+        sub_request = make_request(
+            self.request._request, item['method'], item['path'],
+            item.get('body')
+        )
+        sub_request._force_auth_user = user
+        sub_request._force_auth_token = self.request.auth
+        # DRF uses these instead of authenticating the request again
+        try:
+            match = resolve(sub_request.path_info)
+        except Resolver404:
+            return {'status': status.HTTP_404_NOT_FOUND, 'body': None}
+
+        if route:
+            routers.start_request(sub_request)
+            # reads of GET requests can go to a replica again
+        try:
+            response = match.func(sub_request, *match.args, **match.kwargs)
+        except Exception:
+            logger.exception('Batched request to %s failed', item['path'])
+            return {
+                'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                'body': None,
+            }
+        finally:
+            if route:
+                routers.start_request(self.request._request)
+
+        if response.streaming:
+            return {
+                'status': status.HTTP_400_BAD_REQUEST,
+                'body': {'detail': 'Streamed responses can\'t be batched.'},
+            }
+        return {
+            'status': response.status_code,
+            'body': response_body(response),
+        }
+
+    def post(self, request):
+        """Run the requests in order"""
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['requests']
+        atomic = serializer.validated_data['atomic']
+        user = self.get_user()
+        writes = [item['method'] != 'GET' for item in items]
+        request._request.pin_to_primary = any(writes)
+        # only pin the user to the primary if something was written
+
+        results = []
+        try:
+            with transaction.atomic() if atomic else nullcontext():
+                for item, write in zip(items, writes):
+                    result = self.dispatch_one(user, item, route=not atomic)
+                    results.append(result)
+                    if atomic and result['status'] >= 400:
+                        raise RollBack
+                    if write and result['status'] < 400:
+                        routers.pin_to_primary(user.pk)
+                        # later reads in the batch see the write
+        except RollBack:
+            return Response(
+                {'responses': results, 'committed': False},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({'responses': results, 'committed': True})
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # connect the signal handlers once the models are loaded
+        from . import signals  # noqa: F401
+        autodiscover_modules('jobs')
+        # registers the job functions in the jobs.py of every app, so
+        # they can be queued from anywhere
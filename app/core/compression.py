@@ -0,0 +1,122 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content encodings the compression middleware can use. gzip is always
+# there, brotli and zstd only when their packages are installed. Each
+# one is a class with the same small interface, so a whole body and a
+# stream are compressed the same way.
+
+
+class GzipEncoder:
+    """gzip from the standard library"""
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(
+            level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+        # 16 + MAX_WBITS makes zlib write the gzip header and trailer
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    """Brotli, smaller than gzip at about the same speed"""
+    name = 'br'
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    """Zstandard, much faster than gzip for a similar size"""
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+ENCODERS = {'gzip': GzipEncoder}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS['zstd'] = ZstdEncoder
+
+
+def accepted_encodings(header):
+    """Return {encoding: q} of an Accept-Encoding header"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def choose_encoding(header, preferred):
+    """Return the name of the encoding to use, or None
+
+    preferred lists the encodings in the order we'd like to use them,
+    the client's q values win over that order.
+    """
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for name in preferred:
+        if name not in ENCODERS:
+            continue
+        quality = accepted.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress(encoding, level, data):
+    """Compress a whole body"""
+    encoder = ENCODERS[encoding](level)
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_stream(encoding, level, chunks):
+    """Compress a stream of byte chunks on the fly"""
+    encoder = ENCODERS[encoding](level)
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+            # the encoders hold back small chunks until they have
+            # enough for a block, so this doesn't send tiny pieces
+    yield encoder.finish()
@@ -0,0 +1,183 @@
+import random
+import traceback
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from core.models import Job
+
+# A small job queue that only needs the database.
+#
+# Jobs are rows in core_job. Workers claim the oldest due job with
+# SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can poll the
+# table at once without waiting on each other or running a job twice.
+# A job is enqueued in the caller's transaction, so it only exists once
+# the change that needed it has committed.
+#
+# Job functions are registered with @job('name') in a jobs.py module of
+# any app, run_workers imports those. A failed job is retried later with
+# an exponential backoff until it runs out of attempts. A kind can be
+# limited to a number of jobs running at once, workers check the limit
+# while holding a transaction level advisory lock on the kind so two of
+# them can't both take the last slot.
+
+registry = {}
+# kind -> JobType
+
+
+class JobType:
+    """A registered job function and how it's run"""
+
+    def __init__(self, kind, func, concurrency=None, max_attempts=5):
+        self.kind = kind
+        self.func = func
+        self.concurrency = concurrency
+        # how many of these may run at once across all workers, None
+        # for no limit
+        self.max_attempts = max_attempts
+
+
+def job(kind, concurrency=None, max_attempts=5):
+    """Register the decorated function as a job of the given kind"""
+    def register(func):
+        registry[kind] = JobType(kind, func, concurrency, max_attempts)
+        return func
+    return register
+
+
+def enqueue(kind, run_at=None, **payload):
+    """Queue a job, it's run by a worker after the transaction commits"""
+    if kind not in registry:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(
+        kind=kind, payload=payload,
+        run_at=run_at or timezone.now(),
+        max_attempts=registry[kind].max_attempts,
+    )
+
+
+def lock_id(kind):
+    """Return the advisory lock key of a job kind"""
+    return zlib.crc32(f'core.job:{kind}'.encode())
+    # stable across processes, unlike hash()
+
+
+def available_kinds(kinds):
+    """Return the kinds that may start another job right now
+
+    Takes the advisory locks of the limited kinds, they're held until the
+    surrounding transaction ends.
+    """
+    limited = sorted(
+        kind for kind in kinds if registry[kind].concurrency is not None
+    )
+    if not limited:
+        return list(kinds)
+    with connection.cursor() as cursor:
+        for kind in limited:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s)', [lock_id(kind)]
+            )
+            # always in the same order, so workers can't deadlock
+    running = dict(
+        Job.objects.filter(
+            status=Job.RUNNING, kind__in=limited
+        ).values('kind').annotate(count=Count('id')).values_list(
+            'kind', 'count'
+        ).order_by()
+    )
+    return [
+        kind for kind in kinds
+        if registry[kind].concurrency is None or
+        running.get(kind, 0) < registry[kind].concurrency
+    ]
+
+
+def claim(worker, kinds=None):
+    """Mark the oldest due job as running for the worker and return it,
+    or None if there's nothing to do"""
+    kinds = [kind for kind in kinds or registry if kind in registry]
+    with transaction.atomic():
+        kinds = available_kinds(kinds)
+        if not kinds:
+            return None
+        found = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.PENDING, kind__in=kinds, run_at__lte=timezone.now()
+        ).order_by('run_at').first()
+        # rows other workers are claiming right now are skipped instead
+        # of waited for
+        if found is None:
+            return None
+        found.status = Job.RUNNING
+        found.locked_by = worker
+        found.locked_at = timezone.now()
+        found.attempts += 1
+        found.save(update_fields=[
+            'status', 'locked_by', 'locked_at', 'attempts'
+        ])
+    return found
+
+
+def backoff(attempts):
+    """Return how long to wait before the next attempt"""
+    delay = min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+    # the jitter spreads out jobs that all failed for the same reason
+
+
+def run(found):
+    """Run a claimed job and record how it went"""
+    job_type = registry.get(found.kind)
+    try:
+        if job_type is None:
+            raise LookupError(f'Unknown job kind: {found.kind}')
+        job_type.func(**found.payload)
+    except Exception:
+        found.last_error = traceback.format_exc()
+        if found.attempts < found.max_attempts:
+            found.status = Job.PENDING
+            found.run_at = timezone.now() + backoff(found.attempts)
+        else:
+            found.status = Job.FAILED
+            found.finished = timezone.now()
+    else:
+        found.status = Job.DONE
+        found.finished = timezone.now()
+    Job.objects.filter(
+        pk=found.pk, status=Job.RUNNING, locked_by=found.locked_by
+    ).update(
+        status=found.status, run_at=found.run_at, finished=found.finished,
+        last_error=found.last_error, locked_by='', locked_at=None
+    )
+    # a job that ran for so long that it was given to another worker is
+    # left to that worker
+    return found.status
+
+
+def release_stale():
+    """Put jobs whose worker disappeared back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_by='', locked_at=None,
+        last_error='The worker running the job was lost.',
+        finished=timezone.now()
+    )
+    # the lost run counts as an attempt, so a job that keeps killing its
+    # worker still ends up failed
+    return stale.update(status=Job.PENDING, locked_by='', locked_at=None)
+
+
+def run_next(worker, kinds=None):
+    """Claim and run one job, return its status or None if there was none"""
+    found = claim(worker, kinds)
+    if found is None:
+        return None
+    return run(found)
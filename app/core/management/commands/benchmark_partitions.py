@@ -0,0 +1,180 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Compares the plain and the hash partitioned layout of the recipe tables
+# on scratch copies, so it can be run against any Postgres database
+# without touching the real tables. Both layouts get the same data and
+# the same indexes.
+
+LAYOUTS = ('plain', 'partitioned')
+
+
+class Command(BaseCommand):
+    """Django command to benchmark partitioned recipe tables"""
+    help = 'Benchmark hash partitioned against plain recipe tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes-per-user', type=int, default=200)
+        parser.add_argument('--tags-per-recipe', type=int, default=4)
+        parser.add_argument('--partitions', type=int, default=16)
+        parser.add_argument(
+            '--queries', type=int, default=500,
+            help='Number of times each query is timed'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning needs a Postgres database.')
+        random.seed(0)
+
+        with connection.cursor() as cursor:
+            try:
+                for layout in LAYOUTS:
+                    self.create_tables(cursor, layout, options)
+                results = {
+                    layout: self.run_queries(cursor, layout, options)
+                    for layout in LAYOUTS
+                }
+            finally:
+                for layout in LAYOUTS:
+                    cursor.execute(
+                        f'DROP TABLE IF EXISTS bench_{layout}_recipe, '
+                        f'bench_{layout}_recipe_tags'
+                    )
+
+        self.stdout.write(
+            f'{options["users"]} users, '
+            f'{options["recipes_per_user"]} recipes each, '
+            f'{options["partitions"]} partitions'
+        )
+        self.stdout.write(f'{"":<28}{"plain":>12}{"partitioned":>14}')
+        for name in results['plain']:
+            plain = results['plain'][name]
+            partitioned = results['partitioned'][name]
+            self.stdout.write(
+                f'{name:<28}{plain:>10.3f}ms{partitioned:>12.3f}ms'
+            )
+
+    def create_tables(self, cursor, layout, options):
+        """Create and fill the scratch tables of a layout"""
+        recipe = f'bench_{layout}_recipe'
+        tags = f'bench_{layout}_recipe_tags'
+        partitioned = layout == 'partitioned'
+        cursor.execute(
+            f'CREATE TABLE {recipe} (id bigint NOT NULL, '
+            f'user_id integer NOT NULL, title varchar(255) NOT NULL, '
+            f'time_minutes integer NOT NULL, price numeric(5, 2) NOT NULL)'
+            + (' PARTITION BY HASH (user_id)' if partitioned else '')
+        )
+        cursor.execute(
+            f'CREATE TABLE {tags} (id bigint NOT NULL, '
+            f'recipe_id bigint NOT NULL, tag_id integer NOT NULL)'
+            + (' PARTITION BY HASH (recipe_id)' if partitioned else '')
+        )
+        if partitioned:
+            partitions = options['partitions']
+            for table in (recipe, tags):
+                for remainder in range(partitions):
+                    cursor.execute(
+                        f'CREATE TABLE {table}_p{remainder} PARTITION OF '
+                        f'{table} FOR VALUES WITH (MODULUS {partitions}, '
+                        f'REMAINDER {remainder})'
+                    )
+
+        per_user = options['recipes_per_user']
+        cursor.execute(
+            f'INSERT INTO {recipe} SELECT n, (n - 1) / %s + 1, '
+            f"'Recipe ' || n, mod(n, 120), mod(n, 500) / 10.0 "
+            f'FROM generate_series(1, %s) n',
+            [per_user, options['users'] * per_user]
+        )
+        # recipes are spread over the users in id order, like a table
+        # that grew over time
+        cursor.execute(
+            f'INSERT INTO {tags} SELECT row_number() OVER (), r.id, '
+            f'mod(r.id * 7 + t, 50) + 1 FROM {recipe} r, '
+            f'generate_series(1, %s) t',
+            [options['tags_per_recipe']]
+        )
+        cursor.execute(
+            f'ALTER TABLE {recipe} ADD PRIMARY KEY (id, user_id)'
+        )
+        cursor.execute(f'CREATE INDEX ON {recipe} (user_id, id)')
+        cursor.execute(
+            f'ALTER TABLE {tags} ADD PRIMARY KEY (id, recipe_id)'
+        )
+        cursor.execute(f'ALTER TABLE {tags} ADD UNIQUE (recipe_id, tag_id)')
+        cursor.execute(f'CREATE INDEX ON {tags} (tag_id)')
+        cursor.execute(f'ANALYZE {recipe}')
+        cursor.execute(f'ANALYZE {tags}')
+
+    def time_query(self, cursor, sql, params_list):
+        """Return the mean time in ms of running the query"""
+        start = time.perf_counter()
+        for params in params_list:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        return (time.perf_counter() - start) * 1000 / len(params_list)
+
+    def run_queries(self, cursor, layout, options):
+        """Time the queries the API runs against a layout"""
+        recipe = f'bench_{layout}_recipe'
+        tags = f'bench_{layout}_recipe_tags'
+        users = [
+            [random.randint(1, options['users'])]
+            for _ in range(options['queries'])
+        ]
+        per_user = options['recipes_per_user']
+        results = {}
+
+        results['list a user\'s recipes'] = self.time_query(
+            cursor,
+            f'SELECT * FROM {recipe} WHERE user_id = %s '
+            f'ORDER BY id DESC LIMIT 50',
+            users
+        )
+        results['get a recipe'] = self.time_query(
+            cursor,
+            f'SELECT * FROM {recipe} WHERE user_id = %s AND id = %s',
+            [[user, (user - 1) * per_user + 1] for user, in users]
+        )
+        results['prefetch tags of a page'] = self.time_query(
+            cursor,
+            f'SELECT * FROM {tags} WHERE recipe_id = ANY(%s)',
+            [
+                [list(range((user - 1) * per_user + 1,
+                            (user - 1) * per_user + 51))]
+                for user, in users
+            ]
+        )
+        results['count a user\'s recipes'] = self.time_query(
+            cursor,
+            f'SELECT count(*) FROM {recipe} WHERE user_id = %s',
+            users
+        )
+
+        cursor.execute(
+            f'SELECT tableoid::regclass FROM {recipe} WHERE user_id = %s '
+            f'LIMIT 1', [users[0][0]]
+        )
+        table = cursor.fetchone()[0]
+        # autovacuum works on single partitions, so only the one holding
+        # the user's rows needs vacuuming afterwards
+        start = time.perf_counter()
+        cursor.execute(
+            f'DELETE FROM {recipe} WHERE user_id = %s', [users[0][0]]
+        )
+        cursor.execute(f'VACUUM {table}')
+        # VACUUM can't run in a transaction, Django runs in autocommit
+        results['delete a user and vacuum'] = (
+            time.perf_counter() - start
+        ) * 1000
+
+        return results
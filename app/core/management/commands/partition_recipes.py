@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.models import Recipe
+from core.partitioning import partition_recipe_tables, \
+    supports_partitioning
+
+
+class Command(BaseCommand):
+    """Django command to hash partition the recipe tables"""
+    help = 'Convert the recipe tables to hash partitioned tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--partitions', type=int, default=settings.RECIPE_PARTITIONS or 8,
+            help='Number of partitions for each table'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.RECIPE_PARTITION_BATCH_SIZE,
+            help='Number of rows to copy per transaction'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        connection = connections[options['database']]
+        if not supports_partitioning(connection):
+            raise CommandError(
+                'Partitioning needs a Postgres 11 or later database.'
+            )
+
+        tables = partition_recipe_tables(
+            connection, Recipe, options['partitions'], options['batch_size'],
+            stdout=self.stdout
+        )
+        if not tables:
+            self.stdout.write('The recipe tables are already partitioned.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Partitioned {", ".join(tables)}!'
+        ))
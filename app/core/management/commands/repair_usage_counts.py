@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Tag, Ingredient, Recipe
+
+
+def recount_usage(model, through, pks):
+    """Recompute the usage count of the given objects from the database"""
+    field_name = model._meta.model_name
+    # the column in the through table that points at the model
+    counts = through.objects.filter(
+        **{field_name: OuterRef('pk')}
+    ).order_by().values(field_name).annotate(
+        count=Count('pk')
+    ).values('count')
+    # correlated subquery counting the rows for each object, so the
+    # whole batch is recomputed with a single UPDATE statement
+    usage_count = Coalesce(Subquery(counts), 0)
+    return model.objects.filter(pk__in=pks).exclude(
+        usage_count=usage_count
+    ).update(usage_count=usage_count, updated_at=timezone.now())
+    # only the wrong counts are written, so only those objects show up
+    # as changed to syncing clients
+
+
+class Command(BaseCommand):
+    """Django command to recompute the tag and ingredient usage counts"""
+    help = 'Recompute Tag and Ingredient usage counts in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of objects to recount per transaction'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        batch_size = options['batch_size']
+        targets = (
+            (Tag, Recipe.tags.through),
+            (Ingredient, Recipe.ingredients.through),
+        )
+
+        for model, through in targets:
+            last_pk = 0
+            total = 0
+            while True:
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                # walk the table in primary key order so every batch
+                # is a cheap index range and is committed on its own
+                if not pks:
+                    break
+                with transaction.atomic():
+                    total += recount_usage(model, through, pks)
+                last_pk = pks[-1]
+
+            self.stdout.write(
+                f'Repaired {total} {model._meta.verbose_name_plural}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Usage counts repaired!'))
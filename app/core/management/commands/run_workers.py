@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import jobs
+
+# Runs the queued jobs. Each process runs a number of worker threads and
+# every thread has its own database connection, so they claim and run
+# jobs independently of each other. SIGTERM or Ctrl-C lets the running
+# jobs finish and then stops.
+
+
+def work(name, kinds, poll_interval, burst, stop):
+    """Run jobs until told to stop, or in burst mode until none are due"""
+    last_release = 0
+    try:
+        while not stop.is_set():
+            if jobs.run_next(name, kinds) is not None:
+                continue
+            if burst:
+                return
+            if (time.monotonic() - last_release >
+                    settings.JOB_LOCK_TIMEOUT / 10):
+                jobs.release_stale()
+                last_release = time.monotonic()
+            stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+        # the connections of this thread
+
+
+def run_threads(threads, kinds, poll_interval, burst):
+    """Run the worker threads of one process"""
+    stop = threading.Event()
+    handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            handlers[signum] = signal.signal(
+                signum, lambda signum, frame: stop.set()
+            )
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    workers = [
+        threading.Thread(
+            target=work, name=f'{prefix}:{number}',
+            args=(f'{prefix}:{number}', kinds, poll_interval, burst, stop)
+        )
+        for number in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+class Command(BaseCommand):
+    """Django command to run the queued background jobs"""
+    help = 'Run background jobs from the job table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Number of worker threads in each process'
+        )
+        parser.add_argument(
+            '--kinds', nargs='+',
+            help='Only run jobs of these kinds'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOB_POLL_INTERVAL
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once there are no jobs due'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        kinds = options['kinds']
+        unknown = set(kinds or ()) - set(jobs.registry)
+        if unknown:
+            raise CommandError(
+                'Unknown job kinds: {}'.format(', '.join(sorted(unknown)))
+            )
+        worker_args = (
+            options['threads'], kinds, options['poll_interval'],
+            options['burst']
+        )
+
+        if options['processes'] <= 1:
+            run_threads(*worker_args)
+            return
+
+        connections.close_all()
+        # forked processes mustn't share the parent's connections
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_threads, args=worker_args)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+                # SIGTERM, each of them finishes its running jobs
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, stop)
+        for process in processes:
+            process.join()
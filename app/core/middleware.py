@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.db import OperationalError
+from django.utils.cache import patch_vary_headers
+
+from . import compression, routers
+
+
+class ReplicaMiddleware:
+    """Let the replica router see the request that is being handled"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request()
+
+        if getattr(request, 'pin_to_primary',
+                   request.method not in routers.SAFE_METHODS):
+            # views can say whether they wrote, e.g. a batch of reads is
+            # still a POST
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                routers.pin_to_primary(user.pk)
+                # DRF sets the user on the request when it authenticates
+        return response
+
+    def process_exception(self, request, exception):
+        """Stop using a replica that failed during the request"""
+        replica = routers.current_replica()
+        if replica and isinstance(exception, OperationalError):
+            routers.health.mark_unhealthy(replica)
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts
+
+    The encodings are tried in the order of COMPRESSION_ENCODINGS with
+    the levels from COMPRESSION_LEVELS. Bodies smaller than
+    COMPRESSION_MIN_SIZE and types that are compressed already, like
+    images, are sent as they are. Streamed responses are compressed
+    chunk by chunk as they are sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.should_compress(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # caches must not hand a compressed body to other clients
+        encoding = compression.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            settings.COMPRESSION_ENCODINGS
+        )
+        if encoding is None:
+            return response
+        level = settings.COMPRESSION_LEVELS[encoding]
+
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                encoding, level, response.streaming_content
+            )
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressed = compression.compress(
+                encoding, level, response.content
+            )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+            # the body isn't byte for byte the same as the ETag says
+        response['Content-Encoding'] = encoding
+        return response
+
+    def should_compress(self, response):
+        """Return whether the response is worth compressing"""
+        if response.has_header('Content-Encoding'):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0]
+        return not any(
+            content_type.startswith(prefix)
+            for prefix in settings.COMPRESSION_SKIP_TYPES
+        )
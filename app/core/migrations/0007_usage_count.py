@@ -0,0 +1,48 @@
+# Generated by Django 3.0.14 on 2026-10-19 10:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_usage(apps, schema_editor):
+    """Fill in the usage counts for the existing tags and ingredients"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for field_name in ('tag', 'ingredient'):
+        model = apps.get_model('core', field_name)
+        through = Recipe._meta.get_field(field_name + 's').remote_field.through
+        counts = through.objects.filter(
+            **{field_name: OuterRef('pk')}
+        ).order_by().values(field_name).annotate(
+            count=Count('pk')
+        ).values('count')
+        model.objects.update(usage_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='usage_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-usage_count', 'name'], name='core_ingr_user_usage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-usage_count', 'name'], name='core_tag_user_usage_idx'),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
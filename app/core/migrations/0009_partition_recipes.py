@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_recipes(apps, schema_editor):
+    """Hash partition the recipe tables when RECIPE_PARTITIONS is set"""
+    from core.partitioning import partition_recipe_tables, \
+        supports_partitioning
+    connection = schema_editor.connection
+    if not settings.RECIPE_PARTITIONS or \
+            not supports_partitioning(connection):
+        return
+        # before Postgres 11 the tables stay unpartitioned, run the
+        # partition_recipes command after upgrading
+    partition_recipe_tables(
+        connection, apps.get_model('core', 'Recipe'),
+        settings.RECIPE_PARTITIONS, settings.RECIPE_PARTITION_BATCH_SIZE
+    )
+    # the model as it is at this migration, not as it is today
+
+
+class Migration(migrations.Migration):
+    atomic = False
+    # the rows are copied in batches that are each committed on their own
+
+    dependencies = [
+        ('core', '0008_recipeimport'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_recipes, migrations.RunPython.noop),
+    ]
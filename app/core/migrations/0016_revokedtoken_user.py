@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revokedtoken',
+            name='user_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='revokedtoken',
+            name='jti',
+            field=models.BigIntegerField(null=True, unique=True),
+        ),
+    ]
@@ -3,9 +3,11 @@ import uuid
 import os
 # use the OS dot path to create a valid path for our file destination
 from django.db import models
+from django.contrib.postgres.fields import JSONField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
 # recommended way to retrieve
 # different settings from the Django settings file
 
@@ -87,6 +89,33 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
     # foreign key to our user object.
+    usage_count = models.IntegerField(default=0)
+    # number of recipes the tag is assigned to, kept up to date by
+    # the signals in core/signals.py so we never have to count the
+    # recipe_tags table to sort by popularity
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # also moved forward when the usage count changes, see
+    # core/signals.py, so syncing clients get the new count
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-usage_count', 'name'],
+                name='core_tag_user_usage_idx'
+            ),
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='core_tag_user_updated_idx'
+            ),
+            models.Index(
+                fields=['name'], name='core_tag_name_like_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
+        # "top N tags" for a user is then just the start of the index,
+        # and so are the tags changed since a sync. The pattern index
+        # answers the prefix searches of the admin
 
     def __str__(self):
         return self.name
@@ -99,11 +128,38 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    usage_count = models.IntegerField(default=0)
+    # number of recipes using the ingredient, see Tag.usage_count
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-usage_count', 'name'],
+                name='core_ingr_user_usage_idx'
+            ),
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='core_ingr_user_updated_idx'
+            ),
+            models.Index(
+                fields=['name'], name='core_ingr_name_like_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeManager(models.Manager):
+    """Manager of the recipes that haven't been deleted"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     """Recipe object"""
     user = models.ForeignKey(
@@ -132,6 +188,213 @@ class Recipe(models.Model):
 
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 # allow the field to be null so the image is optional
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # also moved forward when the tags or ingredients of the recipe
+    # change, see core/signals.py
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # set when the recipe is deleted, the row itself is removed later on
+    # by a background job, see core/purge.py
+
+    objects = RecipeManager()
+    # the default manager, so deleted recipes are left out everywhere
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='core_recipe_user_time_idx'
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='core_recipe_user_price_idx'
+            ),
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='core_recipe_user_updated_idx'
+            ),
+            models.Index(
+                fields=['title'], name='core_recipe_title_like_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
+        # a user's recipes in time or price order, or within a range of
+        # either, and the ones changed since a sync are read from the
+        # index without sorting. The pattern index answers the title
+        # prefix searches of the admin
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_user_id = instance.__dict__.get('user_id')
+        # the owner the row has in the database, None if it was deferred
+        return instance
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        # with the recipe table partitioned on user_id, filter updates on
+        # the user as well as the id so only one partition is hit. That
+        # has to be the user the row has now, the recipe may be moving
+        # to another one
+        saved_user_id = getattr(self, '_saved_user_id', None)
+        if settings.RECIPE_PARTITIONS and saved_user_id is not None:
+            base_qs = base_qs.filter(user_id=saved_user_id)
+        updated = super()._do_update(base_qs, *args, **kwargs)
+        if updated:
+            self._saved_user_id = self.user_id
+        return updated
+
+
+class RevokedToken(models.Model):
+    """Signed auth token that was revoked before it expired
+
+    A row with a user_id instead of a jti revokes every token of that
+    user that expires by expires_at, which is every token made before
+    the row was.
+    """
+    jti = models.BigIntegerField(unique=True, null=True)
+    # the random id that is embedded in the signed token
+    user_id = models.IntegerField(null=True)
+    # not a foreign key, the row has to outlive a user that is deleted
+    expires_at = models.DateTimeField(db_index=True)
+    # once the token has expired it is rejected anyway so the row
+    # is only needed until then
+
+    def __str__(self):
+        if self.jti is None:
+            return f'user {self.user_id}'
+        return str(self.jti)
+
+
+class Tombstone(models.Model):
+    """Record of a deleted recipe, tag or ingredient
+
+    Lets syncing clients find out what was deleted since they last
+    synced, see recipe/changes.py.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        related_name='+'
+    )
+    # deleting a user deletes their recipes, which write tombstones
+    # after the user's existing ones would have been collected, so
+    # they're all removed by a signal once the user is gone instead
+    model = models.CharField(max_length=20)
+    # model name of the deleted object, e.g. 'recipe'
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'deleted_at', 'id'],
+                name='core_tomb_user_deleted_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class RecipeImport(models.Model):
+    """Bulk import of recipes, with a checkpoint so it can be resumed"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    source = models.CharField(max_length=255)
+    # name of the imported file, only there to help the user
+    format = models.CharField(max_length=10)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    rows_done = models.IntegerField(default=0)
+    # checkpoint: the number of input rows that have been committed,
+    # a resumed import skips this many rows of the input
+    recipes_created = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    errors = JSONField(default=list)
+    # the first few invalid rows with their validation errors
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source} ({self.status})'
+
+
+class RecipeSignature(models.Model):
+    """MinHash signature of the tags and ingredients of a recipe"""
+    recipe_id = models.IntegerField(primary_key=True)
+    # not a foreign key, so it keeps working when core_recipe is
+    # partitioned; the row is deleted together with the recipe
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    signature = models.BinaryField()
+    # the hash values packed as uint32, see recipe/similarity.py
+
+
+class Job(models.Model):
+    """Deferred piece of work, run by the run_workers command"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=100)
+    # name the job function was registered under, see core/jobs.py
+    payload = JSONField(default=dict)
+    # keyword arguments the function is called with
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    run_at = models.DateTimeField(default=timezone.now)
+    # not picked up before this, pushed back after each failed attempt
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    # the worker running the job and since when, a job that has been
+    # running for too long is assumed to have lost its worker
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['run_at'], name='core_job_pending_idx',
+                condition=models.Q(status='pending')
+            ),
+            models.Index(
+                fields=['kind'], name='core_job_running_idx',
+                condition=models.Q(status='running')
+            ),
+        ]
+        # partial indexes, so they only hold the few jobs that are
+        # waiting or running however many finished ones pile up
+
+    def __str__(self):
+        return f'{self.kind} ({self.status})'
@@ -0,0 +1,227 @@
+import re
+
+from django.db import NotSupportedError, transaction
+
+# Opt-in hash partitioning of the recipe tables on Postgres.
+#
+# core_recipe is partitioned on user_id, which every recipe query in the
+# API filters on, so each of them only touches one partition. The tag
+# and ingredient through tables don't have a user_id column and Django
+# writes their rows without one, so they are partitioned on recipe_id
+# instead, which is what every read and write of them filters on.
+#
+# Postgres needs the partition key in every unique constraint, so the
+# primary keys become (id, user_id) and (id, recipe_id), and the through
+# tables lose their database level foreign key to core_recipe (nothing
+# is lost, Django deletes the through rows itself when a recipe is
+# deleted). The ids still come from the same sequences, so they stay
+# unique on their own.
+#
+# The existing rows are copied over in batches that are committed one
+# at a time, and the tables are swapped in a final short transaction
+# that copies whatever was inserted in the meantime. Rows that are
+# updated while the batches are copied aren't picked up again, so stop
+# writes to recipes while this runs.
+#
+# Hash partitioning and primary keys on partitioned tables need Postgres
+# 11, on older versions the tables are left as they are.
+
+INDEX_DEFINITION = re.compile(r'CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ')
+# the start of an index definition in pg_indexes, up to USING
+
+
+def supports_partitioning(connection):
+    """Return whether the database can hash partition the recipe tables"""
+    return connection.vendor == 'postgresql' and \
+        connection.pg_version >= 110000
+
+
+def get_tables(recipe_model):
+    """Return (table, partition key, unique columns, foreign keys)"""
+    tables = [(
+        recipe_model._meta.db_table, 'user_id', [],
+        [('user_id', 'core_user')],
+    )]
+    for field_name in ('tags', 'ingredients'):
+        field = recipe_model._meta.get_field(field_name)
+        through = field.remote_field.through
+        target = field.related_model
+        column = target._meta.model_name + '_id'
+        tables.append((
+            through._meta.db_table, 'recipe_id', ['recipe_id', column],
+            [(column, target._meta.db_table)],
+        ))
+    return tables
+
+
+def is_partitioned(connection, table):
+    """Return whether the table is already partitioned"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE relname = %s "
+            "AND relnamespace = 'public'::regnamespace",
+            [table]
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def create_partitioned_table(cursor, table, key, partitions):
+    """Create an empty hash partitioned copy of the table"""
+    new = f'{table}_partitioned'
+    cursor.execute(
+        f'CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS) '
+        f'PARTITION BY HASH ({key})'
+    )
+    # LIKE keeps the columns in the same order, so rows can be copied
+    # across with SELECT *, and keeps the id default on the sequence
+    for remainder in range(partitions):
+        cursor.execute(
+            f'CREATE TABLE {table}_p{remainder} PARTITION OF {new} '
+            f'FOR VALUES WITH (MODULUS {partitions}, '
+            f'REMAINDER {remainder})'
+        )
+    return new
+
+
+def copy_rows(connection, table, new, batch_size, last_id=0):
+    """Copy rows with an id above last_id, a batch per transaction"""
+    while True:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT max(id) FROM (SELECT id FROM {table} '
+                    f'WHERE id > %s ORDER BY id LIMIT %s) batch',
+                    [last_id, batch_size]
+                )
+                upper = cursor.fetchone()[0]
+                if upper is None:
+                    return last_id
+                cursor.execute(
+                    f'INSERT INTO {new} SELECT * FROM {table} '
+                    f'WHERE id > %s AND id <= %s',
+                    [last_id, upper]
+                )
+        last_id = upper
+
+
+def get_indexes(cursor, table):
+    """Return the (name, definition) of the indexes of a table that
+    don't belong to a constraint"""
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = 'public' AND tablename = %s "
+        "AND indexname NOT IN ("
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+        [table, table]
+    )
+    return cursor.fetchall()
+    # the primary key and unique constraints are added on their own
+
+
+def copy_indexes(cursor, table, new):
+    """Create the indexes of the table on its partitioned copy
+
+    The copies get temporary names, as the originals still exist, and
+    a list of (temporary name, name) is returned to rename them by once
+    the old table is gone.
+    """
+    renames = []
+    for number, (name, definition) in enumerate(get_indexes(cursor, table)):
+        match = INDEX_DEFINITION.match(definition)
+        temporary = f'{new}_{number}'
+        cursor.execute(
+            f'CREATE {match[1] or ""}INDEX {temporary} ON {new} ' +
+            definition[match.end():]
+        )
+        renames.append((temporary, name))
+    return renames
+
+
+def add_constraints(cursor, table, new, key, unique, foreign_keys):
+    """Add the keys and indexes to a partitioned table, and return the
+    indexes to rename after the swap"""
+    cursor.execute(f'ALTER TABLE {new} ADD PRIMARY KEY (id, {key})')
+    if unique:
+        cursor.execute(
+            f'ALTER TABLE {new} ADD UNIQUE ({", ".join(unique)})'
+        )
+    else:
+        cursor.execute(f'CREATE INDEX ON {new} ({key}, id)')
+        # the recipe list of a user, newest first
+    for column, target in foreign_keys:
+        cursor.execute(
+            f'ALTER TABLE {new} ADD FOREIGN KEY ({column}) '
+            f'REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+    return copy_indexes(cursor, table, new)
+    # whatever indexes the table has right now, including the ones on
+    # the foreign keys, so later migrations find them by name
+
+
+def swap_tables(cursor, table, new):
+    """Replace the table with its partitioned copy"""
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    # otherwise dropping the old table would drop the sequence too
+    cursor.execute(f'DROP TABLE {table} CASCADE')
+    cursor.execute(f'ALTER TABLE {new} RENAME TO {table}')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+
+def partition_recipe_tables(connection, recipe_model, partitions,
+                            batch_size=10000, stdout=None):
+    """Convert the recipe tables to hash partitioned tables
+
+    recipe_model is the Recipe model, or its historical version when
+    run from a migration.
+    """
+    if not supports_partitioning(connection):
+        raise NotSupportedError('Partitioning needs Postgres 11 or later.')
+    tables = [
+        (table, key, unique, foreign_keys)
+        for table, key, unique, foreign_keys in get_tables(recipe_model)
+        if not is_partitioned(connection, table)
+    ]
+    if not tables:
+        return []
+    copied = {}
+    renames = {}
+
+    for table, key, unique, foreign_keys in tables:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                new = create_partitioned_table(
+                    cursor, table, key, partitions
+                )
+        copied[table] = copy_rows(connection, table, new, batch_size)
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                renames[table] = add_constraints(
+                    cursor, table, new, key, unique, foreign_keys
+                )
+        if stdout is not None:
+            stdout.write(f'Copied {table} into {partitions} partitions')
+
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            # ALTER TABLE refuses to run while deferred foreign key
+            # checks are pending in the transaction
+            for table, key, unique, foreign_keys in tables:
+                cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+                # reads carry on, writes wait until the swap is done
+            for table, key, unique, foreign_keys in tables:
+                new = f'{table}_partitioned'
+                copy_rows(connection, table, new, batch_size, copied[table])
+            for table, key, unique, foreign_keys in reversed(tables):
+                # the through tables go first, they point at core_recipe
+                swap_tables(cursor, table, f'{table}_partitioned')
+            for table, key, unique, foreign_keys in tables:
+                for temporary, name in renames[table]:
+                    cursor.execute(f'ALTER INDEX {temporary} RENAME TO {name}')
+            for table, key, unique, foreign_keys in tables:
+                cursor.execute(f'ANALYZE {table}')
+
+    return [table for table, key, unique, foreign_keys in tables]
@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+
+from core.jobs import enqueue
+from core.models import Job, Recipe, RecipeSignature
+
+# Deleting without Django's cascade collector.
+#
+# Model.delete() loads every related object and through table row and
+# deletes the lot in one transaction, which for a user with a large
+# library holds locks for a long time and needs a lot of memory. Here
+# the rows are deleted with plain DELETE statements instead, a batch
+# per committed transaction, by background jobs (recipe/jobs.py and
+# user/jobs.py). No delete signals are sent for those, so everything
+# the signals would do has to be done when the object is first marked
+# as deleted.
+
+
+def raw_delete(queryset):
+    """Delete the rows of the queryset with a single DELETE statement"""
+    return queryset._raw_delete(queryset.db)
+    # sends no signals and doesn't cascade, the callers delete the
+    # rows that point at these first
+
+
+def through_models():
+    """Return the through models of the recipe tags and ingredients"""
+    return [
+        Recipe._meta.get_field(field_name).remote_field.through
+        for field_name in ('tags', 'ingredients')
+    ]
+
+
+def schedule_recipe_purge(user_id):
+    """Queue a purge of the user's deleted recipes unless one is queued
+
+    A queued purge removes every recipe that is deleted by the time it
+    runs, so deleting many recipes only needs the one job.
+    """
+    queued = Job.objects.filter(
+        kind='recipe.purge_deleted', status=Job.PENDING,
+        payload__user_id=user_id
+    ).exists()
+    if not queued:
+        enqueue('recipe.purge_deleted', user_id=user_id)
+
+
+def soft_delete_recipe(recipe):
+    """Delete a recipe as far as the API is concerned
+
+    The recipe is hidden from Recipe.objects right away and loses its
+    tags and ingredients, the row and its image are removed by the
+    recipe.purge_deleted job.
+    """
+    using = router.db_for_write(Recipe)
+    with transaction.atomic():
+        pre_delete.send(sender=Recipe, instance=recipe, using=using)
+        # the usage counts are released while the relations still exist
+        for through in through_models():
+            raw_delete(through.objects.filter(recipe_id=recipe.pk))
+        now = timezone.now()
+        Recipe.all_objects.filter(
+            pk=recipe.pk, user_id=recipe.user_id
+        ).update(deleted_at=now, updated_at=now)
+        post_delete.send(sender=Recipe, instance=recipe, using=using)
+        # leaves the tombstone and updates the indexes and the version,
+        # just like for a recipe that is really gone
+        schedule_recipe_purge(recipe.user_id)
+
+
+def delete_files(names):
+    """Delete recipe images from storage"""
+    storage = Recipe._meta.get_field('image').storage
+    for name in names:
+        storage.delete(name)
+
+
+def purge_recipe_batch(user_id, recipe_ids):
+    """Delete recipes with their relations and signatures, and return
+    the names of their images"""
+    recipes = Recipe.all_objects.filter(user_id=user_id, pk__in=recipe_ids)
+    images = [name for name in recipes.values_list('image', flat=True)
+              if name]
+    for through in through_models():
+        raw_delete(through.objects.filter(recipe_id__in=recipe_ids))
+    raw_delete(RecipeSignature.objects.filter(recipe_id__in=recipe_ids))
+    raw_delete(recipes)
+    return images
+
+
+def purge_recipes(user_id, queryset, batch_size=None):
+    """Delete the recipes in the queryset a batch at a time, return how
+    many were deleted"""
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    total = 0
+    while True:
+        with transaction.atomic():
+            recipe_ids = list(
+                queryset.filter(user_id=user_id).order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not recipe_ids:
+                return total
+            images = purge_recipe_batch(user_id, recipe_ids)
+        delete_files(images)
+        # only once the rows are gone, a rolled back batch mustn't leave
+        # recipes without their images
+        total += len(recipe_ids)
+
+
+def purge_rows(queryset, batch_size=None):
+    """Delete the rows of the queryset a batch at a time, return how many
+    were deleted"""
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    total = 0
+    while True:
+        with transaction.atomic():
+            pks = list(
+                queryset.order_by('pk').values_list('pk', flat=True)
+                [:batch_size]
+            )
+            if not pks:
+                return total
+            total += raw_delete(queryset.model._base_manager.filter(
+                pk__in=pks
+            ))
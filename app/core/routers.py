@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+# Routing of reads to the read replicas. ReplicaMiddleware remembers the
+# request that is being handled, and while it runs the router sends the
+# reads of GET, HEAD and OPTIONS requests to a healthy replica. Users who
+# have written something recently are pinned to the primary database for
+# REPLICA_PIN_SECONDS, so they always read their own writes even when
+# the replicas are lagging behind.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def start_request(request):
+    """Route the queries of this thread for the given request"""
+    _local.request = request
+    _local.pinned = None
+    _local.replica = None
+
+
+def end_request():
+    """Stop routing the queries of this thread"""
+    _local.request = None
+
+
+def pin_key(user_id):
+    """Return the cache key that pins a user to the primary"""
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Send the reads of the user to the primary for a while"""
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaHealth:
+    """Remember which replicas answered the last time they were checked"""
+
+    def __init__(self):
+        self.checked = {}
+        # alias -> (healthy, time of the check)
+
+    def is_healthy(self, alias):
+        """Return whether the replica can be used, checking now and then"""
+        healthy, checked_at = self.checked.get(alias, (None, 0))
+        interval = settings.REPLICA_HEALTH_CHECK_INTERVAL
+        if healthy is None or time.monotonic() - checked_at > interval:
+            healthy = self.check(alias)
+            self.checked[alias] = (healthy, time.monotonic())
+        return healthy
+
+    def check(self, alias):
+        """Run a trivial query on the replica"""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return False
+        return True
+
+    def mark_unhealthy(self, alias):
+        """Stop using a replica until it is checked again"""
+        self.checked[alias] = (False, time.monotonic())
+
+
+health = ReplicaHealth()
+
+
+def current_replica():
+    """Return the replica used by the current request, if any"""
+    return getattr(_local, 'replica', None)
+
+
+class ReplicaRouter:
+    """Send the reads of safe requests to a healthy read replica"""
+    primary_models = {
+        'authtoken.token', 'sessions.session', 'core.user',
+        'core.revokedtoken', 'core.job',
+    }
+    # authentication always reads from the primary, otherwise a token
+    # that was just created could be missing on a lagging replica
+
+    def is_pinned(self, request):
+        """Return whether the user of the request wrote recently"""
+        if _local.pinned is not None:
+            return _local.pinned
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return False
+            # not known until the view has authenticated the request
+        _local.pinned = bool(cache.get(pin_key(user.pk)))
+        return _local.pinned
+
+    def choose_replica(self):
+        """Pick a healthy replica once per request"""
+        if _local.replica is None:
+            replicas = list(settings.DATABASE_REPLICAS)
+            random.shuffle(replicas)
+            _local.replica = next(
+                (alias for alias in replicas if health.is_healthy(alias)),
+                ''
+            )
+            # '' means none of them are healthy, use the primary
+        return _local.replica or None
+
+    def db_for_read(self, model, **hints):
+        request = getattr(_local, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        if not settings.DATABASE_REPLICAS:
+            return None
+        if model._meta.label_lower in self.primary_models:
+            return None
+        if self.is_pinned(request):
+            return None
+        return self.choose_replica()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+        # the replicas hold the same rows as the primary
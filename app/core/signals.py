@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Tag, Ingredient, Recipe, Tombstone
+from .versions import bump_user_version
+
+# The usage counters on tags and ingredients are updated with F()
+# expressions so the database does the increment itself. That way two
+# requests changing the same tag at the same time can't overwrite each
+# other's update.
+
+
+def adjust_usage_count(queryset, delta):
+    """Add delta to the usage count of every object in the queryset"""
+    if delta:
+        queryset.update(
+            usage_count=F('usage_count') + delta, updated_at=timezone.now()
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_usage_counts(sender, instance, action, reverse, model, pk_set,
+                        **kwargs):
+    """Keep the usage counts in line with the recipe relations"""
+    if reverse:
+        # the change was made from the tag or ingredient side, so
+        # instance is the counted object and pk_set holds recipe ids
+        counted = type(instance).objects.filter(pk=instance.pk)
+        field_name = type(instance)._meta.model_name
+        if action == 'post_add':
+            # django only passes the ids that were actually added
+            adjust_usage_count(counted, len(pk_set))
+        elif action == 'pre_remove':
+            # but for removals it passes every id it was given, so we
+            # count the rows that really exist before they are removed
+            removed = sender.objects.filter(
+                recipe_id__in=pk_set, **{field_name: instance}
+            ).count()
+            adjust_usage_count(counted, -removed)
+        elif action == 'pre_clear':
+            counted.update(usage_count=0, updated_at=timezone.now())
+        return
+
+    if action == 'post_add':
+        adjust_usage_count(model.objects.filter(pk__in=pk_set), 1)
+    elif action == 'pre_remove':
+        adjust_usage_count(
+            model.objects.filter(pk__in=pk_set, recipe=instance), -1
+        )
+    elif action == 'pre_clear':
+        adjust_usage_count(model.objects.filter(recipe=instance), -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def release_usage_counts(sender, instance, **kwargs):
+    """Decrement the counts of everything a deleted recipe used"""
+    # the rows in the through tables are deleted with the recipe
+    # without sending m2m_changed, so we do it before they're gone
+    adjust_usage_count(Tag.objects.filter(recipe=instance), -1)
+    adjust_usage_count(Ingredient.objects.filter(recipe=instance), -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_version_on_change(sender, instance, **kwargs):
+    """Invalidate the cached results of the owner of a changed object"""
+    bump_user_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_version_on_relation_change(sender, instance, action, **kwargs):
+    """Invalidate the cached results when recipe relations change"""
+    if action.startswith('post_'):
+        bump_user_version(instance.user_id)
+
+
+# Syncing clients ask for everything changed since their last sync, see
+# recipe/changes.py. Saves move updated_at forward on their own, these
+# cover the changes made without saving the object.
+
+
+def touch_recipes(queryset):
+    """Mark the recipes in the queryset as changed"""
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_relation_change(sender, instance, action, reverse,
+                                     pk_set, tracked=False, **kwargs):
+    """Mark recipes whose tags or ingredients changed as changed"""
+    if tracked:
+        return
+        # the bulk helpers in recipe/relations.py mark the recipes
+        # themselves, all of them with one query
+    recipes = Recipe.objects.filter(user_id=instance.user_id)
+    # the user_id keeps the update to one partition of core_recipe
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_recipes(recipes.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(recipes.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        field_name = type(instance)._meta.model_name + 's'
+        touch_recipes(recipes.filter(**{field_name: instance}))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_on_target_delete(sender, instance, **kwargs):
+    """Mark the recipes of a tag or ingredient being deleted as changed"""
+    # like the recipe's own through rows, these are deleted without
+    # sending m2m_changed
+    field_name = sender._meta.model_name + 's'
+    touch_recipes(
+        Recipe.objects.filter(
+            user_id=instance.user_id, **{field_name: instance}
+        )
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_deletion(sender, instance, **kwargs):
+    """Leave a tombstone for a deleted object"""
+    Tombstone.objects.create(
+        user_id=instance.user_id, model=sender._meta.model_name,
+        object_id=instance.pk
+    )
+
+
+@receiver(post_delete, sender=get_user_model())
+def delete_tombstones(sender, instance, **kwargs):
+    """Delete the tombstones of a deleted user"""
+    Tombstone.objects.filter(user_id=instance.pk).delete()
+    # including the ones written while their objects were deleted
@@ -1,12 +1,16 @@
 #  admin page unit tests.
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 # allow us to generate URLs for our Django admin page.
 from django.test import Client
 # will allow us to make test requests to our application in our unit tests.
 
+from core.models import Tag, Recipe
+
 
 class AdminSiteTests(TestCase):
 
@@ -85,3 +89,111 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+
+class RecipeAdminTests(TestCase):
+    """Test the admin pages of the recipe tables"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@londonappdev.com',
+            password='password123'
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='test@londonappdev.com',
+            password='password123',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price=5
+        )
+        self.recipe.tags.add(self.tag)
+
+    def changelist(self, model, **params):
+        url = reverse(f'admin:core_{model}_changelist')
+        return self.client.get(url, params)
+
+    def test_changelist_queries_flat(self):
+        """Test the recipe list takes the same queries for more rows"""
+        self.changelist('recipe')
+        with CaptureQueriesContext(connection) as few:
+            self.changelist('recipe')
+        for number in range(10):
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {number}', time_minutes=10,
+                price=5
+            )
+
+        with self.assertNumQueries(len(few)):
+            res = self.changelist('recipe')
+
+        self.assertContains(res, 'Recipe 9')
+        self.assertContains(res, self.user.email)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_large_list_count_estimated(self):
+        """Test the count of a large list comes from the planner"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.changelist('recipe')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']]
+        )
+        self.assertTrue(
+            [query for query in queries if 'EXPLAIN' in query['sql']]
+        )
+
+    def test_small_list_counted(self):
+        """Test a list below the limit is counted exactly"""
+        res = self.changelist('recipe')
+
+        self.assertEqual(res.context['cl'].result_count, 1)
+
+    def test_indexed_search(self):
+        """Test searching by id, owner email and title prefix"""
+        other = Recipe.objects.create(
+            user=self.admin_user, title='Stew', time_minutes=30, price=5
+        )
+        searches = {
+            str(other.id): other,
+            'Cur': self.recipe,
+            self.user.email: self.recipe,
+        }
+        for term, expected in searches.items():
+            res = self.changelist('recipe', q=term)
+
+            self.assertEqual(list(res.context['cl'].result_list), [expected])
+
+    def test_owner_filter(self):
+        """Test filtering the list on the owner"""
+        Recipe.objects.create(
+            user=self.admin_user, title='Stew', time_minutes=30, price=5
+        )
+
+        res = self.changelist('recipe', user=self.user.id)
+
+        self.assertEqual(
+            list(res.context['cl'].result_list), [self.recipe]
+        )
+
+    def test_tag_search(self):
+        """Test the tag list is searched by name prefix"""
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.changelist('tag', q='Veg')
+
+        self.assertEqual(list(res.context['cl'].result_list), [self.tag])
+
+    def test_recipe_change_page(self):
+        """Test the recipe edit page only renders the selected tags"""
+        Tag.objects.create(user=self.user, name='Not selected')
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Not selected')
@@ -0,0 +1,184 @@
+import gzip
+import json
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import compression
+from core.middleware import CompressionMiddleware
+from recipe.tests.test_recipe_api import RECIPES_URL, sample_recipe
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def respond_with(response):
+    """Return the compression middleware around a view returning response"""
+    return CompressionMiddleware(lambda request: response)
+
+
+class EncodingNegotiationTests(TestCase):
+    """Test picking an encoding from Accept-Encoding"""
+
+    def test_accepted_encodings_with_q_values(self):
+        """Test the q values of the header are parsed"""
+        accepted = compression.accepted_encodings(
+            'gzip;q=0.5, br , identity;q=0, zstd;q=x'
+        )
+
+        self.assertEqual(
+            accepted, {'gzip': 0.5, 'br': 1.0, 'identity': 0.0, 'zstd': 0.0}
+        )
+
+    def test_choose_preferred_order(self):
+        """Test our order is used when the client has no preference"""
+        encoding = compression.choose_encoding('gzip, foo', ('foo', 'gzip'))
+
+        self.assertEqual(encoding, 'gzip')
+        # foo isn't an encoding we have
+
+    def test_choose_client_q_values_win(self):
+        """Test a higher q value from the client wins over our order"""
+        compression.ENCODERS['fake'] = compression.GzipEncoder
+        try:
+            encoding = compression.choose_encoding(
+                'fake;q=0.2, gzip', ('fake', 'gzip')
+            )
+        finally:
+            compression.ENCODERS.pop('fake')
+
+        self.assertEqual(encoding, 'gzip')
+
+    def test_choose_refused_and_wildcard(self):
+        """Test q=0 refuses an encoding and * accepts any"""
+        self.assertIsNone(compression.choose_encoding('gzip;q=0', ('gzip',)))
+        self.assertIsNone(compression.choose_encoding('', ('gzip',)))
+        self.assertEqual(compression.choose_encoding('*', ('gzip',)), 'gzip')
+
+
+@override_settings(COMPRESSION_ENCODINGS=('gzip',), COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(TestCase):
+    """Test compressing responses"""
+
+    def setUp(self):
+        self.request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+
+    def test_compresses_large_response(self):
+        """Test a body over the minimum size is gzipped"""
+        body = b'{"name": "Curry"}' * 20
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = '"abc"'
+
+        res = respond_with(response)(self.request)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(res['ETag'], 'W/"abc"')
+        self.assertEqual(int(res['Content-Length']), len(res.content))
+        self.assertEqual(gzip.decompress(res.content), body)
+
+    def test_small_response_not_compressed(self):
+        """Test a body under the minimum size is sent as it is"""
+        response = HttpResponse(b'{}', content_type='application/json')
+
+        res = respond_with(response)(self.request)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, b'{}')
+
+    def test_not_accepted_not_compressed(self):
+        """Test nothing is compressed for clients without gzip"""
+        request = RequestFactory().get('/')
+        response = HttpResponse(b'a' * 200, content_type='text/plain')
+
+        res = respond_with(response)(request)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+
+    def test_images_not_compressed(self):
+        """Test compressed content types are skipped"""
+        for content_type in ('image/png', 'application/gzip'):
+            response = HttpResponse(b'a' * 200, content_type=content_type)
+
+            res = respond_with(response)(self.request)
+
+            self.assertFalse(res.has_header('Content-Encoding'))
+            self.assertEqual(res.content, b'a' * 200)
+
+    def test_streaming_response_compressed(self):
+        """Test a streamed body is compressed on the fly"""
+        chunks = [b'chunk %d ' % number for number in range(50)]
+        response = StreamingHttpResponse(iter(chunks))
+        response['Content-Length'] = '400'
+
+        res = respond_with(response)(self.request)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        self.assertEqual(
+            gzip.decompress(b''.join(res.streaming_content)), b''.join(chunks)
+        )
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    @override_settings(COMPRESSION_ENCODINGS=('br', 'gzip'))
+    def test_brotli_preferred(self):
+        """Test brotli is used when both sides support it"""
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        body = b'{"name": "Curry"}' * 20
+        response = HttpResponse(body, content_type='application/json')
+
+        res = respond_with(response)(request)
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(res.content), body)
+
+
+@override_settings(COMPRESSION_ENCODINGS=('gzip',), COMPRESSION_MIN_SIZE=100)
+class CompressedApiTests(TestCase):
+    """Test compression of the API's responses"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        for number in range(5):
+            sample_recipe(user=self.user, title=f'Recipe {number}')
+
+    def test_recipe_list_compressed(self):
+        """Test the recipe list comes back gzipped"""
+        plain = self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+
+    def test_streamed_list_compressed(self):
+        """Test the streamed recipe list decompresses to the full list"""
+        res = self.client.get(
+            RECIPES_URL, {'stream': 1}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        recipes = json.loads(
+            gzip.decompress(b''.join(res.streaming_content))
+        )
+        self.assertEqual(len(recipes), 5)
+
+    def test_gzipped_export_not_compressed_again(self):
+        """Test an export that is gzipped already is left alone"""
+        res = self.client.get(
+            EXPORT_URL, {'gzip': 1}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        lines = gzip.decompress(b''.join(res.streaming_content))
+        self.assertEqual(len(lines.splitlines()), 5)
@@ -0,0 +1,156 @@
+import threading
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job, RevokedToken
+
+from user.jobs import purge_revoked_tokens
+from user.tokens import revoke
+
+runs = []
+_runs_lock = threading.Lock()
+
+
+@jobs.job('test.record')
+def record(value):
+    with _runs_lock:
+        runs.append(value)
+
+
+@jobs.job('test.fail', max_attempts=2)
+def fail():
+    raise RuntimeError('broken')
+
+
+@jobs.job('test.limited', concurrency=1)
+def limited():
+    pass
+
+
+class JobQueueTests(TestCase):
+    """Test queueing and running jobs"""
+
+    def setUp(self):
+        runs.clear()
+
+    def test_job_run(self):
+        """Test a queued job is run once"""
+        queued = jobs.enqueue('test.record', value=7)
+
+        self.assertEqual(jobs.run_next('worker'), Job.DONE)
+        self.assertEqual(runs, [7])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.DONE)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIsNone(jobs.run_next('worker'))
+
+    def test_unknown_kind_rejected(self):
+        """Test only registered jobs can be queued"""
+        with self.assertRaises(ValueError):
+            jobs.enqueue('test.missing')
+
+    def test_future_jobs_wait(self):
+        """Test a job isn't run before its time"""
+        jobs.enqueue(
+            'test.record', run_at=timezone.now() + timedelta(hours=1),
+            value=1
+        )
+
+        self.assertIsNone(jobs.run_next('worker'))
+
+    @override_settings(JOB_RETRY_DELAY=60)
+    def test_failed_job_retried_later(self):
+        """Test a failed job is pushed back and fails for good at last"""
+        queued = jobs.enqueue('test.fail')
+
+        self.assertEqual(jobs.run_next('worker'), Job.PENDING)
+        queued.refresh_from_db()
+        self.assertGreater(
+            queued.run_at, timezone.now() + timedelta(seconds=25)
+        )
+        self.assertIn('RuntimeError: broken', queued.last_error)
+        self.assertIsNone(jobs.run_next('worker'))
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(jobs.run_next('worker'), Job.FAILED)
+
+    def test_concurrency_limit(self):
+        """Test a kind at its limit is skipped for other kinds"""
+        jobs.enqueue('test.limited')
+        jobs.enqueue('test.limited')
+        jobs.enqueue('test.record', value=1)
+        claimed = jobs.claim('worker', ['test.limited', 'test.record'])
+
+        self.assertEqual(claimed.kind, 'test.limited')
+        self.assertEqual(
+            jobs.claim('worker', ['test.limited', 'test.record']).kind,
+            'test.record'
+        )
+        self.assertIsNone(jobs.claim('worker', ['test.limited']))
+
+        jobs.run(claimed)
+
+        self.assertEqual(jobs.claim('worker', ['test.limited']).kind,
+                         'test.limited')
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_stale_jobs_released(self):
+        """Test jobs of a lost worker are queued again"""
+        jobs.enqueue('test.record', value=1)
+        jobs.enqueue('test.fail')
+        jobs.claim('lost', ['test.record'])
+        Job.objects.update(
+            status=Job.RUNNING,
+            locked_at=timezone.now() - timedelta(minutes=5),
+        )
+        Job.objects.filter(kind='test.fail').update(attempts=2)
+
+        self.assertEqual(jobs.release_stale(), 1)
+        self.assertEqual(
+            dict(Job.objects.values_list('kind', 'status')),
+            {'test.record': Job.PENDING, 'test.fail': Job.FAILED}
+        )
+
+    def test_revoked_tokens_purged(self):
+        """Test revoked tokens are deleted once they've expired"""
+        revoke(1, 1)
+        revoke(2, 4102444800)
+        # expired long ago, and in 2100
+
+        purges = Job.objects.filter(kind='user.purge_revoked_tokens')
+        self.assertEqual(purges.count(), 1)
+        # the purge for the first expiry covers the later one too
+        purges.update(status=Job.DONE)
+        purge_revoked_tokens()
+        self.assertEqual(
+            list(RevokedToken.objects.values_list('jti', flat=True)), [2]
+        )
+        self.assertEqual(
+            purges.get(status=Job.PENDING).run_at.year, 2100
+        )
+
+
+class RunWorkersTests(TransactionTestCase):
+    """Test the run_workers command"""
+
+    def setUp(self):
+        runs.clear()
+
+    def test_threads_run_each_job_once(self):
+        """Test worker threads share out the jobs without doubling up"""
+        for value in range(30):
+            jobs.enqueue('test.record', value=value)
+
+        call_command(
+            'run_workers', '--threads', '4', '--burst',
+            '--kinds', 'test.record'
+        )
+
+        self.assertEqual(sorted(runs), list(range(30)))
+        self.assertEqual(
+            Job.objects.filter(status=Job.DONE).count(), 30
+        )
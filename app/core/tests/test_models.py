@@ -108,6 +108,19 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(recipe), recipe.title)
 
+    def test_recipe_moved_to_other_user(self):
+        """Test a recipe can be given to another user"""
+        recipe = models.Recipe.objects.create(
+            user=sample_user(), title='Soup', time_minutes=5, price=5.00
+        )
+        other = sample_user(email='other@londonappdev.com')
+
+        recipe = models.Recipe.objects.get(pk=recipe.pk)
+        recipe.user = other
+        recipe.save()
+
+        self.assertEqual(models.Recipe.objects.get().user, other)
+
 # upload image
     @patch('uuid.uuid4')
     #  UUID for function is a function within the UUID
@@ -0,0 +1,146 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import NotSupportedError, connection
+from django.test import TestCase, override_settings
+
+from core.models import Tag, Recipe
+from core.partitioning import get_tables, is_partitioned, \
+    partition_recipe_tables, supports_partitioning
+
+
+def sample_recipe(user, title='Soup'):
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=5, price=1.00
+    )
+
+
+class PartitioningTests(TestCase):
+    """Test hash partitioning the recipe tables"""
+
+    def setUp(self):
+        if not supports_partitioning(connection):
+            self.skipTest('Partitioning needs Postgres 11 or later')
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipes = [
+            sample_recipe(self.user, f'Recipe {i}') for i in range(5)
+        ]
+        self.recipes[0].tags.add(self.tag)
+
+    def explain(self, queryset):
+        """Return the plan of a query as text"""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_tables_partitioned_with_rows(self):
+        """Test the rows are carried over in batches"""
+        tables = partition_recipe_tables(connection, Recipe, 4, batch_size=2)
+
+        self.assertEqual(len(tables), 3)
+        for table, *rest in get_tables(Recipe):
+            self.assertTrue(is_partitioned(connection, table))
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertEqual(list(self.recipes[0].tags.all()), [self.tag])
+
+        self.assertEqual(partition_recipe_tables(connection, Recipe, 4), [])
+        # running it again does nothing
+
+    def test_orm_works_on_partitioned_tables(self):
+        """Test recipes can still be created, changed and deleted"""
+        partition_recipe_tables(connection, Recipe, 4)
+
+        recipe = sample_recipe(self.user, 'New')
+        recipe.tags.add(self.tag)
+        recipe.title = 'Renamed'
+        recipe.save()
+        self.assertGreater(recipe.id, self.recipes[-1].id)
+        self.assertEqual(Recipe.objects.get(id=recipe.id).title, 'Renamed')
+
+        self.recipes[0].delete()
+        self.assertEqual(
+            list(self.tag.recipe_set.values_list('id', flat=True)),
+            [recipe.id]
+        )
+
+    def test_user_queries_pruned(self):
+        """Test a user's recipes are read from a single partition"""
+        partition_recipe_tables(connection, Recipe, 4)
+
+        plan = self.explain(Recipe.objects.filter(user=self.user))
+
+        self.assertEqual(plan.count('core_recipe_p'), 1)
+
+        plan = self.explain(
+            Recipe.tags.through.objects.filter(recipe_id=self.recipes[0].id)
+        )
+
+        self.assertEqual(plan.count('core_recipe_tags_p'), 1)
+
+    def index_names(self, table):
+        """Return the names of the indexes on a table"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE tablename = %s',
+                [table]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_indexes_keep_their_names(self):
+        """Test the indexes are carried over under the same names"""
+        before = {
+            table: self.index_names(table)
+            for table, *rest in get_tables(Recipe)
+        }
+
+        partition_recipe_tables(connection, Recipe, 4)
+
+        for table, names in before.items():
+            indexes = {name for name in names
+                       if not name.endswith(('_pkey', '_uniq'))}
+            # the constraints are created anew
+            self.assertLessEqual(indexes, self.index_names(table))
+        self.assertIn('core_recipe_title_like_idx',
+                      self.index_names('core_recipe'))
+
+    @override_settings(RECIPE_PARTITIONS=4)
+    def test_recipe_moved_to_other_user(self):
+        """Test a recipe can be given to another user once partitioned"""
+        partition_recipe_tables(connection, Recipe, 4)
+        other = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'testpass'
+        )
+        recipe = Recipe.objects.get(id=self.recipes[1].id)
+
+        recipe.user = other
+        recipe.save()
+        recipe.title = 'Moved'
+        recipe.save()
+
+        self.assertEqual(
+            list(Recipe.objects.filter(title='Moved')), [recipe]
+        )
+        self.assertEqual(Recipe.objects.get(id=recipe.id).user, other)
+        self.assertEqual(Recipe.objects.count(), 5)
+
+
+class OldPostgresTests(TestCase):
+    """Test partitioning is refused before Postgres 11"""
+
+    @patch.object(connection, 'pg_version', 100012, create=True)
+    def test_partitioning_refused(self):
+        """Test the tables are left alone on Postgres 10"""
+        with self.assertRaises(NotSupportedError):
+            partition_recipe_tables(connection, Recipe, 4)
+        with self.assertRaises(CommandError):
+            call_command('partition_recipes')
+
+        self.assertFalse(is_partitioned(connection, 'core_recipe'))
@@ -0,0 +1,207 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Job, Recipe, RecipeSignature, \
+    RevokedToken, Tombstone
+
+from recipe.jobs import purge_deleted
+from recipe.tests.test_recipe_api import RECIPES_URL, detail_url, \
+    sample_recipe, sample_tag, sample_ingredient
+from user import tokens
+from user.jobs import delete_account
+
+
+ME_URL = reverse('user:me')
+
+
+def add_image(recipe):
+    """Give the recipe an image file and return its path"""
+    recipe.image.save('test.jpg', ContentFile(b'image'))
+    return recipe.image.path
+
+
+class RecipeSoftDeleteTests(TestCase):
+    """Test deleting recipes in the background"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+
+    def test_delete_hides_recipe(self):
+        """Test a deleted recipe is gone from the API right away"""
+        res = self.client.delete(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.client.get(detail_url(self.recipe.id)).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+        self.assertEqual(self.client.get(RECIPES_URL).data, [])
+        self.assertFalse(Recipe.objects.exists())
+        deleted = Recipe.all_objects.get(pk=self.recipe.pk)
+        self.assertIsNotNone(deleted.deleted_at)
+        # the row stays until the job removes it
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.usage_count, 0)
+        self.assertFalse(self.tag.recipe_set.exists())
+        self.assertTrue(
+            Tombstone.objects.filter(object_id=self.recipe.pk).exists()
+        )
+        self.assertTrue(
+            Job.objects.filter(
+                kind='recipe.purge_deleted', payload={'user_id': self.user.pk}
+            ).exists()
+        )
+
+    def test_one_purge_queued_per_user(self):
+        """Test deleting several recipes queues a single purge"""
+        other = sample_recipe(user=self.user, title='Other')
+
+        self.client.delete(detail_url(self.recipe.id))
+        self.client.delete(detail_url(other.id))
+
+        purges = Job.objects.filter(kind='recipe.purge_deleted')
+        self.assertEqual(purges.count(), 1)
+        purges.update(status=Job.DONE)
+        self.client.delete(detail_url(sample_recipe(user=self.user).id))
+        self.assertEqual(purges.filter(status=Job.PENDING).count(), 1)
+        # once it has run, the next delete queues another
+
+    def test_purge_removes_rows_and_images(self):
+        """Test the purge job deletes the recipe and its image"""
+        path = add_image(self.recipe)
+        kept = sample_recipe(user=self.user, title='Kept')
+        RecipeSignature.objects.create(
+            recipe_id=self.recipe.pk, user=self.user, signature=b''
+        )
+        self.client.delete(detail_url(self.recipe.id))
+
+        purge_deleted(user_id=self.user.pk)
+
+        self.assertFalse(
+            Recipe.all_objects.filter(pk=self.recipe.pk).exists()
+        )
+        self.assertTrue(Recipe.objects.filter(pk=kept.pk).exists())
+        self.assertFalse(
+            RecipeSignature.objects.filter(recipe_id=self.recipe.pk).exists()
+        )
+        self.assertFalse(os.path.exists(path))
+
+
+class AccountDeletionTests(TestCase):
+    """Test deleting a user's account in the background"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_delete_deactivates_user(self):
+        """Test deleting the account deactivates it and queues the job"""
+        Token.objects.create(user=self.user)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        job = Job.objects.get(kind='user.delete_account')
+        self.assertEqual(job.payload, {'user_id': self.user.pk})
+
+    def test_delete_revokes_signed_token(self):
+        """Test the signed token used to delete the account is revoked"""
+        client = APIClient()
+        token = tokens.make_token(self.user.pk)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        res = client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(
+            RevokedToken.objects.filter(user_id=self.user.pk).exists()
+        )
+        self.assertEqual(
+            client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+    @override_settings(PURGE_BATCH_SIZE=2)
+    def test_delete_account_job(self):
+        """Test the job deletes everything the user owns"""
+        other = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'password123'
+        )
+        other_recipe = sample_recipe(user=other)
+        other_recipe.tags.add(sample_tag(user=other))
+        paths = []
+        for number in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {number}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {number}'))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+            paths.append(add_image(recipe))
+        self.client.delete(detail_url(recipe.id))
+        self.client.delete(ME_URL)
+
+        delete_account(user_id=self.user.pk)
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(list(Recipe.all_objects.all()), [other_recipe])
+        self.assertEqual(Tag.objects.get().user, other)
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(
+            Tombstone.objects.filter(user_id=self.user.pk).exists()
+        )
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertEqual(other_recipe.tags.count(), 1)
+
+    def test_reactivated_user_kept(self):
+        """Test the job leaves a user alone that was reactivated"""
+        sample_recipe(user=self.user)
+        self.client.delete(ME_URL)
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=True
+        )
+
+        delete_account(user_id=self.user.pk)
+
+        self.assertTrue(Recipe.objects.filter(user=self.user).exists())
+
+    def test_delete_revokes_all_signed_tokens(self):
+        """Test every access token of the user stops working right away"""
+        other_token = tokens.make_token(self.user.pk)
+        self.client.delete(ME_URL)
+
+        tokens.deny_list.clear()
+        # a process that only knows what's in the database
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {other_token}')
+        self.assertEqual(
+            client.get(RECIPES_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+        job = Job.objects.get(kind='user.delete_account')
+        self.assertLessEqual(job.run_at, timezone.now())
+        # nothing left that could use the account, so no need to wait
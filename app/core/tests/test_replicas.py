@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    """Test reads are sent to the replica unless the user just wrote"""
+    databases = {'default', 'replica'}
+    # the replica is a separate, empty database here, like a replica
+    # that hasn't caught up with the primary yet
+
+    def setUp(self):
+        cache.clear()
+        routers.health.checked.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1.00
+        )
+
+    def test_reads_go_to_replica(self):
+        """Test listing recipes reads from the replica"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_writes_go_to_primary_and_pin(self):
+        """Test a user reads their own writes from the primary"""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Toast', 'time_minutes': 2, 'price': 1.00,
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(
+            Recipe.objects.using('default').filter(title='Toast').exists()
+        )
+        self.assertFalse(Recipe.objects.using('replica').exists())
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            sorted(recipe['title'] for recipe in res.data), ['Soup', 'Toast']
+        )
+
+    def test_pin_only_applies_to_writer(self):
+        """Test other users still read from the replica"""
+        routers.pin_to_primary(self.user.pk + 1)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data, [])
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        """Test reads go to the primary when no replica answers"""
+        with patch.object(routers.ReplicaHealth, 'check', return_value=False):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+
+    def test_health_checked_once_per_interval(self):
+        """Test the replica isn't checked on every request"""
+        check = patch.object(
+            routers.ReplicaHealth, 'check', return_value=True
+        )
+        with check as mock_check:
+            self.client.get(RECIPES_URL)
+            self.client.get(RECIPES_URL)
+
+        self.assertEqual(mock_check.call_count, 1)
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test code that isn't handling a request reads the primary"""
+        self.assertEqual(Recipe.objects.count(), 1)
@@ -0,0 +1,110 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import Tag, Ingredient, Recipe
+
+
+def sample_recipe(user, title='Sample recipe'):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00
+    )
+
+
+class UsageCountTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Tofu'
+        )
+
+    def assertUsage(self, obj, count):
+        obj.refresh_from_db()
+        self.assertEqual(obj.usage_count, count)
+
+    def test_add_and_remove_updates_count(self):
+        """Test adding and removing relations updates the counts"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+
+        recipe1.tags.add(self.tag)
+        recipe1.tags.add(self.tag)
+        # adding it twice doesn't count twice
+        recipe2.tags.add(self.tag)
+        recipe1.ingredients.add(self.ingredient)
+        self.assertUsage(self.tag, 2)
+        self.assertUsage(self.ingredient, 1)
+
+        recipe1.tags.remove(self.tag)
+        recipe1.tags.remove(self.tag)
+        # removing something that isn't there changes nothing
+        self.assertUsage(self.tag, 1)
+
+        recipe2.tags.clear()
+        self.assertUsage(self.tag, 0)
+
+    def test_set_updates_count(self):
+        """Test replacing the relations with set() updates the counts"""
+        other = Tag.objects.create(user=self.user, name='Quick')
+        recipe = sample_recipe(self.user)
+        recipe.tags.set([self.tag])
+
+        recipe.tags.set([other])
+
+        self.assertUsage(self.tag, 0)
+        self.assertUsage(other, 1)
+
+    def test_reverse_side_updates_count(self):
+        """Test changes made from the tag side update the count"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+
+        self.tag.recipe_set.add(recipe1, recipe2)
+        self.assertUsage(self.tag, 2)
+
+        self.tag.recipe_set.remove(recipe1, recipe1)
+        self.assertUsage(self.tag, 1)
+
+        self.tag.recipe_set.clear()
+        self.assertUsage(self.tag, 0)
+
+    def test_deleting_recipe_updates_count(self):
+        """Test deleting a recipe releases its tags and ingredients"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+        for recipe in (recipe1, recipe2):
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+
+        recipe1.delete()
+        self.assertUsage(self.tag, 1)
+
+        Recipe.objects.all().delete()
+        self.assertUsage(self.tag, 0)
+        self.assertUsage(self.ingredient, 0)
+
+    def test_repair_usage_counts(self):
+        """Test the repair command recomputes drifted counts"""
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+        Tag.objects.update(usage_count=42)
+        Ingredient.objects.update(usage_count=-3)
+        unused = Tag.objects.create(user=self.user, name='Unused')
+        Tag.objects.filter(pk=unused.pk).update(usage_count=7)
+
+        call_command(
+            'repair_usage_counts', batch_size=1, stdout=StringIO()
+        )
+
+        self.assertUsage(self.tag, 1)
+        self.assertUsage(self.ingredient, 1)
+        self.assertUsage(unused, 0)
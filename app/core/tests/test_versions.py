@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from core.models import Tag, Recipe
+from core.versions import get_user_version, bump_user_version, version_key
+
+
+class UserVersionTests(TestCase):
+    """Test the per user data version"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+
+    def test_bump_changes_version(self):
+        """Test bumping gives a new version"""
+        version = get_user_version(self.user.pk)
+
+        bump_user_version(self.user.pk)
+
+        self.assertNotEqual(get_user_version(self.user.pk), version)
+
+    def test_evicted_version_not_reused(self):
+        """Test a version lost from the cache isn't handed out again"""
+        version = get_user_version(self.user.pk)
+        cache.delete(version_key(self.user.pk))
+
+        self.assertGreater(get_user_version(self.user.pk), version)
+
+    def test_changes_bump_version(self):
+        """Test saving objects and changing relations bump the version"""
+        versions = [get_user_version(self.user.pk)]
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        versions.append(get_user_version(self.user.pk))
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1.00
+        )
+        versions.append(get_user_version(self.user.pk))
+        recipe.tags.add(tag)
+        versions.append(get_user_version(self.user.pk))
+        recipe.delete()
+        versions.append(get_user_version(self.user.pk))
+
+        self.assertEqual(len(set(versions)), 5)
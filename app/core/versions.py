@@ -0,0 +1,46 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# A version number per user that changes whenever any of their recipes,
+# tags or ingredients change. Cached results include the version in
+# their key, so bumping it invalidates all of a user's cached results
+# at once without having to know which keys exist.
+
+
+def version_key(user_id):
+    """Return the cache key holding the data version of a user"""
+    return f'user-version:{user_id}'
+
+
+def new_version():
+    """Return a version that is higher than any handed out before"""
+    return time.time_ns() // 1000
+    # if the key is evicted the next version still won't match any of
+    # the results cached under the old one
+
+
+def get_user_version(user_id):
+    """Return the current data version of a user"""
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def incr_user_version(user_id):
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        cache.set(version_key(user_id), new_version(), None)
+
+
+def bump_user_version(user_id):
+    """Invalidate everything cached for a user"""
+    incr_user_version(user_id)
+    transaction.on_commit(lambda: incr_user_version(user_id))
+    # bumped again once the change is committed, in case another
+    # request cached the old data in between
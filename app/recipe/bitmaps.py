@@ -0,0 +1,287 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, Value
+
+from core.versions import get_user_version
+
+from .relations import RELATIONS, current_relation_ids, get_relation
+
+# An optional in-process index for the ?tags= and ?ingredients= filters.
+#
+# For every tag and ingredient of a user it keeps a bitmap of the user's
+# recipes that have it, as a Python int with one bit per recipe. Recipes
+# are numbered densely per user, so a bitmap is about n / 8 bytes for a
+# user with n recipes however large the recipe ids get. Matching any of
+# several ids is an OR of their bitmaps and matching all of them an AND,
+# and the recipes are then fetched by id without touching the through
+# tables.
+#
+# A user's index is built on their first filtered request for the data
+# version of the moment, and is rebuilt once that version moves on. The
+# relation signals also patch an index that's already loaded when a
+# change made by this process commits, so it's right for the requests
+# still holding it, but the patched index keeps the version it was
+# loaded with, as only a new load sees the changes of other processes.
+# The indexes are dropped least recently used first to stay within
+# RECIPE_BITMAP_INDEX_MEMORY bytes.
+
+
+def to_bitmap(positions):
+    """Return the bitmap with the bits at the positions set"""
+    if not len(positions):
+        return 0
+    bits = np.zeros(int(max(positions)) + 1, dtype=np.uint8)
+    bits[np.asarray(positions)] = 1
+    return int.from_bytes(
+        np.packbits(bits, bitorder='little').tobytes(), 'little'
+    )
+    # numpy sets the bits in one go, doing it one | at a time would copy
+    # the whole int for every recipe
+
+
+def from_bitmap(bitmap):
+    """Return the positions of the set bits of a bitmap"""
+    if not bitmap:
+        return np.zeros(0, dtype=np.int64)
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    return np.flatnonzero(
+        np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little')
+    )
+
+
+class BitmapIndex:
+    """The tag and ingredient bitmaps of one user's recipes"""
+
+    def __init__(self, rows):
+        """Build the index from (recipe_id, target_id, field_name) rows"""
+        self.recipe_ids = []
+        self.positions = {}
+        # recipe id -> bit, and the other way around
+        self.id_array = None
+        # recipe_ids as an array, made again after recipes are added
+        by_target = {field_name: {} for field_name in RELATIONS}
+        for recipe_id, target_id, field_name in rows:
+            by_target[field_name].setdefault(target_id, []).append(
+                self.position(recipe_id)
+            )
+        self.bitmaps = {
+            field_name: {
+                target_id: to_bitmap(positions)
+                for target_id, positions in targets.items()
+            }
+            for field_name, targets in by_target.items()
+        }
+
+    def position(self, recipe_id):
+        """Return the bit of a recipe, numbering it if it's new"""
+        position = self.positions.get(recipe_id)
+        if position is None:
+            position = self.positions[recipe_id] = len(self.recipe_ids)
+            self.recipe_ids.append(recipe_id)
+            self.id_array = None
+        return position
+
+    def match(self, field_name, target_ids, match_all=False):
+        """Return the bitmap of the recipes with any or all of the ids"""
+        bitmaps = [
+            self.bitmaps[field_name].get(target_id, 0)
+            for target_id in set(target_ids)
+        ]
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result = result & bitmap if match_all else result | bitmap
+        return result
+
+    def recipe_ids_of(self, bitmap):
+        """Return the recipe ids of the set bits of a bitmap"""
+        id_array = self.id_array
+        if id_array is None:
+            id_array = self.id_array = np.array(
+                self.recipe_ids, dtype=np.int64
+            )
+        return id_array[from_bitmap(bitmap)].tolist()
+
+    def update(self, current, recipe_ids):
+        """Replace the relations of the recipes with the current ones
+
+        current is the result of current_relation_ids() for the recipes.
+        """
+        for recipe_id in recipe_ids:
+            bit = 1 << self.position(recipe_id)
+            for field_name in RELATIONS:
+                bitmaps = self.bitmaps[field_name]
+                new = current[field_name][recipe_id]
+                for target_id in list(bitmaps):
+                    if target_id not in new and bitmaps[target_id] & bit:
+                        bitmaps[target_id] ^= bit
+                for target_id in new:
+                    bitmaps[target_id] = bitmaps.get(target_id, 0) | bit
+
+    def remove_target(self, field_name, target_id):
+        """Forget a deleted tag or ingredient"""
+        self.bitmaps[field_name].pop(target_id, None)
+
+    def size(self):
+        """Return roughly how many bytes the index takes up"""
+        bitmaps = [
+            bitmap for targets in self.bitmaps.values()
+            for bitmap in targets.values()
+        ]
+        return (
+            sys.getsizeof(self.recipe_ids) + 100 * len(self.positions) +
+            sum(sys.getsizeof(bitmap) + 100 for bitmap in bitmaps)
+        )
+        # 100 bytes covers the dict entry and the int objects of a key
+
+
+def load_rows(user_id):
+    """Return (recipe_id, target_id, field_name) of a user's relations"""
+    queries = []
+    for number, field_name in enumerate(RELATIONS):
+        through, target, column = get_relation(field_name)
+        queries.append(
+            through.objects.filter(recipe__user_id=user_id).annotate(
+                relation=Value(number, output_field=IntegerField())
+            ).values_list('recipe_id', column + '_id', 'relation')
+        )
+    query = queries[0].union(*queries[1:], all=True).order_by('recipe_id')
+    # numbered in id order, so the bitmaps come out in that order too
+    return (
+        (recipe_id, target_id, RELATIONS[number])
+        for recipe_id, target_id, number in query
+    )
+
+
+_indexes = OrderedDict()
+# user id -> (data version, index, size), the most recently used last
+_lock = threading.Lock()
+
+
+def evict():
+    """Drop the least recently used indexes until within the budget"""
+    total = sum(size for version, index, size in _indexes.values())
+    while len(_indexes) > 1 and total > settings.RECIPE_BITMAP_INDEX_MEMORY:
+        version, index, size = _indexes.popitem(last=False)[1]
+        total -= size
+
+
+def get_index(user_id):
+    """Return the bitmap index of a user's recipes"""
+    version = get_user_version(user_id)
+    with _lock:
+        entry = _indexes.get(user_id)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(user_id)
+            return entry[1]
+
+    index = BitmapIndex(load_rows(user_id))
+    with _lock:
+        _indexes[user_id] = (version, index, index.size())
+        _indexes.move_to_end(user_id)
+        evict()
+    return index
+
+
+def filter_recipe_ids(user_id, filters, match_all=False):
+    """Return the ids of the user's recipes matching the filters
+
+    filters maps field names to target ids, a recipe has to match every
+    field, and any (or with match_all, all) of the ids of each.
+    """
+    index = get_index(user_id)
+    result = None
+    for field_name, target_ids in filters.items():
+        bitmap = index.match(field_name, target_ids, match_all)
+        result = bitmap if result is None else result & bitmap
+    return index.recipe_ids_of(result)
+
+
+class PendingBitmapUpdate:
+    """Changes to a user's index to apply when the transaction commits"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.recipe_ids = set()
+        self.removed_targets = set()
+
+    def flush(self):
+        with _lock:
+            entry = _indexes.get(self.user_id)
+        if entry is None:
+            return
+        recipe_ids, self.recipe_ids = self.recipe_ids, set()
+        removed_targets, self.removed_targets = self.removed_targets, set()
+        if not recipe_ids and not removed_targets:
+            return
+            # applied by an earlier call of the same commit
+        current = {field_name: {} for field_name in RELATIONS}
+        if recipe_ids:
+            current = current_relation_ids(list(recipe_ids))
+            # read before taking the lock, it's only held for the update
+        removed_targets = deleted_targets(removed_targets)
+        with _lock:
+            if _indexes.get(self.user_id) is not entry:
+                return
+                # rebuilt or evicted in the meantime
+            version, index, size = entry
+            index.update(current, recipe_ids)
+            for field_name, target_id in removed_targets:
+                index.remove_target(field_name, target_id)
+            _indexes[self.user_id] = (version, index, index.size())
+            # still stamped with the version it was loaded with, a change
+            # another process commits only shows up as a new version
+            evict()
+
+
+def deleted_targets(targets):
+    """Return the (field_name, target_id) pairs that no longer exist"""
+    existing = set()
+    for field_name in RELATIONS:
+        target_ids = [
+            target_id for name, target_id in targets if name == field_name
+        ]
+        if target_ids:
+            through, target, column = get_relation(field_name)
+            existing.update(
+                (field_name, target_id) for target_id in
+                target.objects.filter(
+                    id__in=target_ids
+                ).values_list('id', flat=True)
+            )
+    return targets - existing
+    # a delete left over from a rolled back transaction didn't happen
+
+
+def schedule_bitmap_update(user_id, recipe_ids=(), removed_target=None):
+    """Patch a user's loaded index once the current transaction commits
+
+    removed_target is a (field_name, target_id) of a deleted tag or
+    ingredient.
+    """
+    if not settings.RECIPE_BITMAP_INDEX or user_id not in _indexes:
+        return
+        # nothing loaded, it's built from the database when needed
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        update = PendingBitmapUpdate(user_id)
+    else:
+        updates = getattr(connection, 'pending_bitmap_updates', {})
+        update = updates.get(user_id)
+        if update is None:
+            update = updates[user_id] = PendingBitmapUpdate(user_id)
+            connection.pending_bitmap_updates = updates
+        transaction.on_commit(update.flush)
+        # registered again for every change, as a rolled back transaction
+        # drops the earlier registrations. The changes are applied by the
+        # first call, and anything left over from a rolled back one is
+        # checked against the database
+    update.recipe_ids.update(recipe_ids)
+    if removed_target is not None:
+        update.removed_targets.add(removed_target)
+    if not connection.in_atomic_block:
+        update.flush()
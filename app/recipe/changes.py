@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+
+from .serializers import IngredientSerializer, RecipeSerializer, \
+    TagSerializer
+
+# What changed in a user's library since a client last synced.
+#
+# Every tag, ingredient and recipe has an updated_at, and a deleted one
+# leaves a Tombstone. Together they form one feed of changes ordered by
+# (time, stream, id), and the cursor a client gets back is the position
+# of the last change it was sent. Each stream is read from its
+# (user, updated_at, id) index starting right after that position, so a
+# sync costs about the same however large the library is.
+#
+# Timestamps are taken when an object is saved, not when its transaction
+# commits, so a slow transaction can commit a change with a time before
+# changes that were already handed out. Changes younger than
+# CHANGES_SETTLE_TIME are held back until a later sync for that reason.
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+STREAMS = (
+    ('tags', Tag, 'updated_at', TagSerializer),
+    ('ingredients', Ingredient, 'updated_at', IngredientSerializer),
+    ('recipes', Recipe, 'updated_at', RecipeSerializer),
+    ('deleted', Tombstone, 'deleted_at', None),
+)
+# tags and ingredients come before the recipes changed at the same time,
+# so a client applying a page in order has them before they're used
+
+
+def to_micros(value):
+    """Return a datetime as microseconds since the epoch"""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    """Return the datetime of microseconds since the epoch"""
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def encode_cursor(position):
+    """Return the cursor of a (time, stream, id) position"""
+    moment, stream, pk = position
+    return f'{to_micros(moment)}.{stream}.{pk}'
+
+
+def decode_cursor(cursor):
+    """Return the (time, stream, id) position of a cursor
+
+    Raises ValueError if the cursor isn't one we handed out.
+    """
+    micros, stream, pk = (int(part) for part in cursor.split('.'))
+    if not 0 <= stream < len(STREAMS):
+        raise ValueError('Unknown stream')
+    try:
+        moment = from_micros(micros)
+    except OverflowError:
+        raise ValueError('Time out of range')
+    return moment, stream, pk
+
+
+def after(time_field, stream, position):
+    """Return the filter for a stream's changes after the position"""
+    moment, last_stream, last_pk = position
+    if stream < last_stream:
+        return Q(**{time_field + '__gt': moment})
+    if stream > last_stream:
+        return Q(**{time_field + '__gte': moment})
+    return (
+        Q(**{time_field + '__gt': moment}) |
+        Q(**{time_field: moment, 'id__gt': last_pk})
+    )
+
+
+def read_changes(user, position, limit):
+    """Return up to limit (position, obj) changes after the position,
+    and whether there are more"""
+    until = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_TIME)
+    changes = []
+    for stream, (name, model, time_field, serializer) in enumerate(STREAMS):
+        queryset = model.objects.filter(
+            user=user, **{time_field + '__lte': until}
+        )
+        if position is not None:
+            queryset = queryset.filter(after(time_field, stream, position))
+        if model is Recipe:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        for obj in queryset.order_by(time_field, 'id')[:limit + 1]:
+            changes.append(((getattr(obj, time_field), stream, obj.pk), obj))
+        # each stream reads at most one more than a page, whichever
+        # come first across all of them make up the page
+    changes.sort(key=lambda change: change[0])
+    return changes[:limit], len(changes) > limit
+
+
+def get_changes(user, position=None, limit=None, context=None):
+    """Return a page of the changes after the position, or from the
+    start without one"""
+    changes, more = read_changes(
+        user, position, limit or settings.CHANGES_PAGE_SIZE
+    )
+
+    objects = {name: [] for name, model, time_field, ser in STREAMS}
+    for (moment, stream, pk), obj in changes:
+        objects[STREAMS[stream][0]].append(obj)
+
+    result = {}
+    for name, model, time_field, serializer in STREAMS[:-1]:
+        result[name] = serializer(
+            objects[name], many=True, context=context
+        ).data
+    deleted = {name: [] for name, model, time_field, ser in STREAMS[:-1]}
+    for tombstone in objects['deleted']:
+        deleted[tombstone.model + 's'].append(tombstone.object_id)
+    result['deleted'] = deleted
+
+    if changes:
+        position = changes[-1][0]
+    result['cursor'] = encode_cursor(position) if position else None
+    # unchanged when there was nothing new
+    result['more'] = more
+    return result
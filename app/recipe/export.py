@@ -0,0 +1,81 @@
+import csv
+from collections import defaultdict
+
+from core.models import Recipe
+
+from .streaming import dumps, iter_chunks
+
+# Bulk export of a user's recipes. The recipes are read in chunks from a
+# server side cursor and the tag and ingredient names for a chunk are
+# looked up together, so every chunk costs one query per relation no
+# matter how many recipes it holds.
+
+EXPORT_FIELDS = ('id', 'title', 'time_minutes', 'price', 'link', 'image')
+
+
+def related_names(through, field_name, recipe_ids, using=None):
+    """Return the names related to each recipe through a through table"""
+    names = defaultdict(list)
+    rows = through.objects.using(using).filter(
+        recipe_id__in=recipe_ids
+    ).order_by(f'{field_name}__name').values_list(
+        'recipe_id', f'{field_name}__name'
+    )
+    for recipe_id, name in rows:
+        names[recipe_id].append(name)
+    return names
+
+
+def iter_export_chunks(queryset, chunk_size):
+    """Yield lists of recipe rows with their tag and ingredient names"""
+    rows = queryset.prefetch_related(None).values(*EXPORT_FIELDS)
+    for chunk in iter_chunks(rows, chunk_size):
+        recipe_ids = [row['id'] for row in chunk]
+        tags = related_names(
+            Recipe.tags.through, 'tag', recipe_ids, queryset.db
+        )
+        ingredients = related_names(
+            Recipe.ingredients.through, 'ingredient', recipe_ids, queryset.db
+        )
+        for row in chunk:
+            row['price'] = str(row['price'])
+            row['image'] = row['image'] or ''
+            row['tags'] = tags.get(row['id'], [])
+            row['ingredients'] = ingredients.get(row['id'], [])
+        yield chunk
+
+
+def ndjson_lines(chunks):
+    """Yield the rows as newline delimited JSON, a chunk at a time"""
+    for chunk in chunks:
+        yield ''.join(dumps(row) + '\n' for row in chunk)
+
+
+class Echo:
+    """File-like object that returns what is written instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(chunks):
+    """Yield the rows as CSV, a chunk at a time"""
+    writer = csv.writer(Echo())
+    # the writer hands every formatted line straight back to us
+    columns = EXPORT_FIELDS + ('tags', 'ingredients')
+    yield writer.writerow(columns)
+    for chunk in chunks:
+        yield ''.join(
+            writer.writerow([
+                '|'.join(row[column]) if column in ('tags', 'ingredients')
+                else row[column]
+                for column in columns
+            ])
+            for row in chunk
+        )
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
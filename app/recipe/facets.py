@@ -0,0 +1,102 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, Q, Value
+
+from core.versions import get_user_version
+
+from .relations import RELATIONS, get_relation
+
+# Counts for the filter sidebar: how many of the recipes matching the
+# current filters have each tag and ingredient, and fall in each price
+# and time bucket.
+#
+# The tag and ingredient counts come from one UNION ALL of two GROUP BY
+# queries over the through tables, and all of the bucket counts from
+# one aggregate with a filtered COUNT per bucket, so it's two queries
+# however many values there are. The result is cached under the user's
+# data version and the SQL of the filtered recipes.
+
+RANGE_FACETS = {
+    'price': 'RECIPE_PRICE_FACETS',
+    'time_minutes': 'RECIPE_TIME_FACETS',
+}
+# the field and the setting holding the bucket boundaries
+
+
+def get_buckets(field_name):
+    """Return the (min, max) of the buckets of a field, max is None for
+    the last one"""
+    bounds = getattr(settings, RANGE_FACETS[field_name])
+    lows = [0] + list(bounds)
+    highs = list(bounds) + [None]
+    return list(zip(lows, highs))
+
+
+def cache_key(user_id, recipe_ids):
+    """Return the cache key of the facets of a recipe query"""
+    digest = hashlib.md5(str(recipe_ids.query).encode()).hexdigest()
+    return f'recipe-facets:{user_id}:{get_user_version(user_id)}:{digest}'
+
+
+def count_relations(recipe_ids):
+    """Return {field_name: [{'id', 'count'}]} of the recipes' relations"""
+    queries = []
+    for number, field_name in enumerate(RELATIONS):
+        through, target, column = get_relation(field_name)
+        queries.append(
+            through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values(column + '_id').annotate(
+                count=Count('recipe_id'),
+                relation=Value(number, output_field=IntegerField())
+            ).values_list(column + '_id', 'count', 'relation').order_by()
+        )
+    query = queries[0].union(*queries[1:], all=True)
+
+    counts = {field_name: [] for field_name in RELATIONS}
+    for target_id, count, number in query:
+        counts[RELATIONS[number]].append({'id': target_id, 'count': count})
+    for values in counts.values():
+        values.sort(key=lambda value: (-value['count'], value['id']))
+    return counts
+
+
+def count_ranges(queryset):
+    """Return {field_name: [{'min', 'max', 'count'}]} of the buckets"""
+    aggregates = {}
+    for field_name in RANGE_FACETS:
+        for number, (low, high) in enumerate(get_buckets(field_name)):
+            condition = Q(**{field_name + '__gte': low})
+            if high is not None:
+                condition &= Q(**{field_name + '__lt': high})
+            aggregates[f'{field_name}_{number}'] = Count(
+                'id', filter=condition
+            )
+    totals = queryset.order_by().aggregate(**aggregates)
+    # COUNT(id) FILTER (WHERE ...) for each bucket, in a single scan
+
+    return {
+        field_name: [
+            {
+                'min': low,
+                'max': high,
+                'count': totals[f'{field_name}_{number}'],
+            }
+            for number, (low, high) in enumerate(get_buckets(field_name))
+        ]
+        for field_name in RANGE_FACETS
+    }
+
+
+def get_facets(user, queryset):
+    """Return the facet counts of the filtered recipes, cached"""
+    recipe_ids = queryset.order_by().values('id')
+    key = cache_key(user.pk, recipe_ids)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_relations(recipe_ids)
+        facets.update(count_ranges(queryset))
+        cache.set(key, facets, settings.RECIPE_FACETS_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,181 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+
+from core.models import Tag, Ingredient, Recipe, RecipeImport
+from core.versions import bump_user_version
+
+from .relations import add_relations
+from .serializers import RecipeImportRowSerializer
+
+# Bulk import of recipes. The input is read a chunk of rows at a time;
+# each chunk is validated together, its tags and ingredients are looked
+# up by name in an in-memory map (and created when missing), and the
+# recipes and through table rows are written with bulk inserts. Each
+# chunk is committed together with the checkpoint, so an import that
+# fails part way can be resumed without importing anything twice.
+
+MAX_ERRORS = 100
+# only the first errors are kept, the rest are just counted
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+
+
+def guess_format(filename):
+    """Guess the import format from a file name"""
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+def read_rows(lines, format):
+    """Yield the raw rows of the input as dicts"""
+    if format == 'csv':
+        for row in csv.DictReader(lines):
+            for field_name in ('tags', 'ingredients'):
+                value = row.get(field_name) or ''
+                row[field_name] = [name for name in value.split('|') if name]
+            # lists are written as | separated names, like the export
+            yield row
+        return
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+            # still counts as a row so the checkpoint stays right
+
+
+class RecipeImporter:
+    """Import recipes for the user of a RecipeImport"""
+
+    def __init__(self, recipe_import, chunk_size=1000):
+        self.recipe_import = recipe_import
+        self.user = recipe_import.user
+        self.chunk_size = chunk_size
+        self.names = {}
+        # model -> {name: id}, loaded once per import
+
+    def get_names(self, model):
+        """Return the name -> id map of the user's objects"""
+        if model not in self.names:
+            self.names[model] = dict(
+                model.objects.filter(user=self.user).values_list('name', 'id')
+            )
+        return self.names[model]
+
+    def resolve(self, model, rows, field_name):
+        """Return the ids for the names in the rows, creating missing ones"""
+        names = self.get_names(model)
+        missing = {
+            name
+            for row in rows
+            for name in row[field_name]
+            if name not in names
+        }
+        if missing:
+            created = model.objects.bulk_create([
+                model(user=self.user, name=name) for name in sorted(missing)
+            ])
+            # postgres hands back the ids of the new rows
+            names.update((obj.name, obj.id) for obj in created)
+        return names
+
+    def run(self, lines):
+        """Import the rows, skipping those done by a previous attempt"""
+        recipe_import = self.recipe_import
+        RecipeImport.objects.filter(pk=recipe_import.pk).update(
+            status=RecipeImport.RUNNING
+        )
+        rows = read_rows(lines, recipe_import.format)
+        rows = islice(rows, recipe_import.rows_done, None)
+        # the checkpoint: rows before it were committed already
+
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+        except Exception:
+            RecipeImport.objects.filter(pk=recipe_import.pk).update(
+                status=RecipeImport.FAILED
+            )
+            raise
+
+        RecipeImport.objects.filter(pk=recipe_import.pk).update(
+            status=RecipeImport.DONE
+        )
+        recipe_import.refresh_from_db()
+        return recipe_import
+
+    def import_chunk(self, chunk):
+        """Validate and insert one chunk of rows in a single transaction"""
+        recipe_import = self.recipe_import
+        first_row = recipe_import.rows_done
+        valid = []
+        errors = []
+        for number, row in enumerate(chunk, start=first_row + 1):
+            serializer = RecipeImportRowSerializer(data=row)
+            if row is not None and serializer.is_valid():
+                valid.append(serializer.validated_data)
+            else:
+                errors.append({
+                    'row': number,
+                    'errors': serializer.errors if row is not None
+                    else {'non_field_errors': ['Invalid JSON.']},
+                })
+
+        with transaction.atomic():
+            created = self.insert(valid)
+            keep = max(0, MAX_ERRORS - len(recipe_import.errors))
+            recipe_import.errors = recipe_import.errors + errors[:keep]
+            RecipeImport.objects.filter(pk=recipe_import.pk).update(
+                rows_done=F('rows_done') + len(chunk),
+                recipes_created=F('recipes_created') + created,
+                error_count=F('error_count') + len(errors),
+                errors=recipe_import.errors,
+            )
+            # the checkpoint moves in the same transaction as the
+            # inserts, so the two can't get out of step
+            if created:
+                bump_user_version(self.user.pk)
+                # bulk_create doesn't send post_save
+
+        recipe_import.rows_done += len(chunk)
+
+    def insert(self, rows):
+        """Bulk insert the validated rows and their relations"""
+        if not rows:
+            return 0
+        tag_ids = self.resolve(Tag, rows, 'tags')
+        ingredient_ids = self.resolve(Ingredient, rows, 'ingredients')
+
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                user=self.user,
+                title=row['title'],
+                time_minutes=row['time_minutes'],
+                price=row['price'],
+                link=row['link'],
+            )
+            for row in rows
+        ])
+
+        for field_name, ids in (('tags', tag_ids),
+                                ('ingredients', ingredient_ids)):
+            pairs = {
+                (recipe.id, ids[name])
+                for recipe, row in zip(recipes, rows)
+                for name in row[field_name]
+            }
+            add_relations(field_name, pairs, self.user.pk)
+
+        return len(recipes)
@@ -0,0 +1,11 @@
+from core.jobs import job
+from core.models import Recipe
+from core.purge import purge_recipes
+
+
+@job('recipe.purge_deleted')
+def purge_deleted(user_id):
+    """Remove the rows and images of a user's deleted recipes"""
+    purge_recipes(
+        user_id, Recipe.all_objects.filter(deleted_at__isnull=False)
+    )
@@ -0,0 +1,105 @@
+import itertools
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from recipe.mealplan import greedy_plan, plan_meals
+
+# Measures the meal planner on made up recipe libraries: how long a plan
+# takes, and how its score compares with picking the best liked recipes
+# that still fit. On a small library it's also checked against trying
+# every combination.
+
+
+def make_library(count, random):
+    """Return (prices, times, scores) of made up recipes"""
+    prices = np.round(random.gamma(3, 3, count) + 1, 2)
+    times = random.randint(5, 120, count).astype(np.float64)
+    scores = random.poisson(1, count).astype(np.float64)
+    return prices, times, scores
+
+
+def score_of(plan, scores):
+    """Return the score of a plan, or None if there isn't one"""
+    return None if plan is None else float(scores[plan].sum())
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the meal planner"""
+    help = 'Benchmark latency and plan quality of the meal planner'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, nargs='+', default=[10000, 50000]
+        )
+        parser.add_argument('--meals', type=int, default=7)
+        parser.add_argument('--max-price', type=float, default=60)
+        parser.add_argument('--max-time', type=float, default=300)
+        parser.add_argument('--time-budget', type=float, default=0.5)
+        parser.add_argument('--candidates', type=int, default=300)
+        parser.add_argument('--runs', type=int, default=20)
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        random = np.random.RandomState(0)
+        meals = options['meals']
+        budgets = (options['max_price'], options['max_time'])
+
+        for count in options['recipes']:
+            latencies = []
+            gains = []
+            incomplete = greedy_failed = 0
+            for _ in range(options['runs']):
+                prices, times, scores = make_library(count, random)
+                start = time.perf_counter()
+                plan, complete = plan_meals(
+                    prices, times, scores, meals, *budgets,
+                    options['time_budget'], options['candidates']
+                )
+                latencies.append(time.perf_counter() - start)
+                incomplete += not complete
+                greedy = greedy_plan(
+                    prices, times, scores, meals, *budgets
+                )
+                if greedy is None:
+                    greedy_failed += 1
+                else:
+                    gains.append(
+                        score_of(plan, scores) - score_of(greedy, scores)
+                    )
+            self.stdout.write(
+                f'{count} recipes, {meals} meals: '
+                f'median {np.median(latencies) * 1000:.1f}ms, '
+                f'max {max(latencies) * 1000:.1f}ms, '
+                f'{incomplete} of {options["runs"]} out of time, '
+                f'score {np.mean(gains):+.2f} over greedy on average, '
+                f'greedy found no plan {greedy_failed} times'
+            )
+
+        self.check_exact(random, options)
+
+    def check_exact(self, random, options):
+        """Compare with the best plan found by trying every combination"""
+        meals = 3
+        matched = 0
+        runs = options['runs']
+        for _ in range(runs):
+            prices, times, scores = make_library(25, random)
+            max_price, max_time = 25.0, 120.0
+            best = None
+            for plan in itertools.combinations(range(25), meals):
+                plan = list(plan)
+                if (prices[plan].sum() <= max_price and
+                        times[plan].sum() <= max_time):
+                    score = scores[plan].sum()
+                    if best is None or score > best:
+                        best = score
+            plan, _ = plan_meals(
+                prices, times, scores, meals, max_price, max_time, 1.0
+            )
+            matched += score_of(plan, scores) == best
+        self.stdout.write(
+            f'exact: {matched} of {runs} plans of {meals} out of 25 recipes '
+            f'score as high as the best combination'
+        )
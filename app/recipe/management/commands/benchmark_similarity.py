@@ -0,0 +1,109 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from recipe.similarity import RERANK_FACTOR, RERANK_MIN, SimilarityIndex, \
+    jaccard_rerank, minhash_many
+
+# Measures the similar recipe index on made up recipes: how many of the
+# true top k recipes (by exact Jaccard similarity) it finds, and how long
+# a lookup takes compared with scoring every recipe exactly.
+
+
+def make_recipes(count, vocabulary, styles, random):
+    """Return token arrays of recipes that vary a handful of styles"""
+    bases = [
+        random.choice(vocabulary, random.randint(6, 14), replace=False)
+        for _ in range(styles)
+    ]
+    recipes = []
+    for _ in range(count):
+        base = bases[random.randint(styles)]
+        keep = base[random.rand(len(base)) < 0.7]
+        extra = random.choice(vocabulary, random.randint(1, 5))
+        recipes.append(np.unique(np.concatenate([keep, extra])))
+    return recipes
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the similar recipe index"""
+    help = 'Benchmark recall and latency of the similar recipe index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--vocabulary', type=int, default=600)
+        parser.add_argument('--styles', type=int, default=400)
+        parser.add_argument('--queries', type=int, default=300)
+        parser.add_argument('--k', type=int, default=10)
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        random = np.random.RandomState(0)
+        k = options['k']
+        recipes = make_recipes(
+            options['recipes'], np.arange(options['vocabulary']),
+            options['styles'], random
+        )
+
+        start = time.perf_counter()
+        signatures = minhash_many(recipes)
+        hashed = time.perf_counter() - start
+        start = time.perf_counter()
+        index = SimilarityIndex(np.arange(len(recipes)), signatures)
+        built = time.perf_counter() - start
+
+        matrix = np.zeros((len(recipes), options['vocabulary']), dtype=bool)
+        for row, tokens in enumerate(recipes):
+            matrix[row, tokens] = True
+        sizes = matrix.sum(axis=1)
+        matrix = matrix.astype(np.float32)
+
+        token_sets = [set(tokens.tolist()) for tokens in recipes]
+        shortlist_size = max(k * RERANK_FACTOR, RERANK_MIN)
+        estimate_recalls = []
+        recalls = []
+        lsh_time = exact_time = 0
+        for query in random.choice(len(recipes), options['queries']):
+            start = time.perf_counter()
+            shortlist = index.similar(query, shortlist_size)
+            found = jaccard_rerank(
+                token_sets[query],
+                {pk: token_sets[pk] for pk, _ in shortlist},
+                k
+            )
+            lsh_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            shared = matrix @ matrix[query]
+            exact = shared / (sizes + sizes[query] - shared)
+            exact[query] = -1
+            best = np.argsort(-exact)[:k]
+            exact_time += time.perf_counter() - start
+
+            cutoff = exact[best[-1]]
+            hits = sum(1 for pk, _ in found if exact[pk] >= cutoff)
+            # ties with the k-th best count as hits
+            recalls.append(hits / k)
+            estimated = sum(
+                1 for pk, _ in shortlist[:k] if exact[pk] >= cutoff
+            )
+            estimate_recalls.append(estimated / k)
+
+        queries = options['queries']
+        self.stdout.write(f'{len(recipes)} recipes, top {k}')
+        self.stdout.write(f'hashing:        {hashed * 1000:.1f}ms')
+        self.stdout.write(f'building index: {built * 1000:.1f}ms')
+        self.stdout.write(
+            f'stored size:    {signatures.nbytes / len(recipes):.0f} bytes '
+            f'per recipe'
+        )
+        self.stdout.write(
+            f'recall@{k}:      {np.mean(recalls):.3f} '
+            f'({np.mean(estimate_recalls):.3f} without exact reranking)'
+        )
+        self.stdout.write(
+            f'lookup:         {lsh_time / queries * 1000:.3f}ms with the '
+            f'index and reranking, {exact_time / queries * 1000:.3f}ms '
+            f'scoring all'
+        )
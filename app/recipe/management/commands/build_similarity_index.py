@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe.similarity import update_signatures
+
+
+class Command(BaseCommand):
+    """Django command to hash every recipe for the similar recipes"""
+    help = 'Compute the similarity signatures of all recipes in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of recipes to hash per transaction'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        last_pk = 0
+        total = 0
+        while True:
+            pks = list(
+                Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not pks:
+                break
+            update_signatures(pks)
+            total += len(pks)
+            last_pk = pks[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Hashed {total} recipes!'))
@@ -0,0 +1,56 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import RecipeImport
+from recipe.importer import IMPORT_FORMATS, RecipeImporter, guess_format
+
+
+class Command(BaseCommand):
+    """Django command to import recipes from an NDJSON or CSV file"""
+    help = 'Import recipes for a user from an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to import for')
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=IMPORT_FORMATS)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--resume', type=int, metavar='IMPORT_ID',
+            help='Continue an import that stopped part way'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('No user with that email')
+
+        if options['resume']:
+            try:
+                recipe_import = RecipeImport.objects.get(
+                    pk=options['resume'], user=user
+                )
+            except RecipeImport.DoesNotExist:
+                raise CommandError('No import with that id for the user')
+            self.stdout.write(
+                f'Resuming after row {recipe_import.rows_done}...'
+            )
+        else:
+            recipe_import = RecipeImport.objects.create(
+                user=user,
+                source=os.path.basename(options['path']),
+                format=options['format'] or guess_format(options['path']),
+            )
+
+        importer = RecipeImporter(recipe_import, options['chunk_size'])
+        with open(options['path'], encoding='utf-8', newline='') as lines:
+            # the file is read line by line, never loaded as a whole
+            recipe_import = importer.run(lines)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Import {recipe_import.pk}: {recipe_import.recipes_created} '
+            f'recipes created, {recipe_import.error_count} invalid rows'
+        ))
@@ -0,0 +1,155 @@
+import time
+
+import numpy as np
+
+from core.models import Recipe
+
+# Meal plans: pick a given number of distinct recipes whose prices and
+# cooking times add up to no more than the budgets, scoring as high as
+# possible on the user's tag preferences.
+#
+# This is a knapsack problem with two budgets and a fixed item count.
+# It's solved with dynamic programming over the number of meals and the
+# price and time budgets cut into buckets. Each recipe is one vectorised
+# update of the whole (meals, price, time) table, so the work per recipe
+# doesn't depend on Python loops. Prices and times are rounded up to
+# whole buckets, so a plan never goes over budget, though one that only
+# just fits can be missed.
+#
+# Only the most promising recipes go into the table, and the search
+# stops when its time budget runs out, returning the best plan among the
+# recipes it got through.
+
+PRICE_BUCKETS = 64
+TIME_BUCKETS = 48
+
+
+def pick_candidates(prices, times, scores, max_price, max_time, limit):
+    """Return the indexes of the recipes worth planning with"""
+    fits = np.flatnonzero((prices <= max_price) & (times <= max_time))
+    if len(fits) <= limit:
+        return fits
+    cost = prices[fits] / max_price + times[fits] / max_time
+    by_score = fits[np.lexsort((cost, -scores[fits]))[:limit // 2]]
+    by_value = fits[np.argsort(-(scores[fits] + 1) / (cost + 0.01))]
+    # the best liked recipes, and the ones that give the most for their
+    # price and time, so cheap filler is there when the budget is tight
+    chosen = dict.fromkeys(by_score.tolist())
+    for index in by_value.tolist():
+        if len(chosen) >= limit:
+            break
+        chosen.setdefault(index)
+    return np.array(list(chosen))
+
+
+def greedy_plan(prices, times, scores, meals, max_price, max_time):
+    """Return a plan of the best scoring recipes that still fit, or None"""
+    plan = []
+    price = spent_time = 0
+    cheapest = np.sort(prices)
+    fastest = np.sort(times)
+    for index in np.lexsort((prices + times, -scores)):
+        left = meals - len(plan) - 1
+        if (price + prices[index] + cheapest[:left].sum() <= max_price and
+                spent_time + times[index] + fastest[:left].sum()
+                <= max_time):
+            # leave room for the rest of the meals at the cheapest and
+            # fastest, which is optimistic but keeps it from painting
+            # itself into a corner too early
+            plan.append(index)
+            price += prices[index]
+            spent_time += times[index]
+            if len(plan) == meals:
+                return plan
+    return None
+
+
+def plan_meals(prices, times, scores, meals, max_price, max_time,
+               time_budget, candidates=300):
+    """Return (indexes of the planned recipes or None, complete)
+
+    complete is False when the time budget ran out before every
+    candidate was considered.
+    """
+    deadline = time.monotonic() + time_budget
+    prices = np.asarray(prices, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    chosen = pick_candidates(
+        prices, times, scores, max_price, max_time, candidates
+    )
+    if len(chosen) < meals:
+        return None, True
+
+    price_step = max_price / (PRICE_BUCKETS - 1)
+    time_step = max_time / (TIME_BUCKETS - 1)
+    price_cost = np.ceil(prices[chosen] / price_step - 1e-9).astype(int)
+    time_cost = np.ceil(times[chosen] / time_step - 1e-9).astype(int)
+
+    table = np.full((meals + 1, PRICE_BUCKETS, TIME_BUCKETS), -np.inf)
+    table[0] = 0
+    # table[n, p, t]: best score of n meals within p price and t time
+    # buckets
+    taken = []
+    complete = True
+    for n, index in enumerate(chosen):
+        if time.monotonic() > deadline:
+            complete = False
+            break
+        p, t = price_cost[n], time_cost[n]
+        new = (
+            table[:-1, :PRICE_BUCKETS - p, :TIME_BUCKETS - t] + scores[index]
+        )
+        old = table[1:, p:, t:]
+        better = new > old
+        old[better] = new[better]
+        # new was computed from the table before this recipe, so it is
+        # used at most once
+        take = np.zeros(table.shape, dtype=bool)
+        take[1:, p:, t:] = better
+        taken.append(take)
+
+    if not np.isfinite(table[meals, -1, -1]):
+        plan = greedy_plan(
+            prices[chosen], times[chosen], scores[chosen],
+            meals, max_price, max_time
+        )
+        if plan is None:
+            return None, complete
+        return [int(chosen[n]) for n in plan], complete
+
+    plan = []
+    left, p, t = meals, PRICE_BUCKETS - 1, TIME_BUCKETS - 1
+    for n in reversed(range(len(taken))):
+        if taken[n][left, p, t]:
+            plan.append(int(chosen[n]))
+            left -= 1
+            p -= price_cost[n]
+            t -= time_cost[n]
+    return plan[::-1], complete
+
+
+def load_recipes(user, max_price, max_time, preferences):
+    """Return (ids, prices, times, scores) of the recipes within budget
+
+    preferences maps tag ids to weights, a recipe scores the sum of the
+    weights of its tags.
+    """
+    rows = list(
+        Recipe.objects.filter(
+            user=user, price__lte=max_price, time_minutes__lte=max_time
+        ).order_by('id').values_list('id', 'price', 'time_minutes')
+    )
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    prices = np.array([float(row[1]) for row in rows])
+    times = np.array([row[2] for row in rows], dtype=np.float64)
+    scores = np.zeros(len(rows))
+    if preferences:
+        positions = {pk: n for n, pk in enumerate(ids.tolist())}
+        pairs = Recipe.tags.through.objects.filter(
+            recipe__user=user, tag_id__in=preferences
+        ).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in pairs:
+            if recipe_id in positions:
+                scores[positions[recipe_id]] += preferences[tag_id]
+    return ids, prices, times, scores
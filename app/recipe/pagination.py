@@ -0,0 +1,162 @@
+from base64 import b64decode
+from urllib import parse
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import BooleanField, F, Func, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+# Keyset pagination for the recipe list. It's opt-in: the list is only
+# paginated when ?page_size= is passed, so existing clients keep getting
+# the whole list.
+#
+# The cursor holds the values of all of the ordering columns of the last
+# recipe on the page, the id included, and the next page is read with a
+# row comparison like WHERE (time_minutes, id) > (10, 42). That starts
+# straight from the (user, time_minutes, id) index instead of skipping
+# over all of the earlier rows like OFFSET would, and as the id makes
+# every position unique, recipes sharing a time or price are never
+# skipped or repeated.
+
+
+class RowComparison(Func):
+    """Compare the columns to the values as rows, (a, b) > (x, y)"""
+    output_field = BooleanField()
+
+    def __init__(self, columns, operator, values):
+        self.operator = operator
+        super().__init__(*columns, *values)
+
+    def as_sql(self, compiler, connection):
+        parts, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            parts.append(sql)
+            params.extend(expression_params)
+        half = len(parts) // 2
+        sql = '({}) {} ({})'.format(
+            ', '.join(parts[:half]), self.operator, ', '.join(parts[half:])
+        )
+        return sql, params
+
+
+def reverse_ordering(ordering):
+    """Return the order_by() arguments for the opposite direction"""
+    return tuple(
+        name[1:] if name.startswith('-') else '-' + name
+        for name in ordering
+    )
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Cursor pagination that follows the viewset's ?ordering=
+
+    The orderings have to end on a unique column and go the same way on
+    all of their columns, which is what a row comparison compares.
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        """Return the ordering the viewset picked for the request"""
+        return view.get_ordering()
+
+    def decode_cursor(self, request):
+        """Return the Cursor passed in the request, if any"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+            # a cursor handed out for another ordering
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def get_position(self, recipe):
+        """Return the values of the ordering columns of a recipe"""
+        return [str(getattr(recipe, name.lstrip('-')))
+                for name in self.ordering]
+
+    def after_position(self, model, position, reverse):
+        """Return the filter for the rows after the position"""
+        columns, values = [], []
+        for name, value in zip(self.ordering, position):
+            field = model._meta.get_field(name.lstrip('-'))
+            try:
+                values.append(Value(field.to_python(value)))
+            except DjangoValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            columns.append(F(field.name))
+        descending = self.ordering[0].startswith('-')
+        return RowComparison(
+            columns, '<' if descending != reverse else '>', values
+        )
+        # a reverse cursor reads the rows before the position, backwards
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return a page of the recipes after (or before) the cursor"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if reverse:
+            queryset = queryset.order_by(*reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.after_position(
+                queryset.model, self.cursor.position, reverse
+            ))
+
+        results = list(queryset[:self.page_size + 1])
+        # one more than a page, to know if there is another one
+        self.page = results[:self.page_size]
+        more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next = more
+            self.has_previous = self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        """Return the link to the page after the last recipe"""
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self.get_position(self.page[-1])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def get_previous_link(self):
+        """Return the link to the page before the first recipe"""
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self.get_position(self.page[0])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=position)
+        )
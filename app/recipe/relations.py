@@ -0,0 +1,205 @@
+from collections import defaultdict
+
+from django.db import router
+from django.db.models import IntegerField, Q, Value
+from django.db.models.signals import m2m_changed
+from django.utils import timezone
+
+from core.models import Recipe
+
+# Helpers for writing many rows to the recipe through tables at once.
+# The rows are written with bulk statements, and m2m_changed is sent
+# just like recipe.tags.add() would, so the usage counters and anything
+# else listening for relation changes stays up to date.
+#
+# The signals are sent with tracked=True, which tells the receiver in
+# core/signals.py not to move updated_at of the recipes forward, one
+# signal at a time. set_relations() and change_relations() do that for
+# all of the recipes they changed with a single UPDATE instead, and the
+# importer only adds relations to recipes that it has just created.
+
+RELATIONS = ('tags', 'ingredients')
+
+
+def get_relation(field_name):
+    """Return (through model, target model, target column) of a relation"""
+    field = Recipe._meta.get_field(field_name)
+    target = field.related_model
+    return field.remote_field.through, target, target._meta.model_name
+
+
+def send_changed(field_name, action, pairs, user_id):
+    """Send m2m_changed for (recipe_id, target_id) pairs
+
+    The signals are grouped by recipe or by target object, whichever
+    needs fewer of them, e.g. adding one tag to a thousand recipes sends
+    a single signal for the tag.
+    """
+    through, target, column = get_relation(field_name)
+    by_recipe = defaultdict(set)
+    by_target = defaultdict(set)
+    for recipe_id, target_id in pairs:
+        by_recipe[recipe_id].add(target_id)
+        by_target[target_id].add(recipe_id)
+    using = router.db_for_write(through)
+
+    if len(by_recipe) <= len(by_target):
+        for recipe_id, pk_set in by_recipe.items():
+            m2m_changed.send(
+                sender=through, action=action, reverse=False,
+                instance=Recipe(pk=recipe_id, user_id=user_id),
+                model=target, pk_set=pk_set, using=using, tracked=True
+            )
+    else:
+        for target_id, pk_set in by_target.items():
+            m2m_changed.send(
+                sender=through, action=action, reverse=True,
+                instance=target(pk=target_id, user_id=user_id),
+                model=Recipe, pk_set=pk_set, using=using, tracked=True
+            )
+
+
+def add_relations(field_name, pairs, user_id):
+    """Insert (recipe_id, target_id) pairs that don't exist yet"""
+    if not pairs:
+        return
+    through, target, column = get_relation(field_name)
+    send_changed(field_name, 'pre_add', pairs, user_id)
+    through.objects.bulk_create([
+        through(recipe_id=recipe_id, **{column + '_id': target_id})
+        for recipe_id, target_id in pairs
+    ])
+    send_changed(field_name, 'post_add', pairs, user_id)
+
+
+def remove_relations(field_name, pairs, user_id):
+    """Delete the given (recipe_id, target_id) pairs"""
+    if not pairs:
+        return
+    through, target, column = get_relation(field_name)
+    by_recipe = defaultdict(set)
+    for recipe_id, target_id in pairs:
+        by_recipe[recipe_id].add(target_id)
+    condition = Q()
+    for recipe_id, target_ids in by_recipe.items():
+        condition |= Q(
+            recipe_id=recipe_id, **{column + '_id__in': target_ids}
+        )
+
+    send_changed(field_name, 'pre_remove', pairs, user_id)
+    through.objects.filter(condition).delete()
+    # a single DELETE statement for all of the pairs
+    send_changed(field_name, 'post_remove', pairs, user_id)
+
+
+def touch_recipes(recipe_ids, user_id):
+    """Mark the recipes as changed for syncing clients"""
+    if recipe_ids:
+        Recipe.objects.filter(user_id=user_id, pk__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+
+
+def current_relation_ids(recipe_ids, field_names=RELATIONS,
+                         target_ids=None):
+    """Return {field_name: {recipe_id: set of target ids}} in one query
+
+    target_ids optionally maps field names to the only target ids that
+    we're interested in, so the other rows aren't read at all.
+    """
+    queries = []
+    for number, field_name in enumerate(field_names):
+        through, target, column = get_relation(field_name)
+        query = through.objects.filter(recipe_id__in=recipe_ids)
+        if target_ids is not None:
+            query = query.filter(
+                **{column + '_id__in': target_ids[field_name]}
+            )
+        queries.append(
+            query.annotate(
+                relation=Value(number, output_field=IntegerField())
+            ).values_list('recipe_id', column + '_id', 'relation')
+        )
+    # the through tables are read with a single UNION ALL query, the
+    # extra column tells us which relation each row belongs to
+    query = queries[0].union(*queries[1:], all=True)
+
+    current = {field_name: defaultdict(set) for field_name in field_names}
+    for recipe_id, target_id, number in query:
+        current[field_names[number]][recipe_id].add(target_id)
+    return current
+
+
+def set_relations(recipe, relations):
+    """Replace relations of a recipe, only writing the rows that changed
+
+    relations maps a field name to the new list of related objects.
+    """
+    if not relations:
+        return
+    field_names = tuple(relations)
+    current = current_relation_ids([recipe.pk], field_names)
+    changed = False
+    for field_name, objs in relations.items():
+        new_ids = {obj.pk for obj in objs}
+        old_ids = current[field_name][recipe.pk]
+        remove_relations(
+            field_name,
+            [(recipe.pk, target_id) for target_id in old_ids - new_ids],
+            recipe.user_id
+        )
+        add_relations(
+            field_name,
+            [(recipe.pk, target_id) for target_id in new_ids - old_ids],
+            recipe.user_id
+        )
+        changed = changed or old_ids != new_ids
+    if changed:
+        touch_recipes([recipe.pk], recipe.user_id)
+
+
+def change_relations(recipe_ids, add, remove, user_id):
+    """Add and remove target ids on each of the recipes
+
+    add and remove map field names to target ids. Only the rows that
+    actually need adding or removing are written, and the counts of
+    those are returned as {'added': {...}, 'removed': {...}}.
+    """
+    field_names = tuple(set(add) | set(remove))
+    result = {'added': {}, 'removed': {}}
+    if not field_names:
+        return result
+    changed = set()
+    current = current_relation_ids(
+        recipe_ids, field_names,
+        target_ids={
+            field_name: set(add.get(field_name, ())) |
+            set(remove.get(field_name, ()))
+            for field_name in field_names
+        }
+    )
+    # only the rows for the ids that are being changed are read
+
+    for field_name in field_names:
+        attached = current[field_name]
+        to_add = [
+            (recipe_id, target_id)
+            for recipe_id in recipe_ids
+            for target_id in set(add.get(field_name, ()))
+            if target_id not in attached[recipe_id]
+        ]
+        to_remove = [
+            (recipe_id, target_id)
+            for recipe_id in recipe_ids
+            for target_id in set(remove.get(field_name, ()))
+            if target_id in attached[recipe_id]
+        ]
+        remove_relations(field_name, to_remove, user_id)
+        add_relations(field_name, to_add, user_id)
+        result['added'][field_name] = len(to_add)
+        result['removed'][field_name] = len(to_remove)
+        changed.update(recipe_id for recipe_id, target_id in to_add)
+        changed.update(recipe_id for recipe_id, target_id in to_remove)
+
+    touch_recipes(changed, user_id)
+    return result
@@ -1,41 +1,115 @@
 from rest_framework import serializers
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, RecipeImport
 
+from .relations import RELATIONS, set_relations
 
-class TagSerializer(serializers.ModelSerializer):
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """Model serializer that can be limited to a subset of its fields"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        # the view passes in the fields that the client asked for,
+        # everything else is dropped before we serialize anything
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class TagSerializer(DynamicFieldsModelSerializer):
     """Serializer for tag object"""
+    recipe_count = serializers.IntegerField(read_only=True)
+    # only filled in when the view annotates the queryset with
+    # the count, otherwise the field is left out of the output
 
     class Meta:
         model = Tag
-        fields = ('id', 'name')
-        read_only_Fields = ('id',)
+        fields = ('id', 'name', 'usage_count', 'recipe_count')
+        read_only_fields = ('id', 'usage_count')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(DynamicFieldsModelSerializer):
     """Serializer for an ingredient object"""
+    recipe_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'usage_count', 'recipe_count')
+        read_only_fields = ('id', 'usage_count')
+
+
+class UserRelatedIdsField(serializers.ManyRelatedField):
+    """A list of ids of objects that belong to the user
+
+    PrimaryKeyRelatedField(many=True) fetches every id with its own
+    query; this field fetches all of them with a single IN query limited
+    to the user's objects and hands the instances on to save().
+    """
+    default_error_messages = {
+        'does_not_exist': 'Unknown ids: {pks}.',
+    }
+
+    def __init__(self, queryset, **kwargs):
+        kwargs['child_relation'] = serializers.PrimaryKeyRelatedField(
+            queryset=queryset
+        )
+        # the child is still used to output the ids
+        super().__init__(**kwargs)
+
+    def get_user(self):
+        """Return the user whose objects can be referenced"""
+        request = self.context.get('request')
+        if request is not None:
+            return request.user
+        instance = getattr(self.parent, 'instance', None)
+        assert instance is not None, (
+            'UserRelatedIdsField needs the request in the serializer '
+            'context or an instance to take the user from.'
+        )
+        return instance.user
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
 
+        pks = []
+        for item in data:
+            if isinstance(item, int) and not isinstance(item, bool):
+                pks.append(item)
+            elif isinstance(item, str) and item.isascii() and \
+                    item.isdigit():
+                pks.append(int(item))
+                # form data sends the ids as strings
+            else:
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+        pks = list(dict.fromkeys(pks))
+        # drop repeated ids but keep the order they were sent in
 
-class RecipeSerializer(serializers.ModelSerializer):
+        queryset = self.child_relation.get_queryset()
+        found = queryset.filter(user=self.get_user()).in_bulk(pks)
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            # ids of other users are reported the same as ids that
+            # don't exist, all of them at once
+            self.fail(
+                'does_not_exist', pks=', '.join(str(pk) for pk in missing)
+            )
+        return [found[pk] for pk in pks]
+
+
+class RecipeSerializer(DynamicFieldsModelSerializer):
     """Serialize a recipe"""
-    ingredients = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Ingredient.objects.all()
-    )
-    # it creates a primary key related field and
-    # it says allow many and the query set that
-    # we're going to use or that we're
-    # going to allow to be part of this is going
-    # to be from the ingredients.objects.all
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    ingredients = UserRelatedIdsField(queryset=Ingredient.objects.all())
+    # a list of ingredient ids, all of them are looked up together and
+    # only the user's own ingredients can be used
+    tags = UserRelatedIdsField(queryset=Tag.objects.all())
 
     class Meta:
         model = Recipe
@@ -50,6 +124,30 @@ class RecipeSerializer(serializers.ModelSerializer):
     # prevent the user from updating the ID when they
     # may create or edit requests
 
+    def update(self, instance, validated_data):
+        """Update a recipe, writing only what actually changed"""
+        relations = {
+            field_name: validated_data.pop(field_name)
+            for field_name in RELATIONS
+            if field_name in validated_data
+        }
+        changed = [
+            field_name
+            for field_name, value in validated_data.items()
+            if getattr(instance, field_name) != value
+        ]
+        for field_name in changed:
+            setattr(instance, field_name, validated_data[field_name])
+        if changed:
+            instance.save(update_fields=changed + ['updated_at'])
+            # no UPDATE at all when nothing changed, auto_now fields are
+            # only written when they're in update_fields
+
+        set_relations(instance, relations)
+        # unlike .set() this reads both relations in one query and only
+        # inserts and deletes the rows that differ
+        return instance
+
 # we said that the difference between our list and our detail view
 # would be that the detail one would specify the actual ingredients
 # and the tag objects that are assigned to that recipe.
@@ -79,3 +177,146 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+
+class RecipeImportRowSerializer(serializers.Serializer):
+    """Validate one row of a recipe import"""
+    title = serializers.CharField(max_length=255)
+    time_minutes = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=5, decimal_places=2)
+    link = serializers.CharField(
+        max_length=255, allow_blank=True, default=''
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=255), default=list
+    )
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=255), default=list
+    )
+    # tags and ingredients are given by name, they're created for the
+    # user if they don't exist yet
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """Serializer for the progress of a recipe import"""
+
+    class Meta:
+        model = RecipeImport
+        fields = (
+            'id', 'source', 'format', 'status', 'rows_done',
+            'recipes_created', 'error_count', 'errors',
+        )
+        read_only_fields = fields
+
+
+class RecipeImportUploadSerializer(serializers.Serializer):
+    """Serializer for uploading a file of recipes to import"""
+    file = serializers.FileField()
+    format = serializers.ChoiceField(
+        choices=('ndjson', 'csv'), required=False
+    )
+    # guessed from the file name when it isn't given
+    import_id = serializers.IntegerField(required=False)
+    # pass the id of a failed import to continue where it stopped
+
+
+class RelationIdsSerializer(serializers.Serializer):
+    """Tag and ingredient ids to add to or remove from recipes"""
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+
+
+class RecipeRelationsSerializer(serializers.Serializer):
+    """Serializer for adding and removing tags and ingredients"""
+    add = RelationIdsSerializer(required=False, default=dict)
+    remove = RelationIdsSerializer(required=False, default=dict)
+
+    def validate(self, attrs):
+        """Check the ids belong to the user and aren't added and removed"""
+        user = self.context['request'].user
+        errors = {}
+        for field_name in RELATIONS:
+            add = set(attrs['add'].get(field_name, ()))
+            remove = set(attrs['remove'].get(field_name, ()))
+            if add & remove:
+                errors[field_name] = 'Can\'t add and remove: {}'.format(
+                    ', '.join(str(pk) for pk in sorted(add & remove))
+                )
+                continue
+            if not add | remove:
+                continue
+
+            model = Recipe._meta.get_field(field_name).related_model
+            found = set(
+                model.objects.filter(
+                    user=user, id__in=add | remove
+                ).values_list('id', flat=True)
+            )
+            # one query per relation checks all of the ids together
+            missing = sorted((add | remove) - found)
+            if missing:
+                errors[field_name] = 'Unknown ids: {}'.format(
+                    ', '.join(str(pk) for pk in missing)
+                )
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class RecipeBulkRelationsSerializer(RecipeRelationsSerializer):
+    """Serializer for changing tags and ingredients of many recipes"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+    )
+
+    def validate_recipes(self, value):
+        """Check all of the recipes belong to the user"""
+        user = self.context['request'].user
+        ids = set(value)
+        found = set(
+            Recipe.objects.filter(
+                user=user, id__in=ids
+            ).values_list('id', flat=True)
+        )
+        missing = sorted(ids - found)
+        if missing:
+            raise serializers.ValidationError('Unknown ids: {}'.format(
+                ', '.join(str(pk) for pk in missing)
+            ))
+        return sorted(ids)
+
+
+class TagPreferenceSerializer(serializers.Serializer):
+    """How much a tag is wanted in a meal plan"""
+    tag = serializers.IntegerField()
+    weight = serializers.FloatField(default=1.0, min_value=-10, max_value=10)
+
+
+class MealPlanSerializer(serializers.Serializer):
+    """Serializer for the budgets and preferences of a meal plan"""
+    meals = serializers.IntegerField(min_value=1, max_value=21)
+    max_price = serializers.DecimalField(
+        max_digits=7, decimal_places=2, min_value=0.01
+    )
+    max_time_minutes = serializers.IntegerField(min_value=1)
+    preferences = TagPreferenceSerializer(many=True, required=False)
+
+    def validate_preferences(self, value):
+        """Check the tags belong to the user and return {tag id: weight}"""
+        preferences = {item['tag']: item['weight'] for item in value}
+        found = set(
+            Tag.objects.filter(
+                user=self.context['request'].user, id__in=preferences
+            ).values_list('id', flat=True)
+        )
+        missing = sorted(set(preferences) - found)
+        if missing:
+            raise serializers.ValidationError('Unknown tags: {}'.format(
+                ', '.join(str(pk) for pk in missing)
+            ))
+        return preferences
@@ -0,0 +1,72 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+from core.versions import get_user_version
+
+# The combined ingredient list of a set of recipes. The ingredients are
+# counted with one grouped query over the through table, and the result
+# is cached under the user's data version, so asking for the same week
+# again is free until one of the user's recipes changes.
+
+
+def cache_key(user_id, recipe_ids):
+    """Return the cache key of a shopping list"""
+    ids = ','.join(str(pk) for pk in recipe_ids)
+    digest = hashlib.md5(ids.encode()).hexdigest()
+    return (
+        f'shopping-list:{user_id}:{get_user_version(user_id)}:{digest}'
+    )
+
+
+def build_shopping_list(user, recipe_ids):
+    """Return the ingredients and totals of the user's recipes"""
+    totals = Recipe.objects.filter(user=user, id__in=recipe_ids).aggregate(
+        ids=ArrayAgg('id'),
+        total_price=Sum('price'),
+        total_time_minutes=Sum('time_minutes'),
+    )
+    missing = sorted(set(recipe_ids) - set(totals['ids'] or ()))
+    if missing:
+        raise ValidationError({'recipes': 'Unknown ids: {}'.format(
+            ', '.join(str(pk) for pk in missing)
+        )})
+
+    through = Recipe.ingredients.through
+    ingredients = through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id', 'ingredient__name').annotate(
+        recipe_count=Count('recipe_id')
+    ).order_by('ingredient__name')
+    # GROUP BY the ingredient, the recipes were checked to be the
+    # user's above so there's no need to join core_recipe here
+
+    return {
+        'recipes': recipe_ids,
+        'total_price': str(totals['total_price']),
+        'total_time_minutes': totals['total_time_minutes'],
+        'ingredients': [
+            {
+                'id': row['ingredient_id'],
+                'name': row['ingredient__name'],
+                'recipe_count': row['recipe_count'],
+            }
+            for row in ingredients
+        ],
+    }
+
+
+def get_shopping_list(user, recipe_ids):
+    """Return the shopping list from the cache or build it"""
+    recipe_ids = sorted(set(recipe_ids))
+    key = cache_key(user.pk, recipe_ids)
+    result = cache.get(key)
+    if result is None:
+        result = build_shopping_list(user, recipe_ids)
+        cache.set(key, result, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,58 @@
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from core.models import Recipe, RecipeSignature, Tag, Ingredient
+
+from .bitmaps import schedule_bitmap_update
+from .similarity import schedule_signature_update
+
+
+def changed_recipe_ids(sender, instance, action, reverse, pk_set):
+    """Return the ids of the recipes a relation change touches, or None
+    for the actions that don't change anything"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            return [instance.pk]
+        return None
+
+    # changed from the tag or ingredient side, pk_set holds recipe ids
+    if action in ('post_add', 'post_remove'):
+        return pk_set
+    elif action == 'pre_clear':
+        field_name = type(instance)._meta.model_name
+        return list(
+            sender.objects.filter(
+                **{field_name: instance}
+            ).values_list('recipe_id', flat=True)
+        )
+        # read before the rows are gone, updated after the commit
+    return None
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_indexes(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the indexes of the recipes whose relations changed"""
+    recipe_ids = changed_recipe_ids(
+        sender, instance, action, reverse, pk_set
+    )
+    if recipe_ids is not None:
+        schedule_signature_update(recipe_ids)
+        schedule_bitmap_update(instance.user_id, recipe_ids)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_from_indexes(sender, instance, **kwargs):
+    """Remove a deleted recipe from the indexes"""
+    RecipeSignature.objects.filter(recipe_id=instance.pk).delete()
+    schedule_bitmap_update(instance.user_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def delete_target_bitmap(sender, instance, **kwargs):
+    """Drop the bitmap of a deleted tag or ingredient"""
+    schedule_bitmap_update(
+        instance.user_id,
+        removed_target=(sender._meta.model_name + 's', instance.pk)
+    )
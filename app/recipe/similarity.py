@@ -0,0 +1,270 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from core.models import Recipe, RecipeSignature
+from core.versions import bump_user_version, get_user_version
+
+from .relations import current_relation_ids
+
+# Similar recipes by the Jaccard similarity of their tags and
+# ingredients, estimated with MinHash and looked up with locality
+# sensitive hashing (LSH).
+#
+# Every recipe gets a signature of NUM_PERM hash values, the minimum of
+# each hash function over its tags and ingredients. Two recipes agree on
+# a given value with a probability equal to their Jaccard similarity, so
+# the share of equal values estimates it. The signature is cut into
+# BANDS bands and recipes that agree on a whole band become candidates,
+# which finds the similar recipes without comparing against all of them.
+#
+# Signatures are stored in RecipeSignature (256 bytes each) and updated
+# after the relations of a recipe change. A worker builds a user's index
+# from them on the first request and keeps it until the user's data
+# version changes.
+
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+PRIME = (1 << 31) - 1
+RERANK_FACTOR = 5
+RERANK_MIN = 50
+# the estimate alone ranks too coarsely, so more candidates than needed
+# are taken from the index and ranked by their exact similarity
+
+_random = np.random.RandomState(4242)
+HASH_A = _random.randint(1, PRIME, NUM_PERM).astype(np.int64)
+HASH_B = _random.randint(0, PRIME, NUM_PERM).astype(np.int64)
+# fixed seed: the signatures are stored, so every process has to use
+# the same hash functions
+
+
+def recipe_tokens(tag_ids, ingredient_ids):
+    """Return the tags and ingredients as one array of distinct tokens"""
+    return np.array(
+        [2 * pk for pk in tag_ids] + [2 * pk + 1 for pk in ingredient_ids],
+        dtype=np.int64
+    )
+
+
+def minhash_many(token_lists):
+    """Return the (n, NUM_PERM) signatures of non empty token arrays"""
+    lengths = np.array([len(tokens) for tokens in token_lists])
+    tokens = np.concatenate(token_lists)
+    hashes = (HASH_A[:, None] * tokens[None, :] + HASH_B[:, None]) % PRIME
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    # the minimum of every hash function over each recipe's slice
+    return np.minimum.reduceat(hashes, starts, axis=1).T.astype(np.uint32)
+
+
+def band_keys(signatures):
+    """Combine the values of each band into one key, (BANDS, n)"""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS)
+    keys = np.zeros((len(signatures), BANDS), dtype=np.uint64)
+    for row in range(ROWS):
+        keys = keys * np.uint64(PRIME) + bands[:, :, row].astype(np.uint64)
+    return np.ascontiguousarray(keys.T)
+
+
+class SimilarityIndex:
+    """LSH index over the signatures of a set of recipes"""
+
+    def __init__(self, recipe_ids, signatures):
+        order = np.argsort(recipe_ids)
+        self.recipe_ids = np.asarray(recipe_ids, dtype=np.int64)[order]
+        self.signatures = signatures[order]
+        self.keys = band_keys(self.signatures)
+        self.order = np.argsort(self.keys, axis=1, kind='stable')
+        self.sorted_keys = np.take_along_axis(self.keys, self.order, axis=1)
+        # each band is sorted so its buckets are found by binary search
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build the index from (recipe_id, packed signature) rows"""
+        rows = list(rows)
+        if not rows:
+            return cls(
+                np.zeros(0, dtype=np.int64),
+                np.zeros((0, NUM_PERM), dtype=np.uint32)
+            )
+        recipe_ids = np.array([recipe_id for recipe_id, _ in rows])
+        signatures = np.frombuffer(
+            b''.join(bytes(signature) for _, signature in rows),
+            dtype=np.uint32
+        ).reshape(len(rows), NUM_PERM)
+        return cls(recipe_ids, signatures)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def position(self, recipe_id):
+        """Return the row of a recipe, or None if it isn't indexed"""
+        position = np.searchsorted(self.recipe_ids, recipe_id)
+        if position < len(self) and self.recipe_ids[position] == recipe_id:
+            return int(position)
+        return None
+
+    def candidates(self, position):
+        """Return the rows sharing at least one band with a row"""
+        rows = []
+        for band in range(BANDS):
+            key = self.keys[band, position]
+            sorted_keys = self.sorted_keys[band]
+            low = np.searchsorted(sorted_keys, key, 'left')
+            high = np.searchsorted(sorted_keys, key, 'right')
+            rows.append(self.order[band, low:high])
+        rows = np.unique(np.concatenate(rows))
+        return rows[rows != position]
+
+    def similar(self, recipe_id, k):
+        """Return up to k (recipe_id, similarity) of the closest recipes"""
+        position = self.position(recipe_id)
+        if position is None:
+            return []
+        rows = self.candidates(position)
+        scores = (
+            self.signatures[rows] == self.signatures[position]
+        ).mean(axis=1)
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [
+            (int(self.recipe_ids[rows[n]]), round(float(scores[n]), 4))
+            for n in best
+        ]
+
+
+def jaccard_rerank(tokens, candidates, k):
+    """Return the k (recipe_id, similarity) of the candidates closest to
+    tokens, by exact Jaccard similarity
+
+    candidates maps recipe ids to their token sets.
+    """
+    scored = []
+    for recipe_id, candidate in candidates.items():
+        union = len(tokens | candidate)
+        similarity = len(tokens & candidate) / union if union else 0
+        scored.append((recipe_id, round(similarity, 4)))
+    scored.sort(key=lambda item: -item[1])
+    return scored[:k]
+
+
+def find_similar(user_id, recipe_id, k):
+    """Return (recipe_id, similarity) of the k most similar recipes
+
+    The index shortlists RERANK_FACTOR times as many recipes as asked for
+    by their estimated similarity, then their tags and ingredients are
+    read with one query and they're ranked by the exact similarity.
+    """
+    shortlist = get_index(user_id).similar(
+        recipe_id, max(k * RERANK_FACTOR, RERANK_MIN)
+    )
+    if not shortlist:
+        return []
+    current = current_relation_ids(
+        [recipe_id] + [pk for pk, _ in shortlist]
+    )
+
+    def token_set(pk):
+        return set(recipe_tokens(
+            current['tags'][pk], current['ingredients'][pk]
+        ).tolist())
+
+    return jaccard_rerank(
+        token_set(recipe_id),
+        {pk: token_set(pk) for pk, _ in shortlist},
+        k
+    )
+
+
+def update_signatures(recipe_ids):
+    """Recompute the stored signatures of the recipes"""
+    recipe_ids = list(recipe_ids)
+    owners = dict(
+        Recipe.objects.filter(id__in=recipe_ids).values_list('id', 'user_id')
+    )
+    current = current_relation_ids(list(owners))
+    indexed = [
+        (recipe_id, recipe_tokens(
+            current['tags'][recipe_id], current['ingredients'][recipe_id]
+        ))
+        for recipe_id in owners
+    ]
+    indexed = [(pk, tokens) for pk, tokens in indexed if len(tokens)]
+    # recipes without tags or ingredients aren't similar to anything
+
+    rows = []
+    if indexed:
+        signatures = minhash_many([tokens for _, tokens in indexed])
+        rows = [
+            RecipeSignature(
+                recipe_id=recipe_id, user_id=owners[recipe_id],
+                signature=signature.tobytes()
+            )
+            for (recipe_id, _), signature in zip(indexed, signatures)
+        ]
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.bulk_create(rows)
+
+    for user_id in set(owners.values()):
+        bump_user_version(user_id)
+        # the loaded indexes only see the new signatures after this
+
+
+class PendingSignatures:
+    """Recipes to rehash when the current transaction commits"""
+
+    def __init__(self):
+        self.recipe_ids = set()
+
+    def flush(self):
+        recipe_ids, self.recipe_ids = self.recipe_ids, set()
+        if recipe_ids:
+            update_signatures(recipe_ids)
+        # the later calls of the same commit find nothing left to do
+
+
+def schedule_signature_update(recipe_ids):
+    """Update the signatures of the recipes after the current commit"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        update_signatures(recipe_ids)
+        return
+    pending = getattr(connection, 'pending_signatures', None)
+    if pending is None:
+        pending = connection.pending_signatures = PendingSignatures()
+    transaction.on_commit(pending.flush)
+    # registered again for every change, as a rolled back transaction
+    # drops the earlier registrations. Recipes left over from one are
+    # hashed from what is in the database, which is harmless
+    pending.recipe_ids.update(recipe_ids)
+    # however many relations change, every recipe is hashed once
+
+
+_indexes = OrderedDict()
+# user id -> (data version, index), the most recently used last
+_lock = threading.Lock()
+
+
+def get_index(user_id):
+    """Return the similarity index of a user's recipes"""
+    version = get_user_version(user_id)
+    with _lock:
+        entry = _indexes.get(user_id)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(user_id)
+            return entry[1]
+
+    index = SimilarityIndex.from_rows(
+        RecipeSignature.objects.filter(
+            user_id=user_id
+        ).values_list('recipe_id', 'signature')
+    )
+    with _lock:
+        _indexes[user_id] = (version, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.SIMILARITY_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,43 @@
+import json
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+# Helpers for sending large lists without building the whole response
+# in memory. The rows are read from the database a chunk at a time and
+# every chunk is serialized and sent before the next one is read.
+
+
+def iter_chunks(queryset, chunk_size):
+    """Yield the objects of a queryset as lists of chunk_size objects"""
+    iterator = queryset.iterator(chunk_size=chunk_size)
+    # on postgres iterator() reads through a server side cursor, so
+    # only one chunk of rows is ever held by the client at a time
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def dumps(data):
+    """Encode data the same way the compact JSON renderer does"""
+    return json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')
+    )
+
+
+def stream_json_array(chunks, serialize):
+    """Yield a JSON array built from the serialized chunks
+
+    serialize is called with each chunk and returns a list of items
+    that can be encoded as JSON.
+    """
+    yield '['
+    separator = ''
+    for chunk in chunks:
+        items = serialize(chunk)
+        if items:
+            yield separator + ','.join(dumps(item) for item in items)
+            separator = ','
+    yield ']'
@@ -5,7 +5,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Ingredient
+from core.models import Ingredient, Recipe
 
 from ..serializers import IngredientSerializer
 
@@ -95,3 +95,22 @@ class PrivateIngredientsAPITests(TestCase):
         res = self.client.post(INGREDIENTS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_ingredients_assigned_only_with_count(self):
+        """Test assigned ingredients are returned with their recipe count"""
+        ingredient1 = Ingredient.objects.create(user=self.user, name='Eggs')
+        Ingredient.objects.create(user=self.user, name='Turkey')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Omelette', time_minutes=5, price=2.00
+        )
+        recipe.ingredients.add(ingredient1)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                INGREDIENTS_URL, {'assigned_only': 1, 'recipe_count': 1}
+            )
+
+        self.assertEqual(res.data, [
+            {'id': ingredient1.id, 'name': 'Eggs', 'usage_count': 1,
+             'recipe_count': 1},
+        ])
@@ -0,0 +1,126 @@
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..mealplan import plan_meals
+from .test_recipe_api import sample_recipe, sample_tag
+
+
+MEAL_PLAN_URL = reverse('recipe:recipe-meal-plan')
+
+
+class PlanMealsTests(TestCase):
+    """Test the meal plan solver"""
+
+    def test_best_plan_within_budget(self):
+        """Test the highest scoring plan that fits is found"""
+        prices = [5, 4, 3, 8, 1]
+        times = [30, 20, 60, 10, 5]
+        scores = [3, 2, 2, 5, 0]
+
+        plan, complete = plan_meals(prices, times, scores, 2, 10, 60, 1.0)
+
+        self.assertTrue(complete)
+        self.assertEqual(sorted(plan), [0, 1])
+        # 3 + 8 is over the price and 2 + 3 over the time budget
+
+    def test_no_plan(self):
+        """Test None is returned when no plan fits"""
+        plan, complete = plan_meals([5, 6], [10, 10], [1, 1], 2, 10, 60, 1.0)
+
+        self.assertIsNone(plan)
+
+    def test_time_budget(self):
+        """Test the search stops when it runs out of time"""
+        random = np.random.RandomState(0)
+        prices = random.uniform(1, 20, 5000)
+        times = random.uniform(5, 90, 5000)
+        scores = random.randint(0, 4, 5000)
+
+        plan, complete = plan_meals(
+            prices, times, scores, 7, 60, 300, 0.0, candidates=5000
+        )
+
+        self.assertFalse(complete)
+        self.assertIsNotNone(plan)
+        self.assertLessEqual(prices[plan].sum(), 60)
+        self.assertLessEqual(times[plan].sum(), 300)
+
+
+class MealPlanApiTests(TestCase):
+    """Test the meal plan action"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.curry = sample_recipe(
+            user=self.user, title='Curry', price=6.00, time_minutes=40
+        )
+        self.curry.tags.add(self.vegan)
+        self.salad = sample_recipe(
+            user=self.user, title='Salad', price=4.00, time_minutes=10
+        )
+        self.salad.tags.add(self.vegan)
+        self.steak = sample_recipe(
+            user=self.user, title='Steak', price=9.00, time_minutes=20
+        )
+
+    def test_meal_plan(self):
+        """Test a plan follows the preferences within the budgets"""
+        payload = {
+            'meals': 2,
+            'max_price': '10.00',
+            'max_time_minutes': 60,
+            'preferences': [{'tag': self.vegan.id, 'weight': 2}],
+        }
+
+        res = self.client.post(MEAL_PLAN_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(recipe['title'] for recipe in res.data['recipes']),
+            ['Curry', 'Salad']
+        )
+        self.assertEqual(res.data['total_price'], '10.00')
+        self.assertEqual(res.data['total_time_minutes'], 50)
+        self.assertEqual(res.data['score'], 4)
+        self.assertTrue(res.data['complete'])
+
+    @override_settings(MEAL_PLAN_CANDIDATES=2)
+    def test_candidates_limited(self):
+        """Test only the most promising recipes are planned with"""
+        res = self.client.post(MEAL_PLAN_URL, {
+            'meals': 1, 'max_price': '20.00', 'max_time_minutes': 60,
+            'preferences': [{'tag': self.vegan.id}],
+        }, format='json')
+
+        self.assertIn(res.data['recipes'][0]['title'], ['Curry', 'Salad'])
+
+    def test_no_plan_fits(self):
+        """Test a budget nothing fits in is rejected"""
+        res = self.client.post(MEAL_PLAN_URL, {
+            'meals': 3, 'max_price': '10.00', 'max_time_minutes': 60,
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_tags_rejected(self):
+        """Test preferences can only use the user's own tags"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        tag = sample_tag(user=other, name='Theirs')
+
+        res = self.client.post(MEAL_PLAN_URL, {
+            'meals': 1, 'max_price': '10.00', 'max_time_minutes': 60,
+            'preferences': [{'tag': tag.id}],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -3,12 +3,13 @@ from django.test import TestCase
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 # use that for making our API requests
 
 from core.models import Recipe, Tag, Ingredient
 
-from ..serializers import RecipeSerializer, RecipeDetailSerializer
+from ..serializers import RecipeSerializer, RecipeDetailSerializer, \
+    TagSerializer
 
 import tempfile
 # allows you to call a function which will then create a temp file
@@ -409,3 +410,234 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+
+class RecipeSparseFieldsTests(TestCase):
+    """Test limiting the returned recipe fields with ?fields="""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_only_requested_fields(self):
+        """Test the list only contains the requested fields"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+
+        with self.assertNumQueries(1):
+            # no prefetching for relations that weren't asked for
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': recipe.id, 'title': recipe.title}])
+
+    def test_requested_fields_with_spaces(self):
+        """Test spaces and a trailing comma in ?fields= are ignored"""
+        recipe = sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'fields': 'id, title, '})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': recipe.id, 'title': recipe.title}])
+
+    def test_list_related_fields_prefetched(self):
+        """Test relations are loaded with one query each"""
+        for title in ('Curry', 'Stew', 'Soup'):
+            recipe = sample_recipe(user=self.user, title=title)
+            recipe.tags.add(sample_tag(user=self.user))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 3)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {'fields': 'id,tags'})
+
+        self.assertEqual(set(res.data[0]), {'id', 'tags'})
+
+    def test_detail_only_requested_fields(self):
+        """Test the detail view can be limited to some fields"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        recipe.tags.add(tag)
+        tag.refresh_from_db()
+
+        res = self.client.get(detail_url(recipe.id), {'fields': 'id,tags'})
+
+        self.assertEqual(res.data, {
+            'id': recipe.id,
+            'tags': [TagSerializer(tag).data],
+        })
+
+    def test_unknown_field_rejected(self):
+        """Test asking for a field that doesn't exist fails"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,secret'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fields_ignored_for_writes(self):
+        """Test creating a recipe always returns the whole object"""
+        payload = {'title': 'Toast', 'time_minutes': 2, 'price': 1.00}
+
+        res = self.client.post(RECIPES_URL + '?fields=id', payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['title'], payload['title'])
+
+
+class RecipeUpdateDiffTests(TestCase):
+    """Test editing a recipe only writes what changed"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.tag1 = sample_tag(user=self.user, name='Vegan')
+        self.tag2 = sample_tag(user=self.user, name='Dessert')
+        self.ingredient = sample_ingredient(user=self.user)
+        self.recipe.tags.add(self.tag1)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def get_serializer(self, **changes):
+        data = {
+            'title': self.recipe.title,
+            'time_minutes': self.recipe.time_minutes,
+            'price': self.recipe.price,
+            'tags': [self.tag1.id],
+            'ingredients': [self.ingredient.id],
+        }
+        data.update(changes)
+        serializer = RecipeSerializer(self.recipe, data=data)
+        self.assertTrue(serializer.is_valid())
+        return serializer
+
+    def test_unchanged_save_only_reads(self):
+        """Test saving an unchanged recipe runs a single read"""
+        serializer = self.get_serializer()
+
+        with self.assertNumQueries(1):
+            # both relations are read with one query, nothing is written
+            serializer.save()
+
+    def test_only_changed_relations_written(self):
+        """Test the tags are changed without touching the rest"""
+        serializer = self.get_serializer(tags=[self.tag2.id])
+
+        with self.assertNumQueries(1 + 2 + 2 + 1):
+            # the read, then for the removed and the added tag the
+            # delete or insert of the through row and a counter update,
+            # and marking the recipe as changed for syncing clients
+            serializer.save()
+
+        self.assertEqual(list(self.recipe.tags.all()), [self.tag2])
+        self.assertEqual(list(self.recipe.ingredients.all()),
+                         [self.ingredient])
+        self.tag1.refresh_from_db()
+        self.tag2.refresh_from_db()
+        self.assertEqual(self.tag1.usage_count, 0)
+        self.assertEqual(self.tag2.usage_count, 1)
+
+    def test_only_changed_fields_saved(self):
+        """Test only the changed columns are updated"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(link='elsewhere')
+        # a concurrent edit the stale instance doesn't know about
+        serializer = self.get_serializer(title='New title')
+
+        serializer.save()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'New title')
+        self.assertEqual(self.recipe.link, 'elsewhere')
+
+    def test_patch_swaps_tags(self):
+        """Test updating tags through the API keeps the counts right"""
+        res = self.client.patch(
+            detail_url(self.recipe.id), {'tags': [self.tag1.id, self.tag2.id]}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 2)
+        self.tag2.refresh_from_db()
+        self.assertEqual(self.tag2.usage_count, 1)
+        self.assertEqual(self.recipe.ingredients.count(), 1)
+
+
+class RecipeRelatedIdsTests(TestCase):
+    """Test validating the tag and ingredient ids of a recipe"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_ids_looked_up_together(self):
+        """Test all submitted ids are validated with one query"""
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            for i in range(30)
+        ]
+        payload = {
+            'title': 'Big stew',
+            'time_minutes': 90,
+            'price': 12.00,
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'tags': [],
+        }
+        request = APIRequestFactory().post(RECIPES_URL)
+        request.user = self.user
+        serializer = RecipeSerializer(
+            data=payload, context={'request': request}
+        )
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+        self.assertEqual(
+            serializer.validated_data['ingredients'], ingredients
+        )
+
+    def test_other_users_ids_reported(self):
+        """Test ids of other users and missing ids are all reported"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        mine = sample_tag(user=self.user, name='Mine')
+        theirs = sample_tag(user=other, name='Theirs')
+        payload = {
+            'title': 'Toast',
+            'time_minutes': 2,
+            'price': 1.00,
+            'tags': [mine.id, theirs.id, 999999],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['tags'], [f'Unknown ids: {theirs.id}, 999999.']
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_invalid_id_rejected(self):
+        """Test ids that aren't whole numbers are rejected"""
+        tag = sample_tag(user=self.user)
+        for value in ('abc', f' {tag.id} ', tag.id + 0.7, True, None):
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Toast', 'time_minutes': 2, 'price': 1.00,
+                'tags': [value],
+            }, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('tags', res.data)
+        self.assertFalse(Recipe.objects.exists())
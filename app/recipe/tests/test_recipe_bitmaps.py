@@ -0,0 +1,209 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from core.models import Tag
+from core.versions import incr_user_version
+
+from ..bitmaps import BitmapIndex, from_bitmap, get_index, to_bitmap, \
+    _indexes
+from .test_recipe_api import RECIPES_URL, sample_recipe, sample_tag, \
+    sample_ingredient
+
+
+class BitmapIndexTests(TestCase):
+    """Test the bitmaps themselves"""
+
+    def test_bitmap_round_trip(self):
+        """Test positions survive being packed into a bitmap"""
+        positions = [0, 3, 64, 1000]
+
+        bitmap = to_bitmap(positions)
+
+        self.assertEqual(bitmap, 1 | 1 << 3 | 1 << 64 | 1 << 1000)
+        self.assertEqual(from_bitmap(bitmap).tolist(), positions)
+        self.assertEqual(from_bitmap(0).tolist(), [])
+
+    def test_match_any_and_all(self):
+        """Test combining the bitmaps of several ids"""
+        index = BitmapIndex([
+            (10, 1, 'tags'), (10, 2, 'tags'), (11, 1, 'tags'),
+            (12, 2, 'tags'), (12, 7, 'ingredients'),
+        ])
+
+        self.assertEqual(
+            sorted(index.recipe_ids_of(index.match('tags', [1, 2]))),
+            [10, 11, 12]
+        )
+        self.assertEqual(
+            index.recipe_ids_of(index.match('tags', [1, 2], True)), [10]
+        )
+        self.assertEqual(index.recipe_ids_of(index.match('tags', [3])), [])
+
+
+class RecipeMatchTests(TestCase):
+    """Test ?match=all with and without the bitmap index"""
+
+    def setUp(self):
+        cache.clear()
+        _indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.rice = sample_ingredient(user=self.user, name='Rice')
+        self.curry = sample_recipe(user=self.user, title='Curry')
+        self.curry.tags.add(self.vegan, self.quick)
+        self.curry.ingredients.add(self.rice)
+        self.salad = sample_recipe(user=self.user, title='Salad')
+        self.salad.tags.add(self.quick)
+        self.steak = sample_recipe(user=self.user, title='Steak')
+        self.steak.ingredients.add(self.rice)
+
+    def get_titles(self, **params):
+        res = self.client.get(RECIPES_URL, params)
+        return sorted(recipe['title'] for recipe in res.data)
+
+    def check_matches(self):
+        tags = f'{self.vegan.id},{self.quick.id}'
+        self.assertEqual(self.get_titles(tags=tags), ['Curry', 'Salad'])
+        self.assertEqual(self.get_titles(tags=tags, match='all'), ['Curry'])
+        self.assertEqual(
+            self.get_titles(tags=self.quick.id, ingredients=self.rice.id),
+            ['Curry']
+        )
+
+    def test_match_with_sql(self):
+        """Test matching any or all of the ids in the database"""
+        self.check_matches()
+
+    @override_settings(RECIPE_BITMAP_INDEX=True)
+    def test_match_with_bitmaps(self):
+        """Test the bitmap index gives the same results"""
+        self.check_matches()
+
+    @override_settings(RECIPE_BITMAP_INDEX=True)
+    def test_bitmaps_skip_through_tables(self):
+        """Test a loaded index answers the filter without a join"""
+        self.client.get(RECIPES_URL, {'tags': self.vegan.id})
+
+        with self.assertNumQueries(3):
+            # the recipes by id, and their tags and ingredients
+            self.client.get(RECIPES_URL, {'tags': self.vegan.id})
+
+    @override_settings(RECIPE_BITMAP_INDEX=True)
+    def test_bitmaps_rebuilt_for_other_changes(self):
+        """Test a change the index wasn't told about rebuilds it"""
+        get_index(self.user.pk)
+        self.steak.tags.add(self.vegan)
+        # in a test transaction that never commits, so only the data
+        # version tells the index it's out of date
+
+        self.assertEqual(
+            self.get_titles(tags=self.vegan.id), ['Curry', 'Steak']
+        )
+
+    def test_unknown_match_rejected(self):
+        """Test only any and all are accepted"""
+        res = self.client.get(RECIPES_URL, {'match': 'some'})
+
+        self.assertEqual(res.status_code, 400)
+
+    @override_settings(RECIPE_BITMAP_INDEX=True, RECIPE_BITMAP_INDEX_MEMORY=1)
+    def test_least_recently_used_evicted(self):
+        """Test users are dropped to stay within the memory budget"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        get_index(self.user.pk)
+        get_index(other.pk)
+
+        self.assertEqual(list(_indexes), [other.pk])
+
+
+@override_settings(RECIPE_BITMAP_INDEX=True)
+class BitmapUpdateTests(TransactionTestCase):
+    """Test loaded indexes are patched when changes commit"""
+
+    def setUp(self):
+        cache.clear()
+        _indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.soup = sample_recipe(user=self.user, title='Soup')
+        self.soup.tags.add(self.vegan)
+        self.index = get_index(self.user.pk)
+
+    def vegan_recipes(self):
+        return self.index.recipe_ids_of(
+            self.index.match('tags', [self.vegan.id])
+        )
+
+    def test_patched_on_commit(self):
+        """Test relation changes are applied without a rebuild"""
+        salad = sample_recipe(user=self.user, title='Salad')
+        with transaction.atomic():
+            salad.tags.add(self.vegan)
+            self.soup.tags.remove(self.vegan)
+            self.assertEqual(self.vegan_recipes(), [self.soup.id])
+
+        self.assertEqual(self.vegan_recipes(), [salad.id])
+
+    def test_deletes_applied(self):
+        """Test deleted recipes and tags are dropped from the index"""
+        self.soup.delete()
+
+        self.assertEqual(self.vegan_recipes(), [])
+
+        self.vegan.delete()
+
+        self.assertNotIn(self.vegan.id, self.index.bitmaps['tags'])
+
+    def test_rolled_back_changes_ignored(self):
+        """Test changes in a rolled back transaction aren't applied"""
+        salad = sample_recipe(user=self.user, title='Salad')
+        try:
+            with transaction.atomic():
+                salad.tags.add(self.vegan)
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(self.vegan_recipes(), [self.soup.id])
+
+    def test_rolled_back_delete_ignored(self):
+        """Test a tag deleted in a rolled back transaction is kept"""
+        try:
+            with transaction.atomic():
+                Tag.objects.get(pk=self.vegan.pk).delete()
+                raise ValueError
+        except ValueError:
+            pass
+
+        with transaction.atomic():
+            self.soup.tags.add(sample_tag(user=self.user, name='Quick'))
+
+        self.assertEqual(self.vegan_recipes(), [self.soup.id])
+
+    def test_patched_index_keeps_loaded_version(self):
+        """Test a change from another process still forces a reload"""
+        salad = sample_recipe(user=self.user, title='Salad')
+        with transaction.atomic():
+            salad.tags.add(self.vegan)
+            incr_user_version(self.user.pk)
+            # committed by another process in the meantime
+
+        self.assertEqual(
+            sorted(self.vegan_recipes()), sorted([self.soup.id, salad.id])
+        )
+        self.assertIsNot(get_index(self.user.pk), self.index)
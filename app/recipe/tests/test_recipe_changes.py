@@ -0,0 +1,207 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Recipe, Tombstone
+
+from .test_recipe_api import detail_url, sample_recipe, sample_tag, \
+    sample_ingredient
+
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+@override_settings(CHANGES_SETTLE_TIME=0)
+class RecipeChangesTests(TestCase):
+    """Test syncing the library with /api/recipe/changes/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since=None, **params):
+        """Return the changes after since"""
+        if since:
+            params['since'] = since
+        res = self.client.get(CHANGES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def ids(self, items):
+        return sorted(item['id'] for item in items)
+
+    def test_first_sync_sends_everything(self):
+        """Test a sync without a cursor sends the whole library"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        changes = self.sync()
+
+        self.assertEqual(self.ids(changes['tags']), [tag.id])
+        self.assertEqual(self.ids(changes['ingredients']), [ingredient.id])
+        self.assertEqual(changes['recipes'][0]['id'], recipe.id)
+        self.assertEqual(changes['recipes'][0]['tags'], [tag.id])
+        self.assertFalse(changes['more'])
+        self.assertIsNotNone(changes['cursor'])
+
+    def test_only_changes_after_cursor(self):
+        """Test a sync only sends what changed since the cursor"""
+        changed = sample_recipe(user=self.user, title='Curry')
+        sample_recipe(user=self.user, title='Stew')
+        cursor = self.sync()['cursor']
+
+        changed.title = 'Thai curry'
+        changed.save()
+        created = sample_recipe(user=self.user, title='Soup')
+        changes = self.sync(cursor)
+
+        self.assertEqual(
+            self.ids(changes['recipes']), sorted([changed.id, created.id])
+        )
+        self.assertEqual(changes['tags'], [])
+
+        changes = self.sync(changes['cursor'])
+
+        self.assertEqual(changes['recipes'], [])
+        self.assertIsNotNone(changes['cursor'])
+
+    def test_patched_recipe_reported(self):
+        """Test a recipe edited through the API is sent as changed"""
+        recipe = sample_recipe(user=self.user, title='Curry')
+        sample_recipe(user=self.user, title='Stew')
+        cursor = self.sync()['cursor']
+
+        res = self.client.patch(detail_url(recipe.id), {'title': 'Dal'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        changes = self.sync(cursor)
+
+        self.assertEqual(self.ids(changes['recipes']), [recipe.id])
+        self.assertEqual(changes['recipes'][0]['title'], 'Dal')
+
+    def test_relation_change_marks_recipe_changed(self):
+        """Test adding a tag to a recipe makes the recipe change"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        cursor = self.sync()['cursor']
+
+        recipe.tags.add(tag)
+        changes = self.sync(cursor)
+
+        self.assertEqual(self.ids(changes['recipes']), [recipe.id])
+        self.assertEqual(changes['recipes'][0]['tags'], [tag.id])
+        self.assertEqual(self.ids(changes['tags']), [tag.id])
+        self.assertEqual(changes['tags'][0]['usage_count'], 1)
+        # the usage count of the tag went up
+
+    def test_deleted_objects_reported(self):
+        """Test deleted recipes and tags are sent as deleted ids"""
+        recipe = sample_recipe(user=self.user)
+        other = sample_recipe(user=self.user, title='Other')
+        tag = sample_tag(user=self.user)
+        other.tags.add(tag)
+        cursor = self.sync()['cursor']
+
+        res = self.client.delete(detail_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        tag_id = tag.id
+        tag.delete()
+        changes = self.sync(cursor)
+
+        self.assertEqual(changes['deleted']['recipes'], [recipe.id])
+        self.assertEqual(changes['deleted']['tags'], [tag_id])
+        self.assertEqual(changes['deleted']['ingredients'], [])
+        self.assertEqual(self.ids(changes['recipes']), [other.id])
+        self.assertEqual(changes['recipes'][0]['tags'], [])
+        # the recipe lost the deleted tag
+
+    def test_pages_cover_all_changes(self):
+        """Test paging through the changes sends every object once"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        recipes = [
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(4)
+        ]
+
+        seen_tags, seen_recipes = [], []
+        cursor = None
+        for _ in range(10):
+            changes = self.sync(cursor, limit=2)
+            self.assertLessEqual(
+                len(changes['tags']) + len(changes['recipes']), 2
+            )
+            seen_tags += [item['id'] for item in changes['tags']]
+            seen_recipes += [item['id'] for item in changes['recipes']]
+            cursor = changes['cursor']
+            if not changes['more']:
+                break
+
+        self.assertEqual(sorted(seen_tags), sorted(tag.id for tag in tags))
+        self.assertEqual(
+            sorted(seen_recipes), sorted(recipe.id for recipe in recipes)
+        )
+
+    def test_changes_limited_to_user(self):
+        """Test other users' changes aren't sent"""
+        other = get_user_model().objects.create_user(
+            'other@londonappdev.com',
+            'password123'
+        )
+        sample_recipe(user=other).delete()
+        sample_tag(user=other)
+        recipe = sample_recipe(user=self.user)
+
+        changes = self.sync()
+
+        self.assertEqual(self.ids(changes['recipes']), [recipe.id])
+        self.assertEqual(changes['tags'], [])
+        self.assertEqual(changes['deleted']['recipes'], [])
+
+    @override_settings(CHANGES_SETTLE_TIME=60)
+    def test_recent_changes_held_back(self):
+        """Test changes younger than the settle time aren't sent yet"""
+        recipe = sample_recipe(user=self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=5)
+        )
+        cursor = self.sync()['cursor']
+        recipe.title = 'Changed'
+        recipe.save()
+
+        changes = self.sync(cursor)
+
+        self.assertEqual(changes['recipes'], [])
+        self.assertEqual(changes['cursor'], cursor)
+
+    def test_invalid_params_rejected(self):
+        """Test a bad cursor or limit returns an error"""
+        for params in ({'since': 'abc'}, {'since': '1.9.1'},
+                       {'since': '99999999999999999999.0.1'},
+                       {'since': '-99999999999999999999.0.1'},
+                       {'limit': 0}, {'limit': 'x'}):
+            res = self.client.get(CHANGES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleting_user_removes_tombstones(self):
+        """Test a deleted user's tombstones are deleted with them"""
+        sample_recipe(user=self.user).delete()
+        tag = sample_tag(user=self.user)
+        sample_recipe(user=self.user).tags.add(tag)
+
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertFalse(Tag.objects.exists())
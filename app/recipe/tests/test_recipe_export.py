@@ -0,0 +1,134 @@
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from .test_recipe_api import sample_recipe, sample_tag, sample_ingredient
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class RecipeExportTests(TestCase):
+    """Test exporting the recipe library"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe1 = sample_recipe(user=self.user, title='Curry')
+        self.recipe1.tags.add(
+            sample_tag(user=self.user, name='Spicy'),
+            sample_tag(user=self.user, name='Dinner'),
+        )
+        self.recipe1.ingredients.add(
+            sample_ingredient(user=self.user, name='Rice')
+        )
+        self.recipe2 = sample_recipe(user=self.user, title='Toast')
+
+    def read_ndjson(self, content):
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_export_ndjson(self):
+        """Test exporting recipes as newline delimited JSON"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        sample_recipe(user=other, title='Not mine')
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = self.read_ndjson(b''.join(res.streaming_content))
+        self.assertEqual(rows, [
+            {
+                'id': self.recipe1.id, 'title': 'Curry', 'time_minutes': 10,
+                'price': '5.00', 'link': '', 'image': '',
+                'tags': ['Dinner', 'Spicy'], 'ingredients': ['Rice'],
+            },
+            {
+                'id': self.recipe2.id, 'title': 'Toast', 'time_minutes': 10,
+                'price': '5.00', 'link': '', 'image': '',
+                'tags': [], 'ingredients': [],
+            },
+        ])
+
+    def test_export_csv(self):
+        """Test exporting recipes as CSV"""
+        res = self.client.get(EXPORT_URL, {'output': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['title'], 'Curry')
+        self.assertEqual(rows[0]['tags'], 'Dinner|Spicy')
+        self.assertEqual(rows[1]['ingredients'], '')
+
+    def test_export_gzip(self):
+        """Test the export can be compressed on the fly"""
+        res = self.client.get(EXPORT_URL, {'gzip': 1})
+
+        self.assertEqual(res['Content-Type'], 'application/gzip')
+        self.assertIn('recipes.ndjson.gz', res['Content-Disposition'])
+        content = gzip.decompress(b''.join(res.streaming_content))
+        self.assertEqual(len(self.read_ndjson(content)), 2)
+
+    def test_export_gzip_flag_values(self):
+        """Test ?gzip= takes true and false and rejects anything else"""
+        res = self.client.get(EXPORT_URL, {'gzip': 'true'})
+        self.assertEqual(res['Content-Type'], 'application/gzip')
+
+        res = self.client.get(EXPORT_URL, {'gzip': 'false'})
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+
+        res = self.client.get(EXPORT_URL, {'gzip': 'zip'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_since(self):
+        """Test only recipes changed since the given time are exported"""
+        Recipe.objects.filter(pk=self.recipe2.pk).update(
+            updated_at=timezone.now() - timedelta(days=2)
+        )
+        self.recipe1.title = 'Thai curry'
+        self.recipe1.save()
+        since = timezone.now() - timedelta(days=1)
+
+        res = self.client.get(EXPORT_URL, {'since': since.isoformat()})
+
+        rows = self.read_ndjson(b''.join(res.streaming_content))
+        self.assertEqual([row['id'] for row in rows], [self.recipe1.id])
+
+    def test_export_since_invalid(self):
+        """Test a since that isn't a date and time is rejected"""
+        res = self.client.get(EXPORT_URL, {'since': self.recipe1.id})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=1)
+    def test_export_queries_per_chunk(self):
+        """Test names are looked up once per relation for each chunk"""
+        res = self.client.get(EXPORT_URL)
+
+        with self.assertNumQueries(1 + 2 * 2):
+            rows = self.read_ndjson(b''.join(res.streaming_content))
+        self.assertEqual(len(rows), 2)
+
+    def test_export_invalid_output(self):
+        """Test an unknown output format is rejected"""
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
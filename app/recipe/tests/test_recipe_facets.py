@@ -0,0 +1,117 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from .test_recipe_api import RECIPES_URL, sample_recipe, sample_tag, \
+    sample_ingredient
+
+
+@override_settings(
+    RECIPE_PRICE_FACETS=(5, 10), RECIPE_TIME_FACETS=(30,)
+)
+class RecipeFacetsTests(TestCase):
+    """Test the facet counts of the recipe list"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dinner = sample_tag(user=self.user, name='Dinner')
+        self.rice = sample_ingredient(user=self.user, name='Rice')
+        self.curry = sample_recipe(
+            user=self.user, title='Curry', price=6.50, time_minutes=40
+        )
+        self.curry.tags.add(self.vegan, self.dinner)
+        self.curry.ingredients.add(self.rice)
+        self.salad = sample_recipe(
+            user=self.user, title='Salad', price=3.00, time_minutes=10
+        )
+        self.salad.tags.add(self.vegan)
+        self.steak = sample_recipe(
+            user=self.user, title='Steak', price=14.00, time_minutes=25
+        )
+
+    def test_facets(self):
+        """Test the counts are returned next to the recipes"""
+        with self.assertNumQueries(5):
+            # the recipes, their tags and ingredients, and two queries
+            # for the facets
+            res = self.client.get(RECIPES_URL, {'facets': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 3)
+        facets = res.data['facets']
+        self.assertEqual(facets['tags'], [
+            {'id': self.vegan.id, 'count': 2},
+            {'id': self.dinner.id, 'count': 1},
+        ])
+        self.assertEqual(
+            facets['ingredients'], [{'id': self.rice.id, 'count': 1}]
+        )
+        self.assertEqual(facets['price'], [
+            {'min': 0, 'max': 5, 'count': 1},
+            {'min': 5, 'max': 10, 'count': 1},
+            {'min': 10, 'max': None, 'count': 1},
+        ])
+        self.assertEqual(facets['time_minutes'], [
+            {'min': 0, 'max': 30, 'count': 2},
+            {'min': 30, 'max': None, 'count': 1},
+        ])
+
+    def test_facets_follow_filters(self):
+        """Test only the recipes matching the filters are counted"""
+        res = self.client.get(
+            RECIPES_URL, {'facets': 1, 'tags': self.vegan.id,
+                          'max_time_minutes': 30}
+        )
+
+        facets = res.data['facets']
+        self.assertEqual(facets['tags'], [{'id': self.vegan.id, 'count': 1}])
+        self.assertEqual(facets['ingredients'], [])
+        self.assertEqual(
+            [bucket['count'] for bucket in facets['price']], [1, 0, 0]
+        )
+
+    def test_facets_flag_values(self):
+        """Test ?facets= takes true and false and rejects anything else"""
+        res = self.client.get(RECIPES_URL, {'facets': 'true'})
+
+        self.assertIn('facets', res.data)
+        res = self.client.get(RECIPES_URL, {'facets': 'false'})
+        self.assertIsInstance(res.data, list)
+        res = self.client.get(RECIPES_URL, {'facets': 'all'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facets_cached(self):
+        """Test the counts are cached until the recipes change"""
+        self.client.get(RECIPES_URL, {'facets': 1})
+
+        with self.assertNumQueries(3):
+            self.client.get(RECIPES_URL, {'facets': 1})
+
+        self.steak.tags.add(self.dinner)
+        res = self.client.get(RECIPES_URL, {'facets': 1})
+
+        self.assertEqual(
+            res.data['facets']['tags'][1],
+            {'id': self.dinner.id, 'count': 2}
+        )
+
+    def test_facets_with_pages(self):
+        """Test the counts cover all pages, not just the first"""
+        res = self.client.get(RECIPES_URL, {'facets': 1, 'page_size': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIn('next', res.data)
+        self.assertEqual(
+            sum(bucket['count'] for bucket in res.data['facets']['price']),
+            3
+        )
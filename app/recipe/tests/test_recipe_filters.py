@@ -0,0 +1,212 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.pagination import RecipeCursorPagination
+
+from .test_recipe_api import RECIPES_URL, sample_recipe, sample_tag
+
+
+class RecipeFilterTests(TestCase):
+    """Test the recipe range filters, orderings and pagination"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.quick = sample_recipe(
+            user=self.user, title='Quick', time_minutes=10, price=12.00
+        )
+        self.cheap = sample_recipe(
+            user=self.user, title='Cheap', time_minutes=45, price=4.50
+        )
+        self.slow = sample_recipe(
+            user=self.user, title='Slow', time_minutes=120, price=9.99
+        )
+
+    def titles(self, res):
+        """Return the recipe titles of a list response"""
+        return [recipe['title'] for recipe in res.data]
+
+    def test_range_filters(self):
+        """Test filtering on ranges of time and price"""
+        res = self.client.get(RECIPES_URL, {'max_time_minutes': 45})
+
+        self.assertEqual(self.titles(res), ['Cheap', 'Quick'])
+
+        res = self.client.get(
+            RECIPES_URL, {'min_price': '4.50', 'max_price': '10'}
+        )
+
+        self.assertEqual(self.titles(res), ['Slow', 'Cheap'])
+
+    def test_invalid_range_rejected(self):
+        """Test a bound that isn't a number is rejected"""
+        res = self.client.get(RECIPES_URL, {'max_price': 'cheap'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('max_price', res.data)
+
+        for params in ({'min_price': 'nan'}, {'max_price': 'Infinity'},
+                       {'min_price': '-Infinity'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_orderings(self):
+        """Test ordering on time and price"""
+        res = self.client.get(RECIPES_URL, {'ordering': 'time_minutes'})
+
+        self.assertEqual(self.titles(res), ['Quick', 'Cheap', 'Slow'])
+
+        res = self.client.get(RECIPES_URL, {'ordering': '-price'})
+
+        self.assertEqual(self.titles(res), ['Quick', 'Slow', 'Cheap'])
+
+    def test_unknown_ordering_rejected(self):
+        """Test an unknown ordering is rejected"""
+        res = self.client.get(RECIPES_URL, {'ordering': 'title'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_combine_with_tags(self):
+        """Test range filters combine with the tag filter"""
+        vegan = sample_tag(user=self.user, name='Vegan')
+        quick = sample_tag(user=self.user, name='Quick')
+        self.quick.tags.add(vegan, quick)
+        self.slow.tags.add(vegan)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{vegan.id},{quick.id}', 'ordering': 'price',
+            'max_price': '15',
+        })
+
+        self.assertEqual(self.titles(res), ['Slow', 'Quick'])
+        # Quick has both tags and is still only listed once
+
+    def test_cursor_pagination(self):
+        """Test paging through the recipes with a cursor"""
+        sample_recipe(user=self.user, title='Quicker', time_minutes=10)
+
+        res = self.client.get(
+            RECIPES_URL, {'ordering': 'time_minutes', 'page_size': 2}
+        )
+
+        self.assertEqual(
+            [recipe['title'] for recipe in res.data['results']],
+            ['Quick', 'Quicker']
+        )
+        self.assertIsNone(res.data['previous'])
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [recipe['title'] for recipe in res.data['results']],
+            ['Cheap', 'Slow']
+        )
+        self.assertIsNone(res.data['next'])
+
+    def test_cursor_pagination_with_fields(self):
+        """Test the cursor works when the ordering column isn't asked for"""
+        res = self.client.get(RECIPES_URL, {
+            'ordering': 'price', 'page_size': 1, 'fields': 'title'
+        })
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(res.data['results'], [{'title': 'Slow'}])
+
+    def test_cursor_pagination_ties(self):
+        """Test recipes with the same time are paged through both ways"""
+        for number in range(4):
+            sample_recipe(
+                user=self.user, title=f'Tie {number}', time_minutes=45
+            )
+        params = {'ordering': '-time_minutes', 'page_size': 2}
+        expected = ['Slow', 'Tie 3', 'Tie 2', 'Tie 1', 'Tie 0', 'Cheap',
+                    'Quick']
+
+        pages = []
+        res = self.client.get(RECIPES_URL, params)
+        while True:
+            pages.append([recipe['title'] for recipe in res.data['results']])
+            if res.data['next'] is None:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(sum(pages, []), expected)
+
+        previous = []
+        while res.data['previous'] is not None:
+            res = self.client.get(res.data['previous'])
+            previous.insert(
+                0, [recipe['title'] for recipe in res.data['results']]
+            )
+        self.assertEqual(previous, pages[:-1])
+
+    def test_cursor_page_read_from_index(self):
+        """Test a page after a cursor starts right at it in the index"""
+        paginator = RecipeCursorPagination()
+        paginator.ordering = ('price', 'id')
+        queryset = Recipe.objects.filter(user=self.user).order_by(
+            *paginator.ordering
+        ).filter(paginator.after_position(
+            Recipe, ['9.99', str(self.slow.id)], reverse=False
+        ))[:21]
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('core_recipe_user_price_idx', plan)
+        self.assertIn('Index Cond: ((user_id = ', plan)
+        self.assertIn('ROW(', plan.split('Filter')[0])
+        # the row comparison bounds the index scan, it isn't a filter
+        self.assertNotIn('Sort', plan)
+
+    def test_invalid_cursor_rejected(self):
+        """Test a cursor that wasn't handed out is rejected"""
+        res = self.client.get(
+            RECIPES_URL, {'ordering': 'price', 'page_size': 1}
+        )
+        cursor = res.data['next'].split('cursor=')[1]
+
+        res = self.client.get(RECIPES_URL, {
+            'ordering': '-id', 'page_size': 1, 'cursor': cursor
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unpaginated_by_default(self):
+        """Test the list is a plain list without ?page_size="""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 3)
+
+    def test_ordering_read_from_index(self):
+        """Test a range filtered, ordered page needs no sort"""
+        queryset = Recipe.objects.filter(
+            user=self.user, time_minutes__lte=30
+        ).order_by('-time_minutes', '-id')[:20]
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            # the test tables are tiny, which a sequential scan or
+            # sorting a handful of rows always wins on otherwise
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('core_recipe_user_time_idx', plan)
+        self.assertNotIn('Sort', plan)
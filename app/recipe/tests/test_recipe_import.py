@@ -0,0 +1,223 @@
+import io
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe, RecipeImport
+
+from ..importer import RecipeImporter
+
+
+IMPORT_URL = reverse('recipe:recipe-import-recipes')
+
+
+def ndjson(*rows):
+    """Return the rows as lines of newline delimited JSON"""
+    return [json.dumps(row) + '\n' for row in rows]
+
+
+def sample_row(title='Imported recipe', **params):
+    row = {
+        'title': title,
+        'time_minutes': 10,
+        'price': '4.50',
+        'tags': ['Vegan'],
+        'ingredients': ['Tofu', 'Rice'],
+    }
+    row.update(params)
+    return row
+
+
+class RecipeImporterTests(TestCase):
+    """Test importing recipes in chunks"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+
+    def start_import(self, format='ndjson'):
+        return RecipeImport.objects.create(
+            user=self.user, source='recipes', format=format
+        )
+
+    def test_import_creates_recipes_and_names(self):
+        """Test rows are imported with tags and ingredients by name"""
+        tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+        lines = ndjson(
+            sample_row('Stir fry'),
+            sample_row('Rice bowl', tags=[], ingredients=['Rice']),
+        )
+
+        result = RecipeImporter(self.start_import(), chunk_size=1).run(lines)
+
+        self.assertEqual(result.status, RecipeImport.DONE)
+        self.assertEqual(result.recipes_created, 2)
+        self.assertEqual(result.rows_done, 2)
+        stir_fry = Recipe.objects.get(title='Stir fry')
+        self.assertEqual(
+            sorted(stir_fry.ingredients.values_list('name', flat=True)),
+            ['Rice', 'Tofu']
+        )
+        self.assertEqual(Ingredient.objects.filter(name='Tofu').count(), 1)
+        # the existing ingredient is reused instead of duplicated
+        tofu.refresh_from_db()
+        self.assertEqual(tofu.usage_count, 1)
+        rice = Ingredient.objects.get(name='Rice')
+        self.assertEqual(rice.usage_count, 2)
+        self.assertEqual(Tag.objects.get(name='Vegan').usage_count, 1)
+
+    def test_import_chunk_queries(self):
+        """Test a chunk is written with a fixed number of queries"""
+        lines = ndjson(*[sample_row(f'Recipe {i}') for i in range(20)])
+        importer = RecipeImporter(self.start_import(), chunk_size=20)
+        importer.get_names(Tag)
+        importer.get_names(Ingredient)
+
+        with self.assertNumQueries(14):
+            # running status, savepoint, new tags, new ingredients,
+            # recipes, two through table inserts, one counter update per
+            # name, checkpoint, release, done status and the refresh.
+            # None of it depends on the number of rows in the chunk.
+            importer.run(lines)
+
+        self.assertEqual(Recipe.objects.count(), 20)
+
+    def test_invalid_rows_recorded(self):
+        """Test invalid rows are skipped and reported"""
+        lines = ndjson(sample_row(), sample_row(price='lots'))
+        lines.append('not json\n')
+
+        result = RecipeImporter(self.start_import()).run(lines)
+
+        self.assertEqual(result.recipes_created, 1)
+        self.assertEqual(result.error_count, 2)
+        self.assertEqual([error['row'] for error in result.errors], [2, 3])
+        self.assertIn('price', result.errors[0]['errors'])
+
+    def test_resume_after_failure(self):
+        """Test a failed import continues from its checkpoint"""
+        lines = ndjson(*[sample_row(f'Recipe {i}') for i in range(5)])
+        recipe_import = self.start_import()
+        insert = RecipeImporter.insert
+        calls = []
+
+        def failing_insert(importer, rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError('Database went away')
+            return insert(importer, rows)
+
+        with patch.object(RecipeImporter, 'insert', failing_insert):
+            with self.assertRaises(RuntimeError):
+                RecipeImporter(recipe_import, chunk_size=2).run(lines)
+
+        recipe_import.refresh_from_db()
+        self.assertEqual(recipe_import.status, RecipeImport.FAILED)
+        self.assertEqual(recipe_import.rows_done, 2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        result = RecipeImporter(recipe_import, chunk_size=2).run(lines)
+
+        self.assertEqual(result.status, RecipeImport.DONE)
+        self.assertEqual(result.rows_done, 5)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            [f'Recipe {i}' for i in range(5)]
+        )
+
+    def test_import_command(self):
+        """Test importing a CSV file with the management command"""
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', delete=False) as f:
+            f.write('title,time_minutes,price,link,tags,ingredients\n')
+            f.write('Pancakes,20,3.00,,Breakfast|Sweet,Flour|Eggs\n')
+        self.addCleanup(os.remove, f.name)
+
+        call_command(
+            'import_recipes', self.user.email, f.name, stdout=io.StringIO()
+        )
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Pancakes')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Breakfast', 'Sweet']
+        )
+
+
+class RecipeImportApiTests(TestCase):
+    """Test the recipe import API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def upload(self, lines, name='recipes.ndjson', **data):
+        data['file'] = SimpleUploadedFile(name, ''.join(lines).encode())
+        return self.client.post(IMPORT_URL, data, format='multipart')
+
+    @override_settings(RECIPE_IMPORT_CHUNK_SIZE=2)
+    def test_import_upload(self):
+        """Test uploading a file of recipes"""
+        res = self.upload(ndjson(*[sample_row(str(i)) for i in range(3)]))
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['status'], RecipeImport.DONE)
+        self.assertEqual(res.data['recipes_created'], 3)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+
+    def test_resume_upload(self):
+        """Test resuming an import skips the rows already imported"""
+        lines = ndjson(sample_row('First'), sample_row('Second'))
+        recipe_import = RecipeImport.objects.create(
+            user=self.user, source='recipes.ndjson', format='ndjson',
+            rows_done=1
+        )
+
+        res = self.upload(lines, import_id=recipe_import.id)
+
+        self.assertEqual(res.data['id'], recipe_import.id)
+        self.assertEqual(res.data['rows_done'], 2)
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), ['Second']
+        )
+
+    def test_cannot_resume_other_users_import(self):
+        """Test imports of other users can't be resumed"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        recipe_import = RecipeImport.objects.create(
+            user=other, source='recipes.ndjson', format='ndjson'
+        )
+
+        res = self.upload(ndjson(sample_row()), import_id=recipe_import.id)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_not_utf8(self):
+        """Test a file that isn't UTF-8 is rejected"""
+        data = {'file': SimpleUploadedFile(
+            'recipes.csv', 'title\nCrème brûlée\n'.encode('latin-1')
+        )}
+
+        res = self.client.post(IMPORT_URL, data, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', res.data)
+        self.assertEqual(RecipeImport.objects.get().status,
+                         RecipeImport.FAILED)
@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .test_recipe_api import RECIPES_URL, sample_recipe, sample_tag, \
+    sample_ingredient
+
+
+class RecipeIncludeTests(TestCase):
+    """Test sideloading related objects with ?include="""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.salt = sample_ingredient(user=self.user, name='Salt')
+        self.rice = sample_ingredient(user=self.user, name='Rice')
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.curry = sample_recipe(user=self.user, title='Curry')
+        self.curry.ingredients.add(self.salt, self.rice)
+        self.curry.tags.add(self.vegan)
+        self.chips = sample_recipe(user=self.user, title='Chips')
+        self.chips.ingredients.add(self.salt)
+
+    def test_included_once(self):
+        """Test each related object is sent once next to the ids"""
+        with self.assertNumQueries(3):
+            # the recipes, and one query for each relation
+            res = self.client.get(
+                RECIPES_URL, {'include': 'tags,ingredients'}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(res.data['results'][1]['ingredients']),
+            sorted([self.salt.id, self.rice.id])
+        )
+        self.assertEqual(res.data['included']['ingredients'], [
+            {'id': self.salt.id, 'name': 'Salt', 'usage_count': 2},
+            {'id': self.rice.id, 'name': 'Rice', 'usage_count': 1},
+        ])
+        self.assertEqual(
+            res.data['included']['tags'],
+            [{'id': self.vegan.id, 'name': 'Vegan', 'usage_count': 1}]
+        )
+
+    def test_include_without_field(self):
+        """Test a relation can be sideloaded without its id list"""
+        res = self.client.get(
+            RECIPES_URL, {'include': 'tags', 'fields': 'id,title'}
+        )
+
+        self.assertEqual(
+            res.data['results'][1], {'id': self.curry.id, 'title': 'Curry'}
+        )
+        self.assertEqual(len(res.data['included']['tags']), 1)
+
+    def test_include_with_pages(self):
+        """Test only the objects of the page are included"""
+        res = self.client.get(
+            RECIPES_URL, {'include': 'tags', 'page_size': 1}
+        )
+
+        self.assertEqual(res.data['results'][0]['title'], 'Chips')
+        self.assertEqual(res.data['included']['tags'], [])
+
+    def test_include_with_spaces(self):
+        """Test spaces and a trailing comma in ?include= are ignored"""
+        res = self.client.get(RECIPES_URL, {'include': 'tags, ingredients, '})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(res.data['included']), {'tags', 'ingredients'}
+        )
+
+    def test_unknown_include_rejected(self):
+        """Test only the recipe relations can be included"""
+        res = self.client.get(RECIPES_URL, {'include': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
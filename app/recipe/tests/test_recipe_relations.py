@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .test_recipe_api import sample_recipe, sample_tag, sample_ingredient
+
+
+BULK_RELATIONS_URL = reverse('recipe:recipe-bulk-relations')
+
+
+def relations_url(recipe_id):
+    """Return the relations URL of a recipe"""
+    return reverse('recipe:recipe-relations', args=[recipe_id])
+
+
+class RecipeRelationsTests(TestCase):
+    """Test adding and removing tags and ingredients of recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dessert = sample_tag(user=self.user, name='Dessert')
+        self.salt = sample_ingredient(user=self.user, name='Salt')
+        self.recipe.tags.add(self.vegan)
+        self.recipe.ingredients.add(self.salt)
+
+    def test_add_and_remove(self):
+        """Test tags and ingredients are added and removed by id"""
+        payload = {
+            'add': {'tags': [self.dessert.id]},
+            'remove': {'ingredients': [self.salt.id]},
+        }
+
+        res = self.client.post(
+            relations_url(self.recipe.id), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['added'], {'tags': 1, 'ingredients': 0})
+        self.assertEqual(res.data['removed'], {'tags': 0, 'ingredients': 1})
+        self.assertEqual(
+            set(self.recipe.tags.all()), {self.vegan, self.dessert}
+        )
+        self.assertEqual(self.recipe.ingredients.count(), 0)
+        self.dessert.refresh_from_db()
+        self.salt.refresh_from_db()
+        self.assertEqual(self.dessert.usage_count, 1)
+        self.assertEqual(self.salt.usage_count, 0)
+
+    def test_existing_rows_left_alone(self):
+        """Test adding an assigned tag or removing a missing one is a no-op"""
+        payload = {
+            'add': {'tags': [self.vegan.id]},
+            'remove': {'tags': [self.dessert.id]},
+        }
+
+        res = self.client.post(
+            relations_url(self.recipe.id), payload, format='json'
+        )
+
+        self.assertEqual(res.data['added'], {'tags': 0})
+        self.assertEqual(res.data['removed'], {'tags': 0})
+        self.vegan.refresh_from_db()
+        self.assertEqual(self.vegan.usage_count, 1)
+
+    def test_other_users_ids_rejected(self):
+        """Test tags of other users can't be added"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        tag = sample_tag(user=other, name='Theirs')
+
+        res = self.client.post(
+            relations_url(self.recipe.id),
+            {'add': {'tags': [tag.id]}}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+        self.assertEqual(list(self.recipe.tags.all()), [self.vegan])
+
+    def test_add_and_remove_same_id_rejected(self):
+        """Test an id can't be added and removed in one request"""
+        res = self.client.post(
+            relations_url(self.recipe.id),
+            {'add': {'tags': [self.dessert.id]},
+             'remove': {'tags': [self.dessert.id]}},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_add_tag(self):
+        """Test adding a tag to many recipes with a fixed query count"""
+        recipes = [self.recipe] + [
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+        payload = {
+            'recipes': [recipe.id for recipe in recipes],
+            'add': {'tags': [self.vegan.id, self.dessert.id]},
+        }
+
+        with self.assertNumQueries(9):
+            # validating the recipes and tags, savepoint, reading the
+            # affected rows, the insert, a counter update per tag,
+            # marking the recipes as changed and the release, whatever
+            # the number of recipes
+            res = self.client.post(BULK_RELATIONS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['added'], {'tags': 11})
+        self.vegan.refresh_from_db()
+        self.dessert.refresh_from_db()
+        self.assertEqual(self.vegan.usage_count, 6)
+        self.assertEqual(self.dessert.usage_count, 6)
+
+    def test_bulk_other_users_recipe_rejected(self):
+        """Test recipes of other users can't be changed in bulk"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        recipe = sample_recipe(user=other)
+
+        res = self.client.post(
+            BULK_RELATIONS_URL,
+            {'recipes': [recipe.id], 'add': {'tags': [self.vegan.id]}},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(recipe.tags.count(), 0)
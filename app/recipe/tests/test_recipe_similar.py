@@ -0,0 +1,161 @@
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeSignature
+
+from ..similarity import SimilarityIndex, minhash_many, recipe_tokens, \
+    update_signatures, _indexes
+from .test_recipe_api import detail_url, sample_recipe, sample_tag, \
+    sample_ingredient
+
+
+def similar_url(recipe_id):
+    """Return the similar recipes URL of a recipe"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class SimilarityIndexTests(TestCase):
+    """Test the MinHash index itself"""
+
+    def test_identical_recipes_found(self):
+        """Test recipes with the same tokens are found as the closest"""
+        tokens = [
+            recipe_tokens([1, 2], [3, 4, 5]),
+            recipe_tokens([1, 2], [3, 4, 5]),
+            recipe_tokens([7], [8, 9]),
+        ]
+        index = SimilarityIndex(np.array([10, 11, 12]), minhash_many(tokens))
+
+        self.assertEqual(index.similar(10, 5), [(11, 1.0)])
+        self.assertEqual(index.similar(99, 5), [])
+
+    def test_signatures_stored_compactly(self):
+        """Test a signature packs into 256 bytes"""
+        signature = minhash_many([recipe_tokens([1], [2])])[0]
+
+        self.assertEqual(len(signature.tobytes()), 256)
+
+
+class SimilarRecipesApiTests(TestCase):
+    """Test the similar recipes endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        _indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        names = ['Rice', 'Tofu', 'Chili', 'Garlic', 'Basil']
+        self.ingredients = [
+            sample_ingredient(user=self.user, name=name) for name in names
+        ]
+        self.curry = self.make_recipe('Curry', 0, 1, 2, 3)
+        self.stir_fry = self.make_recipe('Stir fry', 0, 1, 2)
+        self.pesto = self.make_recipe('Pesto', 3, 4)
+        self.toast = sample_recipe(user=self.user, title='Toast')
+
+    def make_recipe(self, title, *ingredients):
+        recipe = sample_recipe(user=self.user, title=title)
+        recipe.ingredients.add(*[self.ingredients[n] for n in ingredients])
+        return recipe
+
+    def test_similar_recipes(self):
+        """Test recipes are ranked by their exact similarity"""
+        update_signatures(Recipe.objects.values_list('id', flat=True))
+
+        res = self.client.get(similar_url(self.curry.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['id'], self.stir_fry.id)
+        self.assertEqual(res.data[0]['similarity'], 0.75)
+        ids = [item['id'] for item in res.data]
+        self.assertNotIn(self.curry.id, ids)
+        self.assertNotIn(self.toast.id, ids)
+
+    def test_similar_without_id_field(self):
+        """Test the scores are added when ?fields= leaves out the id"""
+        update_signatures(Recipe.objects.values_list('id', flat=True))
+
+        res = self.client.get(
+            similar_url(self.curry.id), {'fields': 'title'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data[0], {'title': 'Stir fry', 'similarity': 0.75}
+        )
+
+    def test_invalid_k_rejected(self):
+        """Test asking for no or a negative number of matches is rejected"""
+        for k in ('0', '-5', 'ten'):
+            res = self.client.get(similar_url(self.curry.id), {'k': k})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_recipes_not_similar(self):
+        """Test only the user's own recipes are suggested"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        copy = sample_recipe(user=other, title='Curry')
+        copy.ingredients.add(*self.curry.ingredients.all())
+        update_signatures(Recipe.objects.values_list('id', flat=True))
+
+        res = self.client.get(similar_url(self.curry.id))
+
+        self.assertNotIn(copy.id, [item['id'] for item in res.data])
+
+    def test_recipe_without_ingredients(self):
+        """Test a recipe without tags or ingredients has no matches"""
+        update_signatures([self.toast.id])
+
+        res = self.client.get(similar_url(self.toast.id))
+
+        self.assertEqual(res.data, [])
+        self.assertFalse(
+            RecipeSignature.objects.filter(recipe_id=self.toast.id).exists()
+        )
+
+
+class SimilarityUpdateTests(TransactionTestCase):
+    """Test the signatures follow changes once they're committed"""
+
+    def setUp(self):
+        cache.clear()
+        _indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_signatures_updated_on_change(self):
+        """Test changing the tags of a recipe rehashes it"""
+        vegan = sample_tag(user=self.user, name='Vegan')
+        quick = sample_tag(user=self.user, name='Quick')
+        soup = sample_recipe(user=self.user, title='Soup')
+        salad = sample_recipe(user=self.user, title='Salad')
+        soup.tags.add(vegan)
+        salad.tags.add(quick)
+
+        res = self.client.get(similar_url(soup.id))
+        self.assertEqual(res.data, [])
+
+        self.client.patch(detail_url(salad.id), {'tags': [vegan.id]})
+        res = self.client.get(similar_url(soup.id))
+
+        self.assertEqual([item['id'] for item in res.data], [salad.id])
+
+        salad.delete()
+
+        self.assertFalse(
+            RecipeSignature.objects.filter(recipe_id=salad.id).exists()
+        )
@@ -0,0 +1,85 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from ..serializers import RecipeSerializer
+from .test_recipe_api import RECIPES_URL, sample_recipe, sample_tag, \
+    sample_ingredient
+
+
+class RecipeStreamingTests(TestCase):
+    """Test streaming the recipe list with ?stream=1"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def read_stream(self, res):
+        """Join the streamed chunks and decode the JSON"""
+        self.assertTrue(res.streaming)
+        return json.loads(b''.join(res.streaming_content))
+
+    def test_stream_matches_list(self):
+        """Test the streamed list has the same recipes as the normal list"""
+        for title in ('Curry', 'Stew', 'Soup'):
+            recipe = sample_recipe(user=self.user, title=title)
+            recipe.tags.add(sample_tag(user=self.user))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        res = self.client.get(RECIPES_URL, {'stream': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        recipes = Recipe.objects.order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(self.read_stream(res), serializer.data)
+
+    def test_stream_empty_list(self):
+        """Test streaming when the user has no recipes"""
+        res = self.client.get(RECIPES_URL, {'stream': 1})
+
+        self.assertEqual(self.read_stream(res), [])
+
+    @override_settings(RECIPE_STREAM_CHUNK_SIZE=2)
+    def test_stream_queries_per_chunk(self):
+        """Test relations are prefetched once per chunk"""
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user))
+
+        res = self.client.get(RECIPES_URL, {'stream': 1})
+
+        with self.assertNumQueries(1 + 3 * 2):
+            # the cursor query plus tags and ingredients for 3 chunks
+            data = self.read_stream(res)
+        self.assertEqual(len(data), 5)
+
+    def test_stream_sparse_fields(self):
+        """Test the streamed list respects ?fields="""
+        recipe = sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'stream': 1, 'fields': 'id'})
+
+        self.assertEqual(self.read_stream(res), [{'id': recipe.id}])
+
+    def test_stream_flag_values(self):
+        """Test ?stream= takes true and false and rejects anything else"""
+        recipe = sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'stream': 'true'})
+
+        self.assertEqual(self.read_stream(res)[0]['id'], recipe.id)
+        res = self.client.get(RECIPES_URL, {'stream': 'false'})
+        self.assertEqual(res.data[0]['id'], recipe.id)
+        res = self.client.get(RECIPES_URL, {'stream': 'yes please'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
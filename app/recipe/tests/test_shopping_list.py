@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .test_recipe_api import sample_recipe, sample_ingredient
+
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+
+
+class ShoppingListTests(TestCase):
+    """Test the combined ingredient list of several recipes"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.rice = sample_ingredient(user=self.user, name='Rice')
+        self.tofu = sample_ingredient(user=self.user, name='Tofu')
+        self.curry = sample_recipe(
+            user=self.user, title='Curry', price=6.50, time_minutes=40
+        )
+        self.curry.ingredients.add(self.rice, self.tofu)
+        self.bowl = sample_recipe(
+            user=self.user, title='Bowl', price=3.25, time_minutes=15
+        )
+        self.bowl.ingredients.add(self.rice)
+
+    def get_list(self, *recipes):
+        return self.client.get(SHOPPING_LIST_URL, {
+            'recipes': ','.join(str(recipe.id) for recipe in recipes)
+        })
+
+    def test_shopping_list(self):
+        """Test the ingredients are combined with totals"""
+        with self.assertNumQueries(2):
+            # the totals and one grouped query for the ingredients
+            res = self.get_list(self.curry, self.bowl)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['total_price'], '9.75')
+        self.assertEqual(res.data['total_time_minutes'], 55)
+        self.assertEqual(res.data['ingredients'], [
+            {'id': self.rice.id, 'name': 'Rice', 'recipe_count': 2},
+            {'id': self.tofu.id, 'name': 'Tofu', 'recipe_count': 1},
+        ])
+
+    def test_shopping_list_cached(self):
+        """Test asking again is served from the cache"""
+        self.get_list(self.curry, self.bowl)
+
+        with self.assertNumQueries(0):
+            res = self.get_list(self.bowl, self.curry)
+
+        self.assertEqual(len(res.data['ingredients']), 2)
+
+    def test_change_invalidates_cache(self):
+        """Test changing a recipe invalidates the cached list"""
+        self.get_list(self.curry, self.bowl)
+
+        self.bowl.ingredients.add(self.tofu)
+        res = self.get_list(self.curry, self.bowl)
+
+        self.assertEqual(res.data['ingredients'][1]['recipe_count'], 2)
+
+    def test_other_users_recipe_rejected(self):
+        """Test recipes of other users can't be used"""
+        other = get_user_model().objects.create_user('other@x.com', 'pass')
+        recipe = sample_recipe(user=other)
+
+        res = self.get_list(self.curry, recipe)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipes_required(self):
+        """Test at least one recipe id has to be given"""
+        res = self.client.get(SHOPPING_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -5,7 +5,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Tag, Recipe
 
 from ..serializers import TagSerializer
 
@@ -119,3 +119,102 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.post(TAGS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_tags_sparse_fields(self):
+        """Test the tag list can be limited to some fields"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL, {'fields': 'name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'name': 'Vegan'}])
+
+    def test_retrieve_tags_assigned_only(self):
+        """Test filtering tags by those assigned to recipes"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        for title in ('Eggs', 'Porridge'):
+            recipe = Recipe.objects.create(
+                user=self.user, title=title, time_minutes=5, price=2.00
+            )
+            recipe.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(res.data, [
+            {'id': tag1.id, 'name': tag1.name, 'usage_count': 2},
+        ])
+        self.assertNotIn(tag2.name, [tag['name'] for tag in res.data])
+
+    def test_retrieve_tags_recipe_count(self):
+        """Test the tags can include how many recipes use them"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        for title in ('Eggs', 'Porridge'):
+            recipe = Recipe.objects.create(
+                user=self.user, title=title, time_minutes=5, price=2.00
+            )
+            recipe.tags.add(tag1)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'recipe_count': 1})
+
+        self.assertEqual(res.data, [
+            {'id': tag2.id, 'name': tag2.name, 'usage_count': 0,
+             'recipe_count': 0},
+            {'id': tag1.id, 'name': tag1.name, 'usage_count': 2,
+             'recipe_count': 2},
+        ])
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                TAGS_URL, {'recipe_count': 1, 'assigned_only': 1}
+            )
+
+        self.assertEqual(res.data, [
+            {'id': tag1.id, 'name': tag1.name, 'usage_count': 2,
+             'recipe_count': 2},
+        ])
+
+    def test_retrieve_tags_boolean_params(self):
+        """Test the flags take true and false and reject anything else"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Lunch')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Eggs', time_minutes=5, price=2.00
+        )
+        recipe.tags.add(tag)
+
+        res = self.client.get(
+            TAGS_URL, {'assigned_only': 'true', 'recipe_count': 'false'}
+        )
+
+        self.assertEqual(res.data, [
+            {'id': tag.id, 'name': tag.name, 'usage_count': 1},
+        ])
+
+        for params in ({'assigned_only': 'maybe'}, {'recipe_count': '2'}):
+            res = self.client.get(TAGS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_tags_by_popularity(self):
+        """Test ordering the tags by how many recipes use them"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Eggs', time_minutes=5, price=2.00
+        )
+        recipe.tags.add(tag2)
+
+        res = self.client.get(TAGS_URL, {'ordering': '-usage_count'})
+
+        self.assertEqual(
+            [tag['id'] for tag in res.data], [tag2.id, tag1.id]
+        )
+
+    def test_retrieve_tags_unknown_ordering(self):
+        """Test an unsupported ordering is rejected"""
+        res = self.client.get(TAGS_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,17 +1,43 @@
+import codecs
+
 from rest_framework.decorators import action
 # add custom actions to your view set
 from rest_framework.response import Response
 # this is for returning a custom response
 
+from django.conf import settings
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, prefetch_related_objects
+from django.http import StreamingHttpResponse
+
 from rest_framework import viewsets, mixins, status
 # check the status we're going to use it to generate a
 # status for our custom action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField, DateTimeField
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-from core.models import Tag, Ingredient, Recipe
+from core.compression import compress_stream
+from core.models import Tag, Ingredient, Recipe, RecipeImport
+from core.purge import soft_delete_recipe
+from user.authentication import SignedTokenAuthentication
 
 from . import serializers
+from .bitmaps import filter_recipe_ids
+from .changes import decode_cursor, get_changes
+from .export import EXPORT_FORMATS, iter_export_chunks
+from .facets import get_facets
+from .importer import RecipeImporter, guess_format
+from .mealplan import load_recipes, plan_meals
+from .pagination import RecipeCursorPagination
+from .relations import change_relations, get_relation
+from .shopping import get_shopping_list
+from .similarity import find_similar
+from .streaming import iter_chunks, stream_json_array
 
 # we're going to base our new class off the common base classes
 # that the ingredients and the tags use so that is viewsets.
@@ -19,17 +45,147 @@ from . import serializers
 # for making each view set unique
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+def get_flag(request, name):
+    """Return the value of a boolean query param, False when it's missing
+
+    Takes the same values as a BooleanField, 1 and 0, true and false...
+    """
+    value = request.query_params.get(name)
+    if value is None:
+        return False
+    try:
+        return BooleanField().to_internal_value(value)
+    except ValidationError:
+        raise ValidationError({name: 'Must be true or false.'})
+
+
+def split_names(value):
+    """Return the names in a comma separated query param"""
+    names = (name.strip() for name in value.split(','))
+    return [name for name in names if name]
+    # stripped before the empty ones are dropped, so spaces and a
+    # trailing comma don't count as a name
+
+
+class SparseFieldsMixin:
+    """Let clients ask for a subset of the fields with ?fields=id,title"""
+
+    def get_requested_fields(self):
+        """Return the fields asked for in the query string, if any"""
+        fields = self.request.query_params.get('fields')
+        if not fields or self.request.method != 'GET':
+            # only reads can be trimmed, writes always validate and
+            # return the whole object
+            return None
+
+        requested = split_names(fields)
+        if not requested:
+            return None
+        available = self.get_serializer_class().Meta.fields
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise ValidationError(
+                {'fields': 'Unknown fields: {}'.format(', '.join(unknown))}
+            )
+
+        return requested
+
+    def get_serializer(self, *args, **kwargs):
+        """Pass the requested fields through to the serializer"""
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_prefetch_lookups(self, model):
+        """Return the relations that will be serialized"""
+        many_to_many = [field.name for field in model._meta.many_to_many]
+        fields = self.get_requested_fields()
+        if fields is None:
+            return many_to_many
+        return [name for name in many_to_many if name in fields]
+        # a relation that wasn't asked for isn't prefetched at all
+
+    def trim_queryset(self, queryset, keep=()):
+        """Only load the columns and relations that will be serialized
+
+        keep names columns that are needed even if they aren't asked for.
+        """
+        if self.request.method != 'GET':
+            return queryset
+        opts = queryset.model._meta
+        fields = self.get_requested_fields()
+        if fields is not None:
+            columns = {field.name for field in opts.concrete_fields}
+            queryset = queryset.only(
+                opts.pk.name, *keep,
+                *[name for name in fields if name in columns]
+            )
+            # only() loads just these columns and defers the others, the
+            # primary key is always loaded so the objects still work
+
+        return queryset.prefetch_related(
+            *self.get_prefetch_lookups(queryset.model)
+        )
+
+
+class OrderingMixin:
+    """Let clients choose one of the viewset's orderings with ?ordering="""
+    orderings = {}
+    default_ordering = None
+
+    def get_ordering(self):
+        """Return the order_by() arguments for the ?ordering= param"""
+        ordering = self.request.query_params.get(
+            'ordering', self.default_ordering
+        )
+        if ordering not in self.orderings:
+            raise ValidationError(
+                {'ordering': 'Unknown ordering: {}'.format(ordering)}
+            )
+        return self.orderings[ordering]
+
+
+class BaseRecipeAttrViewSet(SparseFieldsMixin,
+                            OrderingMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (SignedTokenAuthentication, TokenAuthentication)
     permission_classes = (IsAuthenticated,)
+    orderings = {
+        'name': ('name',),
+        '-name': ('-name',),
+        'usage_count': ('usage_count', '-name'),
+        '-usage_count': ('-usage_count', 'name'),
+    }
+    default_ordering = '-name'
+    # the usage count orderings follow the (user, -usage_count, name)
+    # index forwards or backwards, so the most used objects are read
+    # straight from the index without sorting
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
+        assigned_only = get_flag(self.request, 'assigned_only')
+        # only return the objects that are assigned to a recipe
+        recipe_count = get_flag(self.request, 'recipe_count') or \
+            'recipe_count' in (self.get_requested_fields() or ())
+        queryset = self.queryset.filter(user=self.request.user)
+
+        if assigned_only:
+            queryset = queryset.filter(recipe__isnull=False)
+            # inner join on the recipe through table, which gives us a
+            # row per recipe the object is assigned to
+        if recipe_count:
+            queryset = queryset.annotate(recipe_count=Count('recipe'))
+            # the count is annotated after the filter so it reuses the
+            # same join, and grouping by the object folds the duplicate
+            # rows back into one, so it's still a single query
+        elif assigned_only:
+            queryset = queryset.distinct()
 
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        return self.trim_queryset(queryset).order_by(*self.get_ordering())
 
     def perform_create(self, serializer):
         """Create a new ingredient"""
@@ -100,14 +256,37 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
 #         serializer.save(user=self.request.user)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SparseFieldsMixin, OrderingMixin, viewsets.ModelViewSet):
     """Manage recipes in the database"""
     # allow them to
     # update and to create and to view details
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (SignedTokenAuthentication, TokenAuthentication)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+    orderings = {
+        '-id': ('-id',),
+        'id': ('id',),
+        'time_minutes': ('time_minutes', 'id'),
+        '-time_minutes': ('-time_minutes', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+    default_ordering = '-id'
+    included = {
+        'tags': serializers.TagSerializer,
+        'ingredients': serializers.IngredientSerializer,
+    }
+    # the relations the list can sideload with ?include=
+    # the time and price orderings follow the (user, time_minutes, id)
+    # and (user, price, id) indexes forwards or backwards, the id breaks
+    # ties so the order is stable from one page to the next
+    ranges = {
+        'time_minutes': int,
+        'price': Decimal,
+    }
+    # ?min_time_minutes=, ?max_price= and so on, the bounds are inclusive
 
     def _params_to_ints(self, qs):
         # qs: query string
@@ -140,14 +319,73 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # we want to actually reference it here by query set
         # apply the filters and then return that instead of
         # our main query set
+        relations = {}
         if tags:
-            tag_ids = self._params_to_ints(tags)
+            relations['tags'] = self._params_to_ints(tags)
             # convert it to a list of ID's
-            queryset = queryset.filter(tags__id__in=tag_ids)
         if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-        return queryset.filter(user=self.request.user)
+            relations['ingredients'] = self._params_to_ints(ingredients)
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': 'Choose one of: any, all'})
+        # ?match=all only returns the recipes with all of the given tags
+        # (and all of the ingredients) instead of any of them
+
+        if relations and settings.RECIPE_BITMAP_INDEX:
+            queryset = queryset.filter(id__in=filter_recipe_ids(
+                self.request.user.pk, relations, match == 'all'
+            ))
+            # matched in memory, only the recipes are read from the
+            # database
+        else:
+            for field_name, target_ids in relations.items():
+                queryset = queryset.filter(id__in=self._relation_subquery(
+                    field_name, target_ids, match == 'all'
+                ))
+        queryset = queryset.filter(
+            user=self.request.user, **self.get_range_filters()
+        )
+        ordering = self.get_ordering()
+        return self.trim_queryset(
+            queryset, keep=[name.lstrip('-') for name in ordering]
+        ).order_by(*ordering)
+        # the ordering columns are always loaded, the cursor of the next
+        # page is made from them
+
+    def _relation_subquery(self, field_name, target_ids, match_all):
+        """Return the ids of the recipes with any or all of the targets"""
+        through, target, column = get_relation(field_name)
+        subquery = through.objects.filter(
+            **{column + '_id__in': target_ids}
+        ).values('recipe_id')
+        # a subquery instead of a join, so a recipe with several of the
+        # ids is still only returned once and no DISTINCT (and the sort
+        # that comes with it) is needed
+        if match_all:
+            subquery = subquery.annotate(
+                matched=Count(column + '_id')
+            ).filter(matched=len(set(target_ids))).values('recipe_id')
+            # GROUP BY the recipe, and keep the ones that have all of them
+        return subquery
+
+    def get_range_filters(self):
+        """Return the filter() arguments for the range query params"""
+        filters = {}
+        for field_name, convert in self.ranges.items():
+            for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+                param = f'{bound}_{field_name}'
+                value = self.request.query_params.get(param)
+                if value is None:
+                    continue
+                try:
+                    value = convert(value)
+                    if isinstance(value, Decimal) and not value.is_finite():
+                        raise InvalidOperation
+                        # NaN and Infinity parse, but aren't prices
+                except (ValueError, InvalidOperation):
+                    raise ValidationError({param: 'Must be a number.'})
+                filters[f'{field_name}__{lookup}'] = value
+        return filters
 # rest framework documentation: this is the function that's called
 # to retrieve the serializer class for a particular request
 # and it is this function that you would use if you wanted to change
@@ -167,6 +405,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'import_recipes':
+            return serializers.RecipeImportUploadSerializer
+        elif self.action == 'relations':
+            return serializers.RecipeRelationsSerializer
+        elif self.action == 'bulk_relations':
+            return serializers.RecipeBulkRelationsSerializer
+        elif self.action == 'meal_plan':
+            return serializers.MealPlanSerializer
 
         return self.serializer_class
 # if the action is retrieve and we want to return the default,
@@ -177,6 +423,97 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Hide the recipe now, its row and image are removed later"""
+        soft_delete_recipe(instance)
+
+    def get_includes(self):
+        """Return the relations asked for with ?include=tags,ingredients"""
+        include = self.request.query_params.get('include')
+        if not include or self.action != 'list':
+            return []
+        includes = split_names(include)
+        unknown = [name for name in includes if name not in self.included]
+        if unknown:
+            raise ValidationError(
+                {'include': 'Unknown relations: {}'.format(', '.join(unknown))}
+            )
+        return includes
+
+    def get_prefetch_lookups(self, model):
+        """Also prefetch the relations that are sideloaded"""
+        lookups = super().get_prefetch_lookups(model)
+        return lookups + [
+            name for name in self.get_includes() if name not in lookups
+        ]
+
+    def get_included(self, recipes, includes):
+        """Return the distinct related objects of the recipes, serialized
+        once each"""
+        included = {}
+        for field_name in includes:
+            objects = {}
+            for recipe in recipes:
+                for obj in getattr(recipe, field_name).all():
+                    objects[obj.pk] = obj
+                    # read from the prefetch, which was one query for the
+                    # whole page
+            included[field_name] = self.included[field_name](
+                sorted(objects.values(), key=lambda obj: obj.pk), many=True,
+                fields=('id', 'name', 'usage_count')
+            ).data
+        return included
+
+    def list(self, request, *args, **kwargs):
+        """List the recipes, streaming them if ?stream=1 is passed
+
+        ?include= adds the related objects of the recipes once each in an
+        "included" section, and ?facets=1 the counts of the filters. The
+        list is then wrapped in an object with the list as "results".
+        """
+        if get_flag(request, 'stream'):
+            return self.stream_list()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        data = self.get_serializer(recipes, many=True).data
+
+        extra = {}
+        includes = self.get_includes()
+        if includes:
+            extra['included'] = self.get_included(recipes, includes)
+        if get_flag(request, 'facets'):
+            extra['facets'] = get_facets(request.user, queryset)
+        if page is not None:
+            response = self.get_paginated_response(data)
+            response.data.update(extra)
+            # a page, which is already an object
+            return response
+        if extra:
+            return Response({'results': data, **extra})
+        return Response(data)
+
+    def stream_list(self):
+        """Stream the recipe list as a JSON array, one chunk at a time"""
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.using(queryset.db)
+        # the rows are read after the view has returned, so the database
+        # is chosen now while the router still knows about the request
+        lookups = self.get_prefetch_lookups(queryset.model)
+        # iterator() skips prefetch_related so we prefetch the
+        # relations for each chunk ourselves, that's one query per
+        # relation per chunk instead of one per recipe
+
+        def serialize(chunk):
+            prefetch_related_objects(chunk, *lookups)
+            return self.get_serializer(chunk, many=True).data
+
+        chunks = iter_chunks(queryset, settings.RECIPE_STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(
+            stream_json_array(chunks, serialize),
+            content_type='application/json'
+        )
+
 # ModelViewSet allows you to create objects out of the box
 # So with the default functionality of it is if you pass a
 # serializer class and it's assigned to a model then it
@@ -219,3 +556,227 @@ class RecipeViewSet(viewsets.ModelViewSet):
             # Django rest framework
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream all of the user's recipes as NDJSON or CSV"""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError(
+                {'output': 'Choose one of: {}'.format(
+                    ', '.join(EXPORT_FORMATS)
+                )}
+            )
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        queryset = queryset.using(queryset.db)
+        since = request.query_params.get('since')
+        if since:
+            # only export the recipes created or changed since the given
+            # time, so a client can pass the time its last export started
+            # to pick up what's new (deleted recipes are in /changes/)
+            try:
+                since = DateTimeField().to_internal_value(since)
+            except ValidationError:
+                raise ValidationError({'since': 'Must be a date and time.'})
+            queryset = queryset.filter(updated_at__gte=since)
+
+        format_lines, content_type = EXPORT_FORMATS[output]
+        chunks = iter_export_chunks(
+            queryset, settings.RECIPE_EXPORT_CHUNK_SIZE
+        )
+        content = format_lines(chunks)
+        filename = f'recipes.{output}'
+        if get_flag(request, 'gzip'):
+            content = compress_stream(
+                'gzip', settings.COMPRESSION_LEVELS['gzip'],
+                (lines.encode() for lines in content)
+            )
+            content_type = 'application/gzip'
+            filename += '.gz'
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}"'
+        )
+        return response
+
+    @action(methods=['POST'], detail=False, url_path='import')
+    def import_recipes(self, request):
+        """Import recipes from an uploaded NDJSON or CSV file"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['file']
+        import_id = serializer.validated_data.get('import_id')
+
+        if import_id:
+            # continue a previous import of the same file
+            try:
+                recipe_import = RecipeImport.objects.get(
+                    pk=import_id, user=request.user
+                )
+            except RecipeImport.DoesNotExist:
+                raise ValidationError({'import_id': 'Unknown import.'})
+        else:
+            recipe_import = RecipeImport.objects.create(
+                user=request.user,
+                source=upload.name,
+                format=serializer.validated_data.get(
+                    'format', guess_format(upload.name)
+                ),
+            )
+
+        importer = RecipeImporter(
+            recipe_import, settings.RECIPE_IMPORT_CHUNK_SIZE
+        )
+        lines = codecs.iterdecode(upload, 'utf-8')
+        # iterating the upload gives us its lines one at a time
+        try:
+            importer.run(lines)
+        except UnicodeDecodeError:
+            raise ValidationError({'file': 'Must be UTF-8 encoded.'})
+            # the rows before the bad line are committed, the import is
+            # marked as failed and can be resumed with a fixed file
+        recipe_import.refresh_from_db()
+
+        return Response(
+            serializers.RecipeImportSerializer(recipe_import).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(methods=['POST'], detail=True, url_path='relations')
+    def relations(self, request, pk=None):
+        """Add or remove tags and ingredients of a recipe
+
+        The body looks like {"add": {"tags": [1]}, "remove": {...}}, only
+        the through table rows for the given ids are touched.
+        """
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            result = change_relations(
+                [recipe.id],
+                serializer.validated_data['add'],
+                serializer.validated_data['remove'],
+                request.user.pk
+            )
+        return Response(result, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=False, url_path='relations')
+    def bulk_relations(self, request):
+        """Add or remove tags and ingredients of many recipes at once"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            result = change_relations(
+                serializer.validated_data['recipes'],
+                serializer.validated_data['add'],
+                serializer.validated_data['remove'],
+                request.user.pk
+            )
+        return Response(result, status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Return the combined ingredients of ?recipes=1,2,3"""
+        recipes = request.query_params.get('recipes')
+        try:
+            recipe_ids = self._params_to_ints(recipes) if recipes else []
+        except ValueError:
+            raise ValidationError({'recipes': 'Must be recipe ids.'})
+        if not recipe_ids:
+            raise ValidationError({'recipes': 'Pass at least one recipe.'})
+
+        return Response(get_shopping_list(request.user, recipe_ids))
+
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """Return the recipes with the most similar tags and ingredients"""
+        recipe = self.get_object()
+        try:
+            k = min(int(request.query_params.get('k', 10)), 50)
+        except ValueError:
+            raise ValidationError({'k': 'Must be a number.'})
+        if k < 1:
+            raise ValidationError({'k': 'Must be at least 1.'})
+
+        scores = dict(find_similar(request.user.pk, recipe.id, k))
+        recipes = list(self.get_queryset().filter(id__in=scores))
+        recipes.sort(key=lambda match: -scores[match.id])
+        data = self.get_serializer(recipes, many=True).data
+        for item, match in zip(data, recipes):
+            item['similarity'] = scores[match.id]
+        # matched up by position, ?fields= may have left the id out
+
+        return Response(data)
+
+    @action(methods=['POST'], detail=False, url_path='meal-plan')
+    def meal_plan(self, request):
+        """Plan meals within a price and time budget"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        meals = serializer.validated_data['meals']
+        max_price = float(serializer.validated_data['max_price'])
+        max_time = serializer.validated_data['max_time_minutes']
+
+        ids, prices, times, scores = load_recipes(
+            request.user, max_price, max_time,
+            serializer.validated_data.get('preferences', {})
+        )
+        plan, complete = plan_meals(
+            prices, times, scores, meals, max_price, max_time,
+            settings.MEAL_PLAN_TIME_BUDGET, settings.MEAL_PLAN_CANDIDATES
+        )
+        if plan is None:
+            raise ValidationError(
+                {'non_field_errors': ['No plan fits within the budgets.']}
+            )
+
+        recipes = {
+            recipe.id: recipe
+            for recipe in self.get_queryset().filter(id__in=ids[plan])
+            .prefetch_related('tags', 'ingredients')
+        }
+        planned = [recipes[pk] for pk in ids[plan].tolist()]
+        return Response({
+            'recipes': serializers.RecipeSerializer(planned, many=True).data,
+            'total_price': '{:.2f}'.format(prices[plan].sum()),
+            'total_time_minutes': int(times[plan].sum()),
+            'score': float(scores[plan].sum()),
+            'complete': complete,
+            # false when the time budget ran out and the plan was picked
+            # from only part of the recipes
+        })
+
+
+class ChangesView(APIView):
+    """List what changed in the user's library since the last sync"""
+    authentication_classes = (SignedTokenAuthentication, TokenAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        """Return a page of the changes after ?since="""
+        try:
+            limit = int(
+                request.query_params.get('limit', settings.CHANGES_PAGE_SIZE)
+            )
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number.'})
+        if not 1 <= limit <= settings.CHANGES_MAX_PAGE_SIZE:
+            raise ValidationError({
+                'limit': 'Must be between 1 and {}.'.format(
+                    settings.CHANGES_MAX_PAGE_SIZE
+                )
+            })
+        since = request.query_params.get('since')
+        try:
+            position = decode_cursor(since) if since else None
+        except ValueError:
+            raise ValidationError({'since': 'Not a valid cursor.'})
+        # without ?since= every object is sent, in pages like any other
+        # changes, which is how a new client does its first sync
+
+        return Response(get_changes(
+            request.user, position, limit, context={'request': request}
+        ))
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import tokens
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """Authenticate requests with a short lived signed access token
+
+    Clients pass the token in the "Authorization" header, prepended with
+    the string "Bearer ". Unlike the opaque tokens of TokenAuthentication
+    the token is verified from its signature, so no query is made.
+    """
+    keyword = 'Bearer'
+    # we reuse the header parsing of the token authentication and only
+    # change how the credentials are checked
+
+    def authenticate_credentials(self, key):
+        try:
+            user_id, jti, exp = tokens.read_token(key, tokens.ACCESS)
+        except tokens.InvalidToken as exc:
+            raise exceptions.AuthenticationFailed(str(exc))
+
+        if tokens.deny_list.is_revoked(user_id, jti, exp):
+            raise exceptions.AuthenticationFailed(_('Token has been revoked.'))
+        # revoked on its own, or along with all of the user's tokens when
+        # the account was deleted
+
+        user = get_user_model()(pk=user_id, is_active=True)
+        # build the user from the token instead of loading it, this is
+        # enough for filtering by user or assigning it to new objects.
+        # Views that need the full user have to load it themselves.
+        user._state.adding = False
+        return (user, key)
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Min
+from django.utils import timezone
+
+from core.jobs import job
+from core.models import Ingredient, Recipe, RecipeImport, RevokedToken, \
+    Tag, Tombstone
+from core.purge import purge_recipes, purge_rows
+
+from .tokens import schedule_purge
+
+
+@job('user.purge_revoked_tokens', concurrency=1)
+def purge_revoked_tokens():
+    """Delete the revoked tokens that have expired anyway"""
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    next_expiry = RevokedToken.objects.aggregate(
+        next_expiry=Min('expires_at')
+    )['next_expiry']
+    if next_expiry is not None:
+        schedule_purge(next_expiry)
+        # the revocations queued behind this job's purge
+
+
+@job('user.delete_account', concurrency=2)
+def delete_account(user_id):
+    """Delete a deactivated user and everything they own, in batches"""
+    user = get_user_model().objects.filter(
+        pk=user_id, is_active=False
+    ).first()
+    if user is None:
+        return
+        # gone already, or reactivated in the meantime
+    purge_recipes(user_id, Recipe.all_objects.all())
+    for model in (Tag, Ingredient, RecipeImport, Tombstone):
+        purge_rows(model.objects.filter(user_id=user_id))
+        # the recipes that used the tags and ingredients are gone, so
+        # nothing points at them anymore
+    user.delete()
+    # what's left is small, like the user's auth token
@@ -10,6 +10,10 @@ from django.utils.translation import ugettext_lazy as _
 # easily add the language file and it will
 # automatically convert all of the text to the correct language.
 
+from core.models import RevokedToken
+
+from . import tokens
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the users object"""
@@ -96,3 +100,60 @@ class AuthTokenSerializer(serializers.Serializer):
     # whenever you're overriding the validate
     # function you must return the values at the end once the validation is
     # successful.
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for exchanging a refresh token for a new access token"""
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        """Check the refresh token and return a new access token"""
+        try:
+            user_id, jti, exp = tokens.read_token(
+                attrs['refresh'], tokens.REFRESH
+            )
+        except tokens.InvalidToken as exc:
+            raise serializers.ValidationError(str(exc), code='authorization')
+
+        # refreshing is rare compared to normal requests so this is
+        # where we check the database: the token mustn't be revoked
+        # and the user must still be active
+        revoked = RevokedToken.objects.filter(jti=jti).exists()
+        active = get_user_model().objects.filter(
+            pk=user_id, is_active=True
+        ).exists()
+        if revoked or not active:
+            msg = _('Unable to refresh with provided credentials')
+            raise serializers.ValidationError(msg, code='authorization')
+
+        attrs['access'] = tokens.make_token(user_id, tokens.ACCESS)
+        return attrs
+
+
+class RevokeTokenSerializer(serializers.Serializer):
+    """Serializer for revoking signed tokens"""
+    access = serializers.CharField(required=False)
+    refresh = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        """Read the claims of the tokens that should be revoked"""
+        claims = []
+        for token_type in (tokens.ACCESS, tokens.REFRESH):
+            if token_type not in attrs:
+                continue
+            try:
+                claims.append(tokens.read_token(attrs[token_type], token_type))
+            except tokens.InvalidToken as exc:
+                raise serializers.ValidationError({token_type: str(exc)})
+
+        if not claims:
+            msg = _('Provide an access or refresh token to revoke')
+            raise serializers.ValidationError(msg)
+
+        user = self.context['request'].user
+        if any(user_id != user.pk for user_id, jti, exp in claims):
+            msg = _('You can only revoke your own tokens')
+            raise serializers.ValidationError(msg)
+
+        attrs['claims'] = claims
+        return attrs
@@ -0,0 +1,193 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user import tokens
+
+
+TOKEN_URL = reverse('user:token')
+REVOKE_URL = reverse('user:revoke')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_user(**params):
+    """Helper function to create new user that you're testing with"""
+    return get_user_model().objects.create_user(**params)
+
+
+class SignedTokenApiTests(TestCase):
+    """Test the signed access and refresh tokens"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='test@londonappdev.com',
+            password='testpass',
+            name='Test name'
+        )
+        tokens.deny_list.clear()
+        # the deny list lives in memory so start every test clean
+
+    def get_tokens(self):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@londonappdev.com',
+            'password': 'testpass',
+        })
+        return res.data
+
+    def test_login_returns_both_token_kinds(self):
+        """Test logging in returns the opaque and the signed tokens"""
+        data = self.get_tokens()
+
+        self.assertIn('token', data)
+        self.assertIn('access', data)
+        self.assertIn('refresh', data)
+
+    def test_access_token_authenticates_without_queries(self):
+        """Test a signed token is verified without a database lookup"""
+        access = self.get_tokens()['access']
+        tokens.deny_list.sync()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+
+        with self.assertNumQueries(1):
+            # the only query left is the one listing the tags
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_opaque_token_still_works(self):
+        """Test the opaque tokens keep working alongside signed tokens"""
+        token = self.get_tokens()['token']
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_me_loads_user_for_signed_token(self):
+        """Test the profile is loaded when using a signed token"""
+        access = self.get_tokens()['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['name'], self.user.name)
+
+    def test_refresh_token_not_accepted_as_access(self):
+        """Test a refresh token can't be used to authenticate"""
+        refresh = self.get_tokens()['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + refresh)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tampered_token_rejected(self):
+        """Test a token with a modified payload is rejected"""
+        access = self.get_tokens()['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer x' + access)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SIGNED_TOKEN_ACCESS_LIFETIME=60)
+    def test_expired_access_token_rejected(self):
+        """Test access tokens stop working once they expire"""
+        access = self.get_tokens()['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+
+        with patch('user.tokens.time.time', return_value=10 ** 11):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_returns_new_access_token(self):
+        """Test exchanging a refresh token for a new access token"""
+        refresh = self.get_tokens()['refresh']
+
+        res = self.client.post(TOKEN_URL, {'refresh': refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        access = res.data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_refresh_inactive_user_fails(self):
+        """Test a deactivated user can't refresh their token"""
+        refresh = self.get_tokens()['refresh']
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(TOKEN_URL, {'refresh': refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('access', res.data)
+
+    def test_revoke_tokens(self):
+        """Test revoked tokens are denied for access and refresh"""
+        data = self.get_tokens()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + data['access'])
+
+        res = self.client.post(REVOKE_URL, {
+            'access': data['access'],
+            'refresh': data['refresh'],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.client.get(TAGS_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+        self.client.credentials()
+        res = self.client.post(TOKEN_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deny_list_synced_from_database(self):
+        """Test other processes pick up revocations when they sync"""
+        data = self.get_tokens()
+        user_id, jti, exp = tokens.read_token(data['access'])
+        tokens.revoke(jti, exp)
+        tokens.deny_list.clear()
+        # simulate a process that hasn't seen the revocation yet
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + data['access'])
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_user_tokens(self):
+        """Test revoking a user's tokens leaves the ones made after alone"""
+        access = tokens.make_token(self.user.pk)
+        tokens.revoke_user(self.user.pk)
+        tokens.deny_list.clear()
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        with patch('user.tokens.time.time', return_value=time.time() + 1):
+            access = tokens.make_token(self.user.pk)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_cannot_revoke_other_users_token(self):
+        """Test revoking someone else's token is rejected"""
+        other = create_user(email='other@londonappdev.com', password='pass123')
+        other_access = tokens.make_token(other.pk)
+        self.client.force_authenticate(self.user)
+
+        res = self.client.post(REVOKE_URL, {'access': other_access})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,169 @@
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from core.jobs import enqueue
+from core.models import Job, RevokedToken
+
+# Signed tokens carry everything we need to authenticate a request
+# (user id, token id, expiry and token type) and are protected by an
+# HMAC signature made with the SECRET_KEY, so checking one is just a
+# signature check and doesn't need to touch the database.
+SALT = 'user.tokens'
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class InvalidToken(Exception):
+    """Raised when a signed token can't be used"""
+
+
+def _lifetime(token_type):
+    """Return the lifetime in seconds for the given token type"""
+    if token_type == ACCESS:
+        return settings.SIGNED_TOKEN_ACCESS_LIFETIME
+    return settings.SIGNED_TOKEN_REFRESH_LIFETIME
+
+
+def make_token(user_id, token_type=ACCESS):
+    """Create a new signed token for the user"""
+    jti = secrets.randbits(63)
+    # random token id that fits in a BigIntegerField so the
+    # token can be revoked later on
+    exp = int(time.time()) + _lifetime(token_type)
+    return signing.dumps([user_id, jti, exp, token_type], salt=SALT)
+
+
+def read_token(token, token_type=ACCESS):
+    """Verify a signed token and return its (user_id, jti, exp) claims"""
+    try:
+        user_id, jti, exp, typ = signing.loads(token, salt=SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        raise InvalidToken('Invalid token.')
+
+    if typ != token_type:
+        raise InvalidToken('Invalid token type.')
+    if exp < time.time():
+        raise InvalidToken('Token has expired.')
+
+    return user_id, jti, exp
+
+
+def make_token_pair(user_id):
+    """Return a fresh access and refresh token for the user"""
+    return {
+        'access': make_token(user_id, ACCESS),
+        'refresh': make_token(user_id, REFRESH),
+    }
+
+
+def schedule_purge(expires_at):
+    """Make sure the revoked tokens are purged once expires_at has passed
+
+    There's only ever one purge queued for the earliest expiry, the job
+    queues the next one for the expiry after that when it runs.
+    """
+    queued = Job.objects.filter(
+        kind='user.purge_revoked_tokens', status=Job.PENDING,
+        run_at__lte=expires_at
+    ).exists()
+    if not queued:
+        enqueue('user.purge_revoked_tokens', run_at=expires_at)
+
+
+def revoke(jti, exp):
+    """Add a token id to the deny list until the token expires"""
+    expires_at = datetime.fromtimestamp(exp, tz=timezone.utc)
+    token, created = RevokedToken.objects.get_or_create(
+        jti=jti, defaults={'expires_at': expires_at}
+    )
+    if created:
+        schedule_purge(expires_at)
+        # the row is only needed until the token expires
+    deny_list.add(jti)
+
+
+def revoke_user(user_id):
+    """Revoke every access token the user has right now"""
+    expires_at = timezone.now() + timedelta(
+        seconds=settings.SIGNED_TOKEN_ACCESS_LIFETIME
+    )
+    # the last of them expires by then, tokens made from here on expire
+    # later and aren't affected
+    RevokedToken.objects.create(user_id=user_id, expires_at=expires_at)
+    schedule_purge(expires_at)
+    deny_list.add_user(user_id, expires_at.timestamp())
+
+
+class DenyList:
+    """In-memory set of revoked token ids, synced from the database
+
+    Also keeps the users whose tokens were revoked all at once, with the
+    time until which their tokens expire.
+    """
+
+    def __init__(self):
+        self._jtis = frozenset()
+        self._users = {}
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        if self._synced_at is None:
+            return True
+        interval = settings.SIGNED_TOKEN_DENY_LIST_SYNC_INTERVAL
+        return time.monotonic() - self._synced_at >= interval
+
+    def sync(self):
+        """Reload the ids of the revoked tokens that haven't expired yet"""
+        rows = RevokedToken.objects.filter(
+            expires_at__gt=timezone.now()
+        ).values_list('jti', 'user_id', 'expires_at')
+        # expired tokens are rejected anyway so we only need to keep
+        # the ones that are still valid which keeps the set small
+        jtis, users = set(), {}
+        for jti, user_id, expires_at in rows:
+            if jti is not None:
+                jtis.add(jti)
+            else:
+                users[user_id] = max(
+                    expires_at.timestamp(), users.get(user_id, 0)
+                )
+        with self._lock:
+            self._jtis = frozenset(jtis)
+            self._users = users
+            self._synced_at = time.monotonic()
+
+    def add(self, jti):
+        """Add a token id without waiting for the next sync"""
+        with self._lock:
+            self._jtis = self._jtis | {jti}
+
+    def add_user(self, user_id, until):
+        """Add a user's tokens that expire by until without waiting for
+        the next sync"""
+        with self._lock:
+            self._users = {**self._users, user_id: until}
+
+    def clear(self):
+        """Forget everything and sync again on the next lookup"""
+        with self._lock:
+            self._jtis = frozenset()
+            self._users = {}
+            self._synced_at = None
+
+    def is_revoked(self, user_id, jti, exp):
+        """Return whether the token with these claims was revoked"""
+        if self._is_stale():
+            self.sync()
+        return jti in self._jtis or exp <= self._users.get(user_id, 0)
+
+
+deny_list = DenyList()
+# one deny list per process, every worker syncs it on its own
@@ -1,7 +1,16 @@
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework import generics, authentication, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
-from .serializers import UserSerializer, AuthTokenSerializer
+
+from core.jobs import enqueue
+from .authentication import SignedTokenAuthentication
+from .serializers import UserSerializer, AuthTokenSerializer, \
+    RefreshTokenSerializer, RevokeTokenSerializer
+from . import tokens
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -25,13 +34,55 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """Log in with email and password, or refresh an access token"""
+        if 'refresh' in request.data:
+            serializer = RefreshTokenSerializer(
+                data=request.data,
+                context={'request': request}
+            )
+            serializer.is_valid(raise_exception=True)
+            return Response({'access': serializer.validated_data['access']})
+
+        serializer = self.serializer_class(
+            data=request.data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
+        # we keep handing out the opaque token so existing clients
+        # keep working while they move over to the signed tokens
+        return Response({
+            'token': token.key,
+            **tokens.make_token_pair(user.pk),
+        })
+
+
+class RevokeTokenView(generics.GenericAPIView):
+    """Revoke signed tokens before they expire"""
+    serializer_class = RevokeTokenSerializer
+    authentication_classes = (SignedTokenAuthentication,
+                              authentication.TokenAuthentication)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        """Add the given tokens to the deny list"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        for user_id, jti, exp in serializer.validated_data['claims']:
+            tokens.revoke(jti, exp)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # create user or our manage user views.
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (SignedTokenAuthentication,
+                              authentication.TokenAuthentication)
     permission_classes = (permissions.IsAuthenticated,)
     # permissions are the level of access that the user has
     # user must be authenticated to use the API (they have to be logged in)
@@ -43,8 +94,26 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 # model for the logged in user.
     def get_object(self):
         """"Retrieve and return authentication user"""
+        if isinstance(self.request.successful_authenticator,
+                      SignedTokenAuthentication):
+            # signed tokens only give us the id of the user so we
+            # need the full object from the database here
+            return get_user_model().objects.get(pk=self.request.user.pk)
         return self.request.user
     # So when the get object is called the request will have the user
     # attached to it because of the authentication classes so because we
     # have the authentication class that takes care of take getting the
     # authenticated user and assigning it to request.
+
+    def perform_destroy(self, instance):
+        """Deactivate the user now and delete their data in the background"""
+        with transaction.atomic():
+            get_user_model().objects.filter(pk=instance.pk).update(
+                is_active=False
+            )
+            # logging in and refreshing signed tokens stop working
+            Token.objects.filter(user_id=instance.pk).delete()
+            tokens.revoke_user(instance.pk)
+            # access tokens are only checked by their signature and the
+            # deny list, so all of the user's go on it
+            enqueue('user.delete_account', user_id=instance.pk)